@@ -0,0 +1,103 @@
+"""
+Chat broadcast tail latency
+===========================
+Fans messages out to one room of fake sockets and reports how long each
+socket waits for delivery (p50/p99/max over fast clients) for:
+
+  serial  - awaiting every ws.send_text in turn (the old broadcast loop)
+  queued  - ConnectionManager with per-socket queues and writer tasks
+
+    python benchmarks/bench_broadcast.py --sockets 1000 --slow 10 --slow-ms 100
+
+``--slow`` sockets take ``--slow-ms`` per send, mimicking stalled mobile
+clients; the others take ``--send-us``.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lms_admin.settings")
+
+
+class _FakeSocket:
+    def __init__(self, delay: float, latencies: list) -> None:
+        self.delay = delay
+        self.latencies = latencies
+
+    async def send_text(self, data: str) -> None:
+        await asyncio.sleep(self.delay)
+        self.latencies.append(time.perf_counter() - json.loads(data)["sent"])
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+def _sockets(args, fast: list, slow: list):
+    return [
+        _FakeSocket(args.slow_ms / 1000, slow) if i < args.slow else _FakeSocket(args.send_us / 1e6, fast)
+        for i in range(args.sockets)
+    ]
+
+
+async def _serial(args, fast: list, slow: list) -> None:
+    sockets = _sockets(args, fast, slow)
+    for _ in range(args.messages):
+        data = json.dumps({"event": "message", "content": "x" * 64, "sent": time.perf_counter()})
+        for ws in sockets:
+            await ws.send_text(data)
+        await asyncio.sleep(args.interval_ms / 1000)
+
+
+async def _queued(args, fast: list, slow: list) -> None:
+    from user_panel.chat.manager import ConnectionManager
+
+    manager = ConnectionManager()
+    for i, ws in enumerate(_sockets(args, fast, slow)):
+        manager.register(ws, 1, i)
+    for _ in range(args.messages):
+        data = json.dumps({"event": "message", "content": "x" * 64, "sent": time.perf_counter()})
+        await manager.deliver_local(1, data)
+        await asyncio.sleep(args.interval_ms / 1000)
+    expected = args.messages * (args.sockets - args.slow)
+    while len(fast) < expected:
+        await asyncio.sleep(0.01)
+
+
+def _report(name: str, fast: list) -> None:
+    fast = sorted(fast)
+    p99 = fast[int(len(fast) * 0.99) - 1]
+    print(
+        f"{name:8s}: p50 {statistics.median(fast) * 1000:8.2f} ms  "
+        f"p99 {p99 * 1000:8.2f} ms  max {fast[-1] * 1000:8.2f} ms  ({len(fast)} deliveries)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=1000)
+    parser.add_argument("--slow", type=int, default=10)
+    parser.add_argument("--slow-ms", type=float, default=100.0)
+    parser.add_argument("--send-us", type=float, default=0.0)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--interval-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    import django
+
+    django.setup()
+
+    for name, run in (("serial", _serial), ("queued", _queued)):
+        fast, slow = [], []
+        asyncio.run(run(args, fast, slow))
+        _report(name, fast)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Chat message write throughput
+=============================
+Measures chat messages/sec a single worker can accept from concurrent
+senders, comparing:
+
+  create  - sender lookup + Message.objects.create per message (the old
+            chat_ws path)
+  sync    - MessageWriter in sync mode (one INSERT per message)
+  group   - MessageWriter in group-commit mode (batched bulk_create)
+
+    python benchmarks/bench_chat_writes.py --messages 2000 --senders 50
+
+Uses the configured database (DATABASE_URL); a throwaway room and user are
+created and removed afterwards.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lms_admin.settings")
+
+
+async def _old_path(room_id: int, user_id: int, content: str) -> None:
+    from asgiref.sync import sync_to_async
+    from lms.models import LMSUser, Message
+
+    sender = await sync_to_async(LMSUser.objects.get)(pk=user_id)
+    await sync_to_async(Message.objects.create)(
+        room_id=room_id, sender=sender, sender_username=sender.name, content=content, message_type="text"
+    )
+
+
+async def _run(args, send) -> float:
+    sem = asyncio.Semaphore(args.senders)
+
+    async def one(i: int) -> None:
+        async with sem:
+            await send(f"bench message {i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.messages)))
+    return time.perf_counter() - start
+
+
+async def _bench(args, room_id: int, user_id: int) -> None:
+    from user_panel.chat.writer import MessageWriter
+
+    results = {}
+    results["create (per-message ORM)"] = await _run(args, lambda c: _old_path(room_id, user_id, c))
+    for mode in ("sync", "group"):
+        writer = MessageWriter(mode)
+        await writer.start()
+        elapsed = await _run(
+            args, lambda c: writer.write(room_id=room_id, sender_id=user_id, sender_username="bench", content=c)
+        )
+        flush_start = time.perf_counter()
+        await writer.stop()
+        results[f"{mode} (MessageWriter)"] = elapsed
+        if mode == "group":
+            results["group incl. final flush"] = elapsed + time.perf_counter() - flush_start
+
+    for name, elapsed in results.items():
+        print(f"{name:28s}: {args.messages / elapsed:9.1f} msgs/sec")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--senders", type=int, default=50)
+    args = parser.parse_args()
+
+    import django
+
+    django.setup()
+    from lms.models import ChatRoom, LMSUser
+
+    user = LMSUser.objects.create(email=f"bench-chat-{os.getpid()}@example.com", name="bench", password_hash="!")
+    room = ChatRoom.objects.create(name="bench", created_by=user)
+    try:
+        asyncio.run(_bench(args, room.id, user.id))
+    finally:
+        room.delete()
+        user.delete()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Email delivery throughput
+=========================
+Starts a minimal local SMTP stand-in and compares mails/sec for:
+
+  smtp    - Django's SMTP backend with a new connection per message (the old
+            send_mail() behaviour)
+  queued  - lms.mail.QueuedEmailBackend (persistent connection, batches)
+
+    python benchmarks/bench_email.py --mails 500 --latency-ms 2
+
+``--latency-ms`` adds a per-command delay to mimic a remote SMTP server.
+"""
+
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lms_admin.settings")
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    latency = 0.0
+    received = 0
+    lock = threading.Lock()
+
+    def reply(self, line: str) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self) -> None:
+        self.reply("220 localhost bench SMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode(errors="replace").strip().upper()
+            if cmd.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif cmd.startswith("DATA"):
+                self.reply("354 end with .")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with _SMTPHandler.lock:
+                    _SMTPHandler.received += 1
+                self.reply("250 queued")
+            elif cmd.startswith("QUIT"):
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+def _messages(n: int):
+    from django.core.mail import EmailMessage
+
+    return [EmailMessage(f"Bench {i}", "body", "bench@example.com", [f"user{i}@example.com"]) for i in range(n)]
+
+
+def _wait_for(n: int, timeout: float = 120) -> None:
+    deadline = time.time() + timeout
+    while _SMTPHandler.received < n and time.time() < deadline:
+        time.sleep(0.005)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mails", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    _SMTPHandler.latency = args.latency_ms / 1000
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SMTPHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    os.environ.update({
+        "EMAIL_HOST": "127.0.0.1",
+        "EMAIL_PORT": str(port),
+        "EMAIL_USE_TLS": "false",
+        "EMAIL_HOST_USER": "",
+        "EMAIL_DELIVERY_BACKEND": "django.core.mail.backends.smtp.EmailBackend",
+    })
+    import django
+
+    django.setup()
+    from django.core.mail import get_connection
+
+    results = {}
+
+    _SMTPHandler.received = 0
+    start = time.perf_counter()
+    for message in _messages(args.mails):
+        get_connection("django.core.mail.backends.smtp.EmailBackend").send_messages([message])
+    results["smtp (connection per mail)"] = args.mails / (time.perf_counter() - start)
+
+    from lms.mail import get_dispatcher
+
+    _SMTPHandler.received = 0
+    start = time.perf_counter()
+    connection = get_connection("lms.mail.QueuedEmailBackend", fail_silently=True)
+    for message in _messages(args.mails):
+        connection.send_messages([message])
+    get_dispatcher().flush()
+    _wait_for(args.mails)
+    results["queued (persistent, batched)"] = args.mails / (time.perf_counter() - start)
+
+    for name, rate in results.items():
+        print(f"{name:30s}: {rate:9.1f} mails/sec")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
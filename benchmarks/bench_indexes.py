@@ -0,0 +1,221 @@
+"""
+Hot query indexes
+=================
+Seeds a synthetic dataset and times the hot query shapes covered by
+migration 0017_hot_query_indexes, first with those indexes dropped and then
+with them in place, printing each query plan (EXPLAIN) for both runs:
+
+  notification list     WHERE user = ? ORDER BY created_at, id
+  unread count          WHERE user = ? AND NOT is_read
+  entitlement           WHERE user = ? AND status = 'active' AND end_date >= now()
+  messages per day      WHERE timestamp >= ? GROUP BY day
+  files today           WHERE timestamp >= ? AND message_type = 'file'
+  activity / revenue    dashboard series over the last 30 days
+  otp verify            WHERE email = ? AND code = ? AND NOT is_used ORDER BY created_at DESC
+
+    DATABASE_URL=postgres://.../lms_scratch python benchmarks/bench_indexes.py --users 2000 --rows 500000
+
+Run it against a scratch database (migrated, e.g. a fresh SQLite file or a
+throwaway Postgres): the indexes are dropped and re-created while it runs.
+Seeded rows are removed afterwards.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lms_admin.settings")
+
+# (model, index name) from migration 0017_hot_query_indexes
+INDEXES = [
+    ("Notification", "notification_user_ts_idx"),
+    ("Notification", "notification_unread_idx"),
+    ("Subscription", "subscription_active_idx"),
+    ("Message", "message_ts_type_idx"),
+    ("ActivityLog", "activitylog_created_idx"),
+    ("Payment", "payment_date_idx"),
+    ("OTPLog", "otplog_unused_idx"),
+]
+EMAIL_DOMAIN = "bench-indexes.invalid"
+BATCH = 5000
+
+
+def _bulk(model, rows) -> None:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+def _seed(args):
+    from django.utils import timezone
+
+    from lms.models import ActivityLog, ChatRoom, LMSUser, Message, Notification, OTPLog, Payment, Plan, Subscription
+
+    rng = random.Random(42)
+    now = timezone.now()
+    ago = lambda: now - timedelta(seconds=rng.randrange(365 * 86400))  # noqa: E731
+
+    _bulk(LMSUser, (
+        LMSUser(email=f"u{i}@{EMAIL_DOMAIN}", name=f"bench {i}", password_hash="!") for i in range(args.users)
+    ))
+    user_ids = list(LMSUser.objects.filter(email__endswith=EMAIL_DOMAIN).values_list("id", flat=True))
+    plan = Plan.objects.create(name=f"bench {os.getpid()}", price=10, duration_days=30)
+    rooms = [ChatRoom.objects.create(name=f"bench {i}", created_by_id=user_ids[i]) for i in range(min(50, args.users))]
+
+    print(f"Seeding {args.rows} notifications/messages/activity rows for {args.users} users...")
+    _bulk(Notification, (
+        Notification(user_id=rng.choice(user_ids), message="bench", is_read=rng.random() < 0.9, created_at=ago())
+        for _ in range(args.rows)
+    ))
+    _bulk(Message, (
+        Message(
+            room=rng.choice(rooms), sender_id=rng.choice(user_ids), sender_username="bench", content="bench",
+            message_type="file" if rng.random() < 0.05 else "text", timestamp=ago(),
+        )
+        for _ in range(args.rows)
+    ))
+    _bulk(ActivityLog, (
+        ActivityLog(user_id=rng.choice(user_ids), action_type="bench", created_at=ago()) for _ in range(args.rows)
+    ))
+    _bulk(Payment, (
+        Payment(user_id=rng.choice(user_ids), plan=plan, amount=10, payment_date=ago()) for _ in range(args.rows // 10)
+    ))
+    _bulk(Subscription, (
+        Subscription(
+            user_id=uid, plan=plan, start_date=start, end_date=start + timedelta(days=30),
+            status="active" if rng.random() < 0.2 else "expired",
+        )
+        for uid in user_ids for start in [ago() for _ in range(5)]
+    ))
+    _bulk(OTPLog, (
+        OTPLog(
+            email=f"u{rng.randrange(args.users)}@{EMAIL_DOMAIN}", otp_code=f"{rng.randrange(10**6):06d}",
+            is_used=rng.random() < 0.95, expires_at=now,
+        )
+        for _ in range(args.rows // 10)
+    ))
+    return user_ids, plan, rooms
+
+
+def _cleanup(plan, rooms) -> None:
+    from lms.models import ActivityLog, LMSUser, Message, Notification, OTPLog, Payment, Subscription
+
+    users = LMSUser.objects.filter(email__endswith=EMAIL_DOMAIN)
+    for model in (Notification, ActivityLog, Payment, Subscription):
+        model.objects.filter(user__in=users).delete()
+    Message.objects.filter(room__in=rooms).delete()
+    OTPLog.objects.filter(email__endswith=EMAIL_DOMAIN).delete()
+    for room in rooms:
+        room.delete()
+    plan.delete()
+    users.delete()
+
+
+def _queries(user_ids):
+    from django.db.models import Count, Max, Sum
+    from django.db.models.functions import TruncDate, TruncMonth
+    from django.utils import timezone
+
+    from lms.models import ActivityLog, Message, Notification, OTPLog, Payment, Subscription
+
+    rng = random.Random(7)
+    users = [rng.choice(user_ids) for _ in range(64)]
+    since = timezone.now() - timedelta(days=30)
+    today = timezone.now() - timedelta(days=1)
+    pick = lambda: users[rng.randrange(len(users))]  # noqa: E731
+    return {
+        "notification list": lambda: Notification.objects.filter(user_id=pick()).order_by("created_at", "id")[:20],
+        "unread count": lambda: Notification.objects.filter(user_id=pick(), is_read=False),
+        "entitlement": lambda: Subscription.objects.filter(
+            user_id=pick(), status="active", end_date__gte=timezone.now()
+        ).values("user_id").annotate(m=Max("end_date")),
+        "messages per day": lambda: Message.objects.filter(timestamp__gte=since)
+        .annotate(day=TruncDate("timestamp")).values("day").annotate(n=Count("id")).order_by("day"),
+        "files today": lambda: Message.objects.filter(timestamp__gte=today, message_type="file"),
+        "activity per day": lambda: ActivityLog.objects.filter(created_at__gte=since)
+        .annotate(day=TruncDate("created_at")).values("day").annotate(n=Count("id")).order_by("day"),
+        "revenue per month": lambda: Payment.objects.filter(payment_date__gte=since)
+        .annotate(m=TruncMonth("payment_date")).values("m").annotate(s=Sum("amount")).order_by("m"),
+        "otp verify": lambda: OTPLog.objects.filter(
+            email=f"u{rng.randrange(len(user_ids))}@{EMAIL_DOMAIN}", otp_code="123456", is_used=False
+        ).order_by("-created_at")[:1],
+    }
+
+
+def _run(queries, repeat: int):
+    results = {}
+    for name, make in queries.items():
+        plan = make().explain()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(make())
+            times.append((time.perf_counter() - start) * 1000)
+        results[name] = (statistics.median(times), plan)
+    return results
+
+
+def _set_indexes(present: bool) -> None:
+    from django.apps import apps
+    from django.db import connection
+
+    with connection.schema_editor(atomic=False) as editor:
+        for model_name, index_name in INDEXES:
+            model = apps.get_model("lms", model_name)
+            index = next(i for i in model._meta.indexes if i.name == index_name)
+            if present:
+                editor.add_index(model, index)
+            else:
+                editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows per large table")
+    parser.add_argument("--repeat", type=int, default=50, help="Timed runs per query")
+    parser.add_argument("--plans", action="store_true", help="Print full query plans")
+    args = parser.parse_args()
+
+    import django
+
+    django.setup()
+    from django.db import connection
+
+    user_ids, plan, rooms = _seed(args)
+    try:
+        queries = _queries(user_ids)
+        _set_indexes(False)
+        try:
+            before = _run(queries, args.repeat)
+        finally:
+            _set_indexes(True)
+        after = _run(queries, args.repeat)
+    finally:
+        _cleanup(plan, rooms)
+
+    print(f"\n{connection.vendor}, median of {args.repeat} runs")
+    print(f"{'query':20s} {'before ms':>10s} {'after ms':>10s} {'speedup':>8s}")
+    for name in queries:
+        (b, b_plan), (a, a_plan) = before[name], after[name]
+        print(f"{name:20s} {b:10.2f} {a:10.2f} {b / a if a else float('inf'):7.1f}x")
+        if args.plans:
+            print(f"  before:\n    {b_plan.replace(chr(10), chr(10) + '    ')}")
+            print(f"  after:\n    {a_plan.replace(chr(10), chr(10) + '    ')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Password hashing throughput
+===========================
+Measures how many password verifications ("logins") per second the dedicated
+hashing pool in ``user_panel.auth`` sustains, overall and per core.
+
+    python benchmarks/bench_login_hashing.py --logins 200 --concurrency 32
+
+Cost and pool size follow the same env vars as the API
+(BCRYPT_ROUNDS, HASH_POOL_SIZE, HASH_QUEUE_LIMIT).
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from user_panel import auth  # noqa: E402
+
+
+async def _run(logins: int, concurrency: int, hashed: str) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            ok, _ = await auth.verify_and_update_async("correct horse", hashed)
+            assert ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    hashed = auth.hash_password("correct horse")
+    cores = min(auth.HASH_POOL_SIZE, os.cpu_count() or 1)
+
+    start = time.perf_counter()
+    for _ in range(max(1, args.logins // 10)):
+        auth.verify_password("correct horse", hashed)
+    serial = max(1, args.logins // 10) / (time.perf_counter() - start)
+
+    elapsed = asyncio.run(_run(args.logins, args.concurrency, hashed))
+    pooled = args.logins / elapsed
+
+    print(f"bcrypt rounds      : {auth.BCRYPT_ROUNDS}")
+    print(f"hash pool size     : {auth.HASH_POOL_SIZE} ({cores} usable cores)")
+    print(f"serial             : {serial:8.1f} logins/sec")
+    print(f"pooled             : {pooled:8.1f} logins/sec")
+    print(f"pooled per core    : {pooled / cores:8.1f} logins/sec/core")
+
+
+if __name__ == "__main__":
+    main()
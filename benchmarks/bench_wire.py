@@ -0,0 +1,105 @@
+"""
+WebSocket wire format size and encode cost
+==========================================
+Compares bytes per frame for a typical chat message and a notification
+batch in each wire format:
+
+  json            - text frames as sent today
+  json+deflate    - what permessage-deflate puts on the wire
+  msgpack         - lms.msgpack.v1 without compression
+  msgpack+deflate - lms.msgpack.v1 with WIRE_COMPRESSION=deflate
+
+and the CPU spent encoding one broadcast to ``--sockets`` clients when
+deflate runs per socket (permessage-deflate) vs once (user_panel.wire).
+
+    python benchmarks/bench_wire.py --sockets 1000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+MESSAGE = {
+    "event": "message",
+    "id": 123456789012,
+    "room_id": 42,
+    "sender_id": 1017,
+    "sender_username": "Jane Student",
+    "content": "Has anyone started on the second assignment yet? I'm stuck on question 3.",
+    "message_type": "text",
+    "timestamp": "2024-05-01T10:15:30.123456+00:00",
+}
+
+NOTIFICATIONS = {
+    "channel": "notifications",
+    "data": [
+        {
+            "id": 9000 + i,
+            "message": f"New assignment posted in Introduction to Databases, week {i}",
+            "link": f"/courses/12/assignments/{300 + i}",
+            "is_read": False,
+            "created_at": "2024-05-01T10:15:30.123456+00:00",
+        }
+        for i in range(20)
+    ],
+}
+
+
+def _deflate(data: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _sizes(name: str, payload: dict, wire) -> None:
+    text = json.dumps(payload).encode()
+    packed = wire.msgpack.packb(wire._compact(payload), use_bin_type=True)
+    print(
+        f"{name:14s}: json {len(text):6d} B  json+deflate {len(_deflate(text)):6d} B  "
+        f"msgpack {len(packed) + 1:6d} B  msgpack+deflate {len(_deflate(packed)) + 1:6d} B"
+    )
+
+
+def _fanout(args, wire) -> None:
+    payload = NOTIFICATIONS
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        data = json.dumps(payload).encode()
+        for _ in range(args.sockets):
+            _deflate(data)
+    per_socket = (time.perf_counter() - start) / args.rounds
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        wire.encode(payload)
+    once = (time.perf_counter() - start) / args.rounds
+
+    print(f"fan-out to {args.sockets} sockets, per broadcast:")
+    print(f"  permessage-deflate (per socket): {per_socket * 1000:9.3f} ms")
+    print(f"  wire.encode (once)             : {once * 1000:9.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault("WIRE_COMPRESSION", "deflate")
+    from user_panel import wire
+
+    if wire.msgpack is None:
+        sys.exit("msgpack is not installed")
+
+    _sizes("chat message", MESSAGE, wire)
+    _sizes("notifications", NOTIFICATIONS, wire)
+    _fanout(args, wire)
+
+
+if __name__ == "__main__":
+    main()
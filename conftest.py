@@ -0,0 +1,39 @@
+"""
+Test setup
+==========
+Tests live next to the modules they cover (``user_panel/test_wire.py``, ...)
+as Django ``TestCase`` classes and run with plain pytest:
+
+    python -m pytest -q
+
+This file configures Django once and creates a throwaway test database (an
+in-memory SQLite one unless DATABASE_URL says otherwise) for the session.
+Uploaded files go to a temporary MEDIA_ROOT. Redis is not needed: every
+caller already falls back when it is unreachable.
+"""
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+_media_root = tempfile.mkdtemp(prefix="lms-test-media-")
+os.environ["MEDIA_ROOT"] = _media_root
+
+from user_panel.django_setup import setup  # noqa: E402
+
+setup()
+
+from django.test.runner import DiscoverRunner  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def django_test_database():
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    runner.setup_test_environment()
+    old_config = runner.setup_databases()
+    yield
+    runner.teardown_databases(old_config)
+    runner.teardown_test_environment()
+    shutil.rmtree(_media_root, ignore_errors=True)
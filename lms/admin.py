@@ -1,10 +1,11 @@
 from django.contrib import admin
 from django.db.models import Count
+from .signals import invalidate
 from .models import (
     LMSUser, Course, Lesson, Enrollment, Progress, Plan, Subscription, 
     Payment, Notification, ActivityLog, AnalyticsRecord, ChatRoom, Message, 
-    FileAttachment, UserStatus, Attendance, Assignment, Submission,
-    SocialAccount, OTPLog
+    Blob, FileAttachment, UserStatus, Attendance, Assignment, Submission,
+    SocialAccount, OTPLog, OutboxEvent
 )
 
 admin.site.site_header = "LMS Administration"
@@ -18,6 +19,15 @@ class LMSUserAdmin(admin.ModelAdmin):
     list_filter = ("role", "is_active", "created_at")
     search_fields = ("name", "email")
     ordering = ("-created_at",)
+    actions = ["deactivate_users"]
+
+    @admin.action(description="Deactivate selected users")
+    def deactivate_users(self, request, queryset):
+        # queryset.update() skips post_save, so drop cached copies explicitly
+        ids = list(queryset.values_list("id", flat=True))
+        queryset.update(is_active=False)
+        for pk in ids:
+            invalidate("user", pk)
 
 
 class LessonInline(admin.TabularInline):
@@ -106,7 +116,14 @@ class MessageAdmin(admin.ModelAdmin):
 
 @admin.register(FileAttachment)
 class FileAttachmentAdmin(admin.ModelAdmin):
-    list_display = ("file_name", "file_type", "file_size", "uploaded_at")
+    list_display = ("file_name", "file_type", "file_size", "uploaded_by", "uploaded_at")
+    raw_id_fields = ("message", "blob", "uploaded_by")
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ("sha256", "size", "created_at")
+    search_fields = ("sha256",)
 
 
 @admin.register(UserStatus)
@@ -151,3 +168,11 @@ class OTPLogAdmin(admin.ModelAdmin):
     search_fields = ("email",)
     ordering = ("-created_at",)
     readonly_fields = ("otp_code", "created_at")
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "created_at", "processed_at", "failed_at", "attempts")
+    list_filter = ("kind", "processed_at", "failed_at")
+    readonly_fields = ("created_at",)
+    ordering = ("-id",)
@@ -6,3 +6,5 @@ class LmsConfig(AppConfig):
     name = "lms"
     verbose_name = "Learning Management"
 
+    def ready(self):
+        from . import signals  # noqa: F401
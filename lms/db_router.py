@@ -0,0 +1,164 @@
+"""
+Read replica routing
+====================
+With ``DATABASE_REPLICA_URL`` set, settings add a ``replica`` database and
+install ``ReplicaRouter``. Reads still go to the primary by default. Code
+opts in with ``replica_reads``, for the heavy analytics aggregates and list
+endpoints that tolerate a little replication lag:
+
+    @replica_reads()
+    def chat_top_users(request): ...
+
+    with replica_reads():
+        return paginate(...)
+
+Inside such a block, reads fall back to the primary when:
+
+  - the block runs in a transaction on the primary;
+  - the current request has already written; or
+  - the request's user wrote something in the last ``REPLICA_PIN_SECONDS``
+    (read-your-writes). Pins live in Redis under ``db:pin:{user_id}`` so
+    they hold across workers. Without Redis, a pin only holds in the worker
+    that took the write.
+
+Requests are tracked by ``RequestScopeMiddleware`` (ASGI). ``set_user``
+tells it whose request it is; the FastAPI ``get_current_user`` dependency
+calls it. Every write routed while a user is known pins that user. Writes
+made outside an HTTP request (e.g. chat messages sent over a WebSocket and
+saved later by the chat writer) pin with an explicit ``pin`` call.
+
+To try it locally with two SQLite files, migrate the primary and copy it as
+a stale "replica":
+
+    DATABASE_URL=sqlite:////tmp/primary.db python manage.py migrate
+    cp /tmp/primary.db /tmp/replica.db
+    DATABASE_URL=sqlite:////tmp/primary.db DATABASE_REPLICA_URL=sqlite:////tmp/replica.db uvicorn ...
+"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .redis_client import get_redis
+
+REPLICA = "replica"
+REPLICA_PIN_SECONDS = float(os.getenv("REPLICA_PIN_SECONDS", "5"))
+PIN_KEY = "db:pin:{}"
+
+# Per request (or replica_reads block): {"user_id", "wrote", "replica", "pinned"}.
+# A mutable dict, so updates made in threadpool threads reach the request.
+_scope: ContextVar[Optional[dict]] = ContextVar("db_scope", default=None)
+_local_pins: Dict[int, float] = {}
+_next_prune = 0.0
+
+
+def _new_scope() -> dict:
+    return {"user_id": None, "wrote": False, "replica": False, "pinned": None}
+
+
+def replica_enabled() -> bool:
+    return REPLICA in settings.DATABASES
+
+
+def set_user(user_id: int) -> None:
+    scope = _scope.get()
+    if scope is not None:
+        scope["user_id"] = user_id
+
+
+def pin(user_id: int) -> None:
+    """Send ``user_id``'s replica reads to the primary for the next REPLICA_PIN_SECONDS."""
+    global _next_prune
+    now = time.monotonic()
+    if now >= _next_prune:
+        # Expired pins are otherwise only dropped when the same user reads again
+        _next_prune = now + REPLICA_PIN_SECONDS
+        for uid, until in list(_local_pins.items()):
+            if until <= now:
+                _local_pins.pop(uid, None)
+    _local_pins[user_id] = now + REPLICA_PIN_SECONDS
+    try:
+        get_redis().set(PIN_KEY.format(user_id), 1, px=int(REPLICA_PIN_SECONDS * 1000))
+    except Exception as e:
+        logging.warning(f"Could not pin user {user_id} to the primary: {e}")
+
+
+def is_pinned(user_id: Optional[int]) -> bool:
+    if user_id is None:
+        return False
+    until = _local_pins.get(user_id)
+    if until is not None:
+        if until > time.monotonic():
+            return True
+        _local_pins.pop(user_id, None)
+    try:
+        return bool(get_redis().exists(PIN_KEY.format(user_id)))
+    except Exception:
+        return False
+
+
+@contextmanager
+def replica_reads():
+    """Route reads in the block (or decorated function) to the replica when that is safe."""
+    scope, token = _scope.get(), None
+    if scope is None:
+        scope = _new_scope()
+        token = _scope.set(scope)
+    previous, scope["replica"] = scope["replica"], True
+    try:
+        yield
+    finally:
+        scope["replica"] = previous
+        if token is not None:
+            _scope.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        scope = _scope.get()
+        if scope is None or not scope["replica"] or scope["wrote"]:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if scope["pinned"] is None:
+            # Checked once per request
+            scope["pinned"] = is_pinned(scope["user_id"])
+        return None if scope["pinned"] else REPLICA
+
+    def db_for_write(self, model, **hints):
+        scope = _scope.get()
+        if scope is not None and not scope["wrote"]:
+            scope["wrote"] = True
+            if scope["user_id"] is not None:
+                pin(scope["user_id"])
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data on both databases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+class RequestScopeMiddleware:
+    """Gives every HTTP request its own routing scope (see module docstring)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replica_enabled():
+            await self.app(scope, receive, send)
+            return
+        token = _scope.set(_new_scope())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _scope.reset(token)
@@ -0,0 +1,114 @@
+"""
+Message ids
+===========
+Chat messages carry ``seq`` next to their primary key: a 53-bit (JS-safe),
+time-ordered id assigned in process, so the chat writer can broadcast a
+message before it is saved. It is the id clients see (frames, history
+paging, read cursors); the primary key stays with the table's own sequence.
+
+    seconds since 2024-01-01 << 21 | worker id << 13 | per-second sequence
+
+Worker ids are leased from Redis (``ids:worker:{n}``, SET NX with a TTL), so
+two live processes never generate from the same one. The chat writer renews
+its lease in the background; other processes (the Django admin, management
+commands) lease and renew inline on ``next_id``. Without Redis a random
+worker id is used; the unique constraint on ``seq`` then turns a collision
+into a failed insert instead of two messages sharing an id.
+"""
+
+import logging
+import random
+import threading
+import time
+import uuid
+from typing import Optional
+
+from .redis_client import get_redis
+
+_ID_EPOCH = 1704067200  # 2024-01-01T00:00:00Z
+_WORKER_BITS = 8
+_SEQ_BITS = 13
+
+LEASE_KEY = "ids:worker:{}"
+LEASE_SECONDS = 60
+
+# Only the holder may renew or release a lease
+RENEW_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class IdGenerator:
+    def __init__(self) -> None:
+        self.worker_id: Optional[int] = None
+        self._token = uuid.uuid4().hex
+        self._renew_at = 0.0
+        self._second = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def lease(self) -> int:
+        """Take a worker id, or renew the one held; needed every LEASE_SECONDS / 2."""
+        # No lock around Redis: a slow round trip mustn't hold up next_id
+        worker_id = self.worker_id
+        try:
+            client = get_redis()
+            held = worker_id is not None and client.eval(
+                RENEW_LUA, 1, LEASE_KEY.format(worker_id), self._token, LEASE_SECONDS * 1000
+            )
+            if not held:
+                first = random.getrandbits(_WORKER_BITS)
+                for i in range(1 << _WORKER_BITS):
+                    n = (first + i) % (1 << _WORKER_BITS)
+                    if client.set(LEASE_KEY.format(n), self._token, nx=True, px=LEASE_SECONDS * 1000):
+                        worker_id = n
+                        break
+                else:
+                    raise RuntimeError("every worker id is leased")
+        except Exception as e:
+            if worker_id is None:
+                worker_id = random.getrandbits(_WORKER_BITS)
+            logging.warning(f"Could not lease a message id worker, using {worker_id}: {e}")
+        self.worker_id, self._renew_at = worker_id, time.monotonic() + LEASE_SECONDS / 2
+        return worker_id
+
+    def release(self) -> None:
+        worker_id, self.worker_id, self._renew_at = self.worker_id, None, 0.0
+        if worker_id is None:
+            return
+        try:
+            get_redis().eval(RELEASE_LUA, 1, LEASE_KEY.format(worker_id), self._token)
+        except Exception as e:
+            logging.warning(f"Could not release message id worker {worker_id}: {e}")
+
+    def next_id(self) -> int:
+        worker_id = self.worker_id
+        if worker_id is None or time.monotonic() >= self._renew_at:
+            worker_id = self.lease()
+        with self._lock:
+            now = int(time.time()) - _ID_EPOCH
+            if now > self._second:
+                self._second, self._seq = now, 0
+            elif self._seq >= 1 << _SEQ_BITS:
+                # Sequence exhausted for this second: borrow the next one
+                self._second, self._seq = self._second + 1, 0
+            seq = self._seq
+            self._seq += 1
+            return (self._second << (_WORKER_BITS + _SEQ_BITS)) | (worker_id << _SEQ_BITS) | seq
+
+
+generator = IdGenerator()
+
+
+def next_id() -> int:
+    """Default for ``Message.seq``."""
+    return generator.next_id()
@@ -0,0 +1,182 @@
+"""
+Queued email delivery
+=====================
+``QueuedEmailBackend`` is a Django email backend that hands messages to a
+per-process delivery thread instead of talking SMTP inline. It is opt-in
+(``settings.QUEUED_EMAIL_BACKEND``). The thread keeps one connection to the
+delivery backend open, sends in batches and closes the connection after
+``EMAIL_IDLE_TIMEOUT`` seconds without mail.
+
+With ``fail_silently=True`` sending is fire-and-forget: a message the thread
+can't deliver after a reconnect is dropped and logged. With
+``fail_silently=False`` ``send_messages`` waits (up to ``EMAIL_SEND_TIMEOUT``)
+until its messages were handed to the delivery backend, each on its own, and
+raises the backend's error, so the caller can react (OTP codes do this).
+Outbox events still go through ``EMAIL_DELIVERY_BACKEND`` directly.
+
+Messages are delivered by priority lane, so a bulk announcement doesn't
+hold up a login code:
+
+    send_mail(..., connection=get_connection(settings.QUEUED_EMAIL_BACKEND, lane="bulk", fail_silently=True))
+
+Settings (all optional):
+    EMAIL_DELIVERY_BACKEND  backend that actually sends (default: SMTP). Use
+                            django.core.mail.backends.console.EmailBackend or
+                            .filebased.EmailBackend as a local sink.
+    EMAIL_BATCH_SIZE        max messages per send_messages() call (default 50)
+    EMAIL_IDLE_TIMEOUT      seconds before an idle connection is closed (default 30)
+    EMAIL_QUEUE_SIZE        max queued messages before senders block (default 10000)
+    EMAIL_SEND_TIMEOUT      seconds a waiting sender waits for delivery (default 30)
+"""
+
+import atexit
+import itertools
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+LANES = {"high": 0, "normal": 5, "bulk": 9}
+
+
+class _Dispatcher:
+    def __init__(self) -> None:
+        self.queue: "queue.PriorityQueue" = queue.PriorityQueue(
+            maxsize=getattr(settings, "EMAIL_QUEUE_SIZE", 10000)
+        )
+        self.batch_size = getattr(settings, "EMAIL_BATCH_SIZE", 50)
+        self.idle_timeout = getattr(settings, "EMAIL_IDLE_TIMEOUT", 30)
+        self.backend = getattr(settings, "EMAIL_DELIVERY_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
+        self._seq = itertools.count()
+        self._connection = None
+        self._thread = threading.Thread(target=self._run, name="email-dispatch", daemon=True)
+        self._thread.start()
+
+    def put(self, priority: int, message, result: Optional[Future] = None) -> None:
+        self.queue.put((priority, next(self._seq), message, result))
+
+    def _take_batch(self) -> List:
+        try:
+            first = self.queue.get(timeout=self.idle_timeout)
+        except queue.Empty:
+            return []
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    def _send(self, messages: List) -> Optional[Exception]:
+        """Deliver ``messages``; the error if they were dropped."""
+        for attempt in (1, 2):
+            try:
+                if self._connection is None:
+                    self._connection = get_connection(self.backend, fail_silently=False)
+                    self._connection.open()
+                self._connection.send_messages(messages)
+                return None
+            except Exception as e:
+                # Stale SMTP sessions fail on first use; reconnect once before giving up
+                self._close()
+                if attempt == 2:
+                    logging.error(
+                        f"Dropped {len(messages)} emails to "
+                        f"{', '.join(r for m in messages for r in m.recipients())}: {e}"
+                    )
+                    return e
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                self._close()
+                continue
+            try:
+                # A waiting sender gets its own message's outcome, not the batch's
+                for _, _, message, result in batch:
+                    if result is not None and result.set_running_or_notify_cancel():
+                        error = self._send([message])
+                        if error is None:
+                            result.set_result(1)
+                        else:
+                            result.set_exception(error)
+                rest = [message for _, _, message, result in batch if result is None]
+                if rest:
+                    self._send(rest)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Block until everything queued so far has been handed to the delivery backend."""
+        done = threading.Event()
+
+        def wait():
+            self.queue.join()
+            done.set()
+
+        threading.Thread(target=wait, daemon=True).start()
+        done.wait(timeout)
+
+
+_dispatcher: Optional[_Dispatcher] = None
+_dispatcher_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def get_dispatcher() -> _Dispatcher:
+    global _dispatcher, _dispatcher_pid
+    with _lock:
+        # Threads don't survive fork, so each worker process starts its own
+        if _dispatcher is None or _dispatcher_pid != os.getpid():
+            _dispatcher = _Dispatcher()
+            _dispatcher_pid = os.getpid()
+    return _dispatcher
+
+
+@atexit.register
+def _flush_on_exit() -> None:
+    if _dispatcher is not None and _dispatcher_pid == os.getpid():
+        _dispatcher.flush(timeout=10)
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    def __init__(self, fail_silently: bool = False, lane: str = "normal", **kwargs) -> None:
+        super().__init__(fail_silently=fail_silently)
+        if lane not in LANES:
+            raise ValueError(f"Unknown email lane: {lane}")
+        self.priority = LANES[lane]
+        self.timeout = getattr(settings, "EMAIL_SEND_TIMEOUT", 30)
+
+    def send_messages(self, email_messages) -> int:
+        if not email_messages:
+            return 0
+        dispatcher = get_dispatcher()
+        results: List[Future] = []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            result = None if self.fail_silently else Future()
+            dispatcher.put(self.priority, message, result)
+            results.append(result)
+        if not self.fail_silently:
+            # Raises the delivery error, or TimeoutError if the queue is backed up
+            for result in results:
+                result.result(timeout=self.timeout)
+        return len(results)
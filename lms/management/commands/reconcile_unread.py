@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from lms.unread import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recompute the Redis unread counters (notifications, chat rooms) from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--interval", type=float, default=300.0, help="Seconds between passes")
+        parser.add_argument("--once", action="store_true", help="Run one pass and exit")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Unread reconciler started")
+        try:
+            while True:
+                try:
+                    checked = reconcile(options["batch_size"])
+                    self.stdout.write(f"Reconciled unread counters of {checked} users")
+                except Exception as e:
+                    self.stderr.write(f"Unread reconciliation failed: {e}")
+                if options["once"]:
+                    return
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Unread reconciler stopped")
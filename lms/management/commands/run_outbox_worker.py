@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from lms.outbox import process_batch
+
+
+class Command(BaseCommand):
+    help = "Drain the transactional outbox (notifications, activity log, emails) in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to sleep when the outbox is empty")
+        parser.add_argument("--once", action="store_true", help="Drain what is pending and exit")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        self.stdout.write(f"Outbox worker started (batch size {batch_size})")
+        try:
+            while True:
+                processed = process_batch(batch_size)
+                if processed:
+                    self.stdout.write(f"Processed {processed} outbox events")
+                    continue
+                if options["once"]:
+                    return
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Outbox worker stopped")
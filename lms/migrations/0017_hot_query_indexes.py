@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:56
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexOnline(AddIndexConcurrently):
+    """CREATE INDEX CONCURRENTLY on Postgres, so busy tables stay writable; a plain AddIndex elsewhere."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    # Concurrent index builds can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('lms', '0016_room_read_cursor'),
+    ]
+
+    operations = [
+        AddIndexOnline(
+            model_name='activitylog',
+            index=models.Index(fields=['created_at'], name='activitylog_created_idx'),
+        ),
+        AddIndexOnline(
+            model_name='message',
+            index=models.Index(fields=['timestamp', 'message_type'], name='message_ts_type_idx'),
+        ),
+        AddIndexOnline(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='notification_user_ts_idx'),
+        ),
+        AddIndexOnline(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user', 'created_at'], name='notification_unread_idx'),
+        ),
+        AddIndexOnline(
+            model_name='otplog',
+            index=models.Index(condition=models.Q(('is_used', False)), fields=['email', 'created_at'], name='otplog_unused_idx'),
+        ),
+        AddIndexOnline(
+            model_name='payment',
+            index=models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ),
+        AddIndexOnline(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['user', 'end_date'], name='subscription_active_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:30
+
+import lms.ids
+from django.db import migrations, models
+
+
+def copy_ids(apps, schema_editor):
+    # Existing messages keep the id clients (and read cursors) already know
+    Message = apps.get_model("lms", "Message")
+    Message.objects.update(seq=models.F("id"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0017_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.BigIntegerField(null=True, editable=False),
+        ),
+        migrations.RunPython(copy_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='message',
+            name='seq',
+            field=models.BigIntegerField(default=lms.ids.next_id, editable=False, unique=True),
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_room_ts_idx',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'timestamp', 'seq'], name='message_room_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'seq'], name='message_room_seq_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:40
+
+import lms.outbox
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_exhausted(apps, schema_editor):
+    # Events that already used up their attempts become visible as failed
+    OutboxEvent = apps.get_model("lms", "OutboxEvent")
+    OutboxEvent.objects.filter(
+        processed_at__isnull=True, attempts__gte=lms.outbox.OUTBOX_MAX_ATTEMPTS
+    ).update(failed_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0018_message_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='failed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fail_exhausted, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='outboxevent',
+            name='outbox_pending_idx',
+        ),
+        migrations.AddIndex(
+            model_name='outboxevent',
+            index=models.Index(condition=models.Q(('failed_at__isnull', True), ('processed_at__isnull', True)), fields=['id'], name='outbox_pending_idx'),
+        ),
+    ]
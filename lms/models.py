@@ -1,6 +1,9 @@
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 
+from . import ids
+
 
 class LMSUser(models.Model):
     class Roles(models.TextChoices):
@@ -93,6 +96,12 @@ class Subscription(models.Model):
     end_date = models.DateTimeField()
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.ACTIVE)
 
+    class Meta:
+        indexes = [
+            # Entitlement check: WHERE user = ? AND status = 'active' AND end_date >= now()
+            models.Index(fields=["user", "end_date"], condition=Q(status="active"), name="subscription_active_idx"),
+        ]
+
     def is_valid(self) -> bool:
         return self.status == self.Status.ACTIVE and self.end_date >= timezone.now()
 
@@ -109,6 +118,11 @@ class Payment(models.Model):
     status = models.CharField(max_length=20, default='completed')
     payment_date = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["payment_date"], name="payment_date_idx"),
+        ]
+
     def __str__(self) -> str:
         item = self.plan.name if self.plan else (self.course.title if self.course else "Item")
         return f"{self.user.name} - {item} - {self.amount}"
@@ -121,6 +135,14 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            # Notification list: WHERE user = ? ORDER BY created_at, id
+            models.Index(fields=["user", "created_at", "id"], name="notification_user_ts_idx"),
+            # Unread count and mark-all-read touch only unread rows
+            models.Index(fields=["user", "created_at"], condition=Q(is_read=False), name="notification_unread_idx"),
+        ]
+
     def __str__(self) -> str:
         return f"{self.user.name} - {('read' if self.is_read else 'unread')}"
 
@@ -131,6 +153,11 @@ class ActivityLog(models.Model):
     action_detail = models.TextField(blank=True)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"], name="activitylog_created_idx"),
+        ]
+
     def __str__(self) -> str:
         return f"{self.user.name} - {self.action_type}"
 
@@ -180,28 +207,70 @@ class Message(models.Model):
     file_url = models.URLField(blank=True)
     file_name = models.CharField(max_length=255, blank=True)
     file_type = models.CharField(max_length=120, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    thumbnail_url = models.URLField(blank=True)
+    # The message id clients see, time-ordered and assigned before the row is
+    # saved (see lms/ids.py); the primary key comes from the database
+    seq = models.BigIntegerField(default=ids.next_id, unique=True, editable=False)
+    # Set by the chat writer when the message is broadcast, before it is saved
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     is_deleted = models.BooleanField(default=False)
 
     class Meta:
         ordering = ["timestamp"]
+        indexes = [
+            # History paging and reconnect replay: WHERE room = ? ORDER BY timestamp, seq
+            models.Index(fields=["room", "timestamp", "seq"], name="message_room_ts_idx"),
+            # Unread counts and read cursors: WHERE room = ? AND seq > ?
+            models.Index(fields=["room", "seq"], name="message_room_seq_idx"),
+            # Chat analytics: messages (and files) per day over a time range
+            models.Index(fields=["timestamp", "message_type"], name="message_ts_type_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.sender_username}: {self.content[:30]}"
 
 
+class Blob(models.Model):
+    """Uploaded file content, stored once per SHA-256 (see user_panel.storage)."""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return self.sha256
+
+
 class FileAttachment(models.Model):
-    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name="attachments")
+    # Unset for uploads not (yet) tied to a message, e.g. assignment files
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name="attachments", null=True, blank=True)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name="attachments", null=True, blank=True)
+    uploaded_by = models.ForeignKey(LMSUser, on_delete=models.SET_NULL, related_name="uploads", null=True, blank=True)
     file_path = models.CharField(max_length=500)
     file_name = models.CharField(max_length=255)
     file_type = models.CharField(max_length=120)
     file_size = models.PositiveIntegerField()
+    # Relative to MEDIA_ROOT; image thumbnail or PDF first page (see user_panel.previews)
+    thumbnail_path = models.CharField(max_length=500, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self) -> str:
         return self.file_name
 
 
+class RoomReadCursor(models.Model):
+    """Last chat message a user has read in a room; the durable side of lms.unread."""
+    user = models.ForeignKey(LMSUser, on_delete=models.CASCADE, related_name="room_cursors")
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name="read_cursors")
+    last_read_id = models.BigIntegerField(default=0)  # a Message.seq
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("user", "room")
+
+    def __str__(self) -> str:
+        return f"{self.user_id} read room {self.room_id} up to {self.last_read_id}"
+
+
 class UserStatus(models.Model):
     user = models.ForeignKey(LMSUser, on_delete=models.CASCADE, related_name="status")
     is_online = models.BooleanField(default=False)
@@ -291,9 +360,51 @@ class OTPLog(models.Model):
     expires_at = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # OTP verify: latest unused code for an email
+            models.Index(fields=["email", "created_at"], condition=Q(is_used=False), name="otplog_unused_idx"),
+        ]
+
     def is_valid(self) -> bool:
         from django.utils import timezone
         return not self.is_used and self.expires_at >= timezone.now()
 
     def __str__(self) -> str:
         return f"OTP for {self.email} ({'used' if self.is_used else 'active'})"
+
+
+# --- Transactional outbox ---
+
+class OutboxEvent(models.Model):
+    """Side effect recorded in the same transaction as the write that caused it.
+
+    Drained by ``manage.py run_outbox_worker`` (see lms/outbox.py).
+    """
+
+    class Kind(models.TextChoices):
+        NOTIFICATION = "notification", "Notification"
+        ACTIVITY = "activity", "Activity"
+        EMAIL = "email", "Email"
+
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # Lease held by the worker running the event's handlers
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    # Set once the event has used up OUTBOX_MAX_ATTEMPTS; it is not retried
+    failed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"], condition=Q(processed_at__isnull=True, failed_at__isnull=True), name="outbox_pending_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        state = "done" if self.processed_at else "failed" if self.failed_at else "pending"
+        return f"{self.kind} #{self.id} ({state})"
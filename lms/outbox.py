@@ -0,0 +1,195 @@
+"""
+Transactional outbox
+====================
+Request handlers record side effects (notifications, activity log rows,
+emails) as ``OutboxEvent`` rows inside the same ``transaction.atomic`` block
+as the enrollment/subscription they belong to:
+
+    with transaction.atomic():
+        ...
+        outbox.add(outbox.notification(user.id, "..."), outbox.email(user.email, "...", "..."))
+
+``manage.py run_outbox_worker`` drains pending rows in batches with
+``process_batch``: notifications and activity rows are bulk-inserted, emails
+share one SMTP connection per batch (each event is sent, and retried, on its
+own) and new notifications are published to
+``notifications:user:{id}`` in a single Redis pipeline after commit. An
+event that fails ``OUTBOX_MAX_ATTEMPTS`` times gets ``failed_at`` set, is
+logged as an error and is left alone (filter on it in the admin).
+"""
+
+import json
+import logging
+import os
+from collections import Counter, defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import unread
+from .models import ActivityLog, Notification, OutboxEvent
+from .redis_client import get_redis, pack
+
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+# How long a worker may hold claimed events before another one may take them
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+
+
+def notification(user_id: int, message: str, link: Optional[str] = None) -> OutboxEvent:
+    return OutboxEvent(kind=OutboxEvent.Kind.NOTIFICATION, payload={"user_id": user_id, "message": message, "link": link})
+
+
+def activity(user_id: int, action_type: str, action_detail: str = "") -> OutboxEvent:
+    return OutboxEvent(
+        kind=OutboxEvent.Kind.ACTIVITY,
+        payload={"user_id": user_id, "action_type": action_type, "action_detail": action_detail},
+    )
+
+
+def email(to: str, subject: str, body: str) -> OutboxEvent:
+    return OutboxEvent(kind=OutboxEvent.Kind.EMAIL, payload={"to": to, "subject": subject, "body": body})
+
+
+def add(*events: OutboxEvent) -> None:
+    OutboxEvent.objects.bulk_create(events)
+
+
+def _fail(events: List[OutboxEvent], exc: Exception) -> None:
+    logging.warning(f"Outbox {events[0].kind} batch failed: {exc}")
+    for e in events:
+        e.attempts += 1
+        e.last_error = str(exc)[:1000]
+        e.processed_at = None
+        if e.attempts >= OUTBOX_MAX_ATTEMPTS:
+            e.failed_at = timezone.now()
+            logging.error(f"Outbox {e.kind} event #{e.id} failed {e.attempts} times, giving up: {exc}")
+
+
+def _finish(events: List[OutboxEvent]) -> None:
+    for e in events:
+        e.claimed_until = None
+    OutboxEvent.objects.bulk_update(events, ["processed_at", "failed_at", "attempts", "last_error", "claimed_until"])
+
+
+def _handle_notifications(events: List[OutboxEvent]) -> List[Notification]:
+    rows = [
+        Notification(user_id=e.payload["user_id"], message=e.payload["message"], link=e.payload.get("link"))
+        for e in events
+    ]
+    created = Notification.objects.bulk_create(rows)
+    # Registered inside the handler's savepoint, so a failed batch isn't counted
+    unread.notifications_added(Counter(n.user_id for n in created))
+    return created
+
+
+def _handle_activity(events: List[OutboxEvent]) -> None:
+    ActivityLog.objects.bulk_create(
+        ActivityLog(
+            user_id=e.payload["user_id"],
+            action_type=e.payload["action_type"],
+            action_detail=e.payload.get("action_detail", ""),
+            created_at=e.created_at,
+        )
+        for e in events
+    )
+
+
+def _handle_emails(events: List[OutboxEvent]) -> None:
+    # The real backend, never the in-process queue: failures must reach _fail
+    with get_connection(settings.EMAIL_DELIVERY_BACKEND) as connection:
+        for e in events:
+            # One message per event, so a retry only resends the ones that failed
+            message = EmailMessage(subject=e.payload["subject"], body=e.payload["body"], to=[e.payload["to"]])
+            try:
+                connection.send_messages([message])
+            except Exception as exc:
+                _fail([e], exc)
+
+
+def _publish(created: List[Notification]) -> None:
+    if not created:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for n in created:
+            pipe.publish(
+                f"notifications:user:{n.user_id}",
+                pack("outbox", json.dumps({
+                    "id": n.id,
+                    "message": n.message,
+                    "link": n.link,
+                    "is_read": n.is_read,
+                    "created_at": n.created_at.isoformat(),
+                })),
+            )
+        pipe.execute()
+    except Exception as e:
+        logging.warning(f"Could not publish outbox notifications: {e}")
+
+
+def _claim(batch_size: int) -> List[OutboxEvent]:
+    """Lease up to ``batch_size`` pending events; committed before any handler runs."""
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True, failed_at__isnull=True)
+            .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+            .order_by("id")[:batch_size]
+        )
+        for e in events:
+            e.claimed_until = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        OutboxEvent.objects.bulk_update(events, ["claimed_until"])
+    return events
+
+
+def process_batch(batch_size: int = 100) -> int:
+    """Process up to ``batch_size`` pending events; return how many were picked up.
+
+    Events are claimed in a short transaction of their own, so no row lock is
+    held while handlers (SMTP included) run. Database handlers commit their
+    rows together with the events' new state; emails are sent first and
+    recorded after, so a crash in between resends rather than loses them.
+    """
+    events = _claim(batch_size)
+    if not events:
+        return 0
+    now = timezone.now()
+    by_kind: Dict[str, List[OutboxEvent]] = defaultdict(list)
+    for e in events:
+        e.processed_at = now
+        by_kind[e.kind].append(e)
+
+    created: List[Notification] = []
+    handlers = (
+        (OutboxEvent.Kind.NOTIFICATION, _handle_notifications, True),
+        (OutboxEvent.Kind.ACTIVITY, _handle_activity, True),
+        (OutboxEvent.Kind.EMAIL, _handle_emails, False),
+    )
+    for kind, handler, atomic in handlers:
+        group = by_kind.pop(kind, [])
+        if not group:
+            continue
+        try:
+            if atomic:
+                with transaction.atomic():
+                    result = handler(group)
+                    _finish(group)
+            else:
+                result = handler(group)
+                _finish(group)
+            if kind == OutboxEvent.Kind.NOTIFICATION:
+                created = result
+        except Exception as exc:
+            _fail(group, exc)
+            _finish(group)
+    for group in by_kind.values():
+        _fail(group, ValueError(f"Unknown outbox event kind: {group[0].kind}"))
+        _finish(group)
+    _publish(created)
+    return len(events)
@@ -0,0 +1,30 @@
+"""
+Presence keys shared by the FastAPI presence tracker (user_panel/presence.py)
+and Django views.
+
+  presence:user:{id}  sorted set of the user's live connection ids, scored by
+                      heartbeat expiry (epoch seconds); its size is the user's
+                      connection refcount across all nodes
+  presence:online     sorted set of user ids scored by the latest expiry of
+                      any of their connections
+
+Entries whose score is in the past belong to connections that stopped
+heartbeating (e.g. a crashed node) and count as offline.
+"""
+
+import logging
+import time
+
+from .models import UserStatus
+from .redis_client import get_redis
+
+PRESENCE_USER_KEY = "presence:user:{}"
+PRESENCE_ONLINE_KEY = "presence:online"
+
+
+def online_user_count() -> int:
+    try:
+        return get_redis().zcount(PRESENCE_ONLINE_KEY, time.time(), "+inf")
+    except Exception as e:
+        logging.warning(f"Could not read presence from Redis: {e}")
+        return UserStatus.objects.filter(is_online=True).values("user_id").distinct().count()
@@ -0,0 +1,33 @@
+import os
+from typing import Optional, Tuple
+
+import redis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+_redis: Optional[redis.Redis] = None
+
+
+def get_redis() -> redis.Redis:
+    """Synchronous client for Django-side code (signals, management commands).
+
+    Short timeouts keep admin saves snappy when Redis is down; callers treat
+    every Redis operation as best-effort.
+    """
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+    return _redis
+
+
+# Pub/sub payloads are prefixed with the publishing process's id so that the
+# FastAPI subscriber (user_panel/pubsub.py) can skip its own messages.
+ENVELOPE_SEP = "\x1e"
+
+
+def pack(origin: str, data: str) -> str:
+    return f"{origin}{ENVELOPE_SEP}{data}"
+
+
+def unpack(raw: str) -> Tuple[Optional[str], str]:
+    origin, sep, data = raw.partition(ENVELOPE_SEP)
+    return (origin, data) if sep else (None, raw)
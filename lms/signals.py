@@ -0,0 +1,95 @@
+import json
+import logging
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .models import ChatRoom, Course, LMSUser, Subscription
+from .redis_client import get_redis
+
+INVALIDATION_CHANNEL = "lms:invalidate"
+CATALOG_VERSION_KEY = "catalog:version"
+ENTITLEMENT_KEY = "entitlement:{}"
+ENTITLEMENT_VERSION_KEY = "entitlement:version:{}"
+
+# Sent with ``kind`` (e.g. "user") and ``key`` (a string id) whenever cached
+# copies of a row must be dropped. The FastAPI process re-sends it for
+# invalidations published by other processes (see user_panel/invalidation.py).
+cache_invalidated = Signal()
+
+
+def invalidate(kind: str, key) -> None:
+    """Drop cached copies of ``kind``/``key`` in this process and broadcast to the others."""
+    cache_invalidated.send(sender=None, kind=kind, key=str(key))
+    try:
+        get_redis().publish(INVALIDATION_CHANNEL, json.dumps({"kind": kind, "key": str(key)}))
+    except Exception as e:
+        logging.warning(f"Could not publish cache invalidation: {e}")
+
+
+def bump_version(key: str) -> None:
+    """Advance a shared version counter so workers that missed a broadcast still notice."""
+    try:
+        get_redis().incr(key)
+    except Exception as e:
+        logging.warning(f"Could not bump {key}: {e}")
+
+
+def invalidate_catalog() -> None:
+    bump_version(CATALOG_VERSION_KEY)
+    invalidate("catalog", "published")
+
+
+def invalidate_entitlement(user_id) -> None:
+    # A bump rather than a delete: a reader that loaded the old row can still
+    # write it back afterwards, but under the old version, so it is ignored
+    bump_version(ENTITLEMENT_VERSION_KEY.format(user_id))
+    invalidate("entitlement", user_id)
+
+
+@receiver(post_save, sender=LMSUser)
+@receiver(post_delete, sender=LMSUser)
+def _user_changed(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate("user", pk))
+    # Instructor names are part of the published catalog
+    if instance.role == LMSUser.Roles.INSTRUCTOR:
+        transaction.on_commit(invalidate_catalog)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def _course_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_catalog)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def _subscription_changed(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_entitlement(user_id))
+
+
+@receiver(post_save, sender=ChatRoom)
+@receiver(post_delete, sender=ChatRoom)
+def _room_changed(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate("room", pk))
+
+
+@receiver(m2m_changed, sender=ChatRoom.members.through)
+def _room_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        room_ids = [instance.pk]
+    elif pk_set is not None:
+        room_ids = list(pk_set)
+    else:
+        # user.chat_rooms.clear(): rooms aren't known here, drop everything cached for the user
+        pk = instance.pk
+        transaction.on_commit(lambda: invalidate("user", pk))
+        return
+    for room_id in room_ids:
+        transaction.on_commit(lambda room_id=room_id: invalidate("room", room_id))
@@ -0,0 +1,56 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from lms import ids
+
+
+def _fields(message_id: int):
+    seconds = message_id >> (ids._WORKER_BITS + ids._SEQ_BITS)
+    worker = (message_id >> ids._SEQ_BITS) & ((1 << ids._WORKER_BITS) - 1)
+    return seconds, worker, message_id & ((1 << ids._SEQ_BITS) - 1)
+
+
+class IdGeneratorTests(SimpleTestCase):
+    def setUp(self):
+        # No Redis: a random worker id is used
+        patcher = mock.patch.object(ids, "get_redis", side_effect=ConnectionError("no redis"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.generator = ids.IdGenerator()
+
+    def test_ids_increase_and_carry_the_worker_id(self):
+        with self.assertLogs(level="WARNING"):
+            first = self.generator.next_id()
+        generated = [first] + [self.generator.next_id() for _ in range(2000)]
+        self.assertEqual(generated, sorted(set(generated)))
+        self.assertEqual({_fields(i)[1] for i in generated}, {self.generator.worker_id})
+        self.assertLess(generated[-1], 2 ** 53)
+
+    def test_exhausted_second_borrows_the_next_one(self):
+        with self.assertLogs(level="WARNING"):
+            before = self.generator.next_id()
+        self.generator._seq = 1 << ids._SEQ_BITS
+        after = self.generator.next_id()
+        self.assertGreater(after, before)
+        self.assertEqual(_fields(after)[0], _fields(before)[0] + 1)
+        self.assertEqual(_fields(after)[2], 0)
+
+    def test_clock_going_back_keeps_ids_increasing(self):
+        with self.assertLogs(level="WARNING"):
+            before = self.generator.next_id()
+        with mock.patch.object(ids.time, "time", return_value=ids._ID_EPOCH + _fields(before)[0] - 5):
+            self.assertGreater(self.generator.next_id(), before)
+
+    def test_worker_id_is_leased_once_and_renewed_when_due(self):
+        with self.assertLogs(level="WARNING"):
+            self.generator.next_id()
+        worker_id = self.generator.worker_id
+        with mock.patch.object(self.generator, "lease", wraps=self.generator.lease) as lease:
+            self.generator.next_id()
+            lease.assert_not_called()
+            self.generator._renew_at = 0.0
+            with self.assertLogs(level="WARNING"):
+                self.generator.next_id()
+            lease.assert_called_once()
+        self.assertEqual(self.generator.worker_id, worker_id)
@@ -0,0 +1,268 @@
+"""
+Unread counters
+===============
+Badge counts kept in Redis so reading them never touches the database:
+
+  unread:{user_id}   hash; "notifications" -> unread notification count,
+                     "room:{room_id}" -> the user's read cursor in that room
+  chat:room_seq      hash; room id -> number of messages posted in the room
+
+A room's unread count is ``seq - cursor``. Posting a message bumps the room's
+seq (and moves the sender's cursor to it), so a message costs O(1) however
+many members the room has. Reading a room moves the cursor; the durable copy
+of the cursor is RoomReadCursor.
+
+All updates are Lua scripts, so concurrent increments, reads and clamps
+can't interleave. Counters that don't exist yet are never incremented. They
+are seeded from the database the first time they are read, so a flushed
+Redis doesn't leave negative or too-small counts. ``reconcile`` (run by
+``manage.py reconcile_unread``) recomputes every tracked counter from the
+database to correct drift, e.g. from notifications created in the admin.
+
+Every Redis call is best-effort. Without Redis, counts come straight from
+the database.
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import ChatRoom, Message, Notification, RoomReadCursor
+from .redis_client import get_redis
+
+UNREAD_KEY = "unread:{}"
+ROOM_SEQ_KEY = "chat:room_seq"
+NOTIFICATIONS_FIELD = "notifications"
+ROOM_FIELD = "room:{}"
+
+# KEYS[1] = unread hash; ARGV = field, delta
+# Adds delta (floored at 0) to a counter that has been seeded; returns nil otherwise
+ADJUST_LUA = """
+if redis.call("HEXISTS", KEYS[1], ARGV[1]) == 0 then
+    return nil
+end
+local n = redis.call("HINCRBY", KEYS[1], ARGV[1], ARGV[2])
+if n < 0 then
+    redis.call("HSET", KEYS[1], ARGV[1], 0)
+    return 0
+end
+return n
+"""
+
+# KEYS[1] = room seq hash, KEYS[2] = sender's unread hash; ARGV = room id, cursor field
+# Returns the room's new seq
+POST_LUA = """
+local seq = redis.call("HINCRBY", KEYS[1], ARGV[1], 1)
+if redis.call("HEXISTS", KEYS[2], ARGV[2]) == 1 then
+    redis.call("HSET", KEYS[2], ARGV[2], seq)
+end
+return seq
+"""
+
+# KEYS[1] = room seq hash, KEYS[2] = user's unread hash
+# ARGV = room id, cursor field, messages still unread, mode ("max" | "set")
+# Places the cursor that many messages behind the room's seq. "max" never
+# moves an existing cursor back (reads, seeding); "set" does (reconcile).
+# Returns the room's unread count.
+CURSOR_LUA = """
+local seq = tonumber(redis.call("HGET", KEYS[1], ARGV[1]))
+if not seq then
+    seq = 0
+    redis.call("HSET", KEYS[1], ARGV[1], 0)
+end
+local cursor = seq - tonumber(ARGV[3])
+local current = tonumber(redis.call("HGET", KEYS[2], ARGV[2]))
+if ARGV[4] == "set" or not current or cursor > current then
+    redis.call("HSET", KEYS[2], ARGV[2], cursor)
+    current = cursor
+end
+return math.max(seq - current, 0)
+"""
+
+_scripts: Dict[str, object] = {}
+
+
+def _script(source: str):
+    client = get_redis()
+    script = _scripts.get(source)
+    if script is None or script.registered_client is not client:
+        script = _scripts[source] = client.register_script(source)
+    return script
+
+
+# --- Database side --------------------------------------------------------
+
+def db_notification_counts(user_ids: Iterable[int]) -> Dict[int, int]:
+    rows = (
+        Notification.objects.filter(user_id__in=list(user_ids), is_read=False)
+        .values("user_id").annotate(n=Count("id")).values_list("user_id", "n")
+    )
+    return dict(rows)
+
+
+def db_room_counts(user_ids: Iterable[int], room_ids: Optional[Iterable[int]] = None) -> Dict[Tuple[int, int], int]:
+    """Unread messages per (user, room) membership: others' messages after both the
+    user's read cursor and their own latest message (posting implies reading)."""
+    memberships = ChatRoom.members.through.objects.filter(lmsuser_id__in=list(user_ids))
+    if room_ids is not None:
+        memberships = memberships.filter(chatroom_id__in=list(room_ids))
+    big = BigIntegerField()
+    zero = Value(0, output_field=big)
+    cursor = RoomReadCursor.objects.filter(
+        user_id=OuterRef("lmsuser_id"), room_id=OuterRef("chatroom_id")
+    ).values("last_read_id")[:1]
+    own = Message.objects.filter(
+        room_id=OuterRef("chatroom_id"), sender_id=OuterRef("lmsuser_id")
+    ).order_by("-seq").values("seq")[:1]
+    unread = (
+        Message.objects.filter(room_id=OuterRef("chatroom_id"), seq__gt=OuterRef("seen"))
+        .exclude(sender_id=OuterRef("lmsuser_id"))
+        .order_by().values("room_id").annotate(n=Count("id")).values("n")
+    )
+    rows = memberships.annotate(
+        seen=Greatest(Coalesce(Subquery(cursor), zero), Coalesce(Subquery(own, output_field=big), zero)),
+        unread=Coalesce(Subquery(unread, output_field=big), zero),
+    ).values_list("lmsuser_id", "chatroom_id", "unread")
+    return {(uid, rid): n for uid, rid, n in rows}
+
+
+# --- Updates --------------------------------------------------------------
+
+def _adjust_notifications(deltas: Dict[int, int]) -> None:
+    try:
+        script = _script(ADJUST_LUA)
+        pipe = get_redis().pipeline(transaction=False)
+        for user_id, delta in deltas.items():
+            if delta:
+                script(keys=[UNREAD_KEY.format(user_id)], args=[NOTIFICATIONS_FIELD, delta], client=pipe)
+        pipe.execute()
+    except Exception as e:
+        logging.warning(f"Could not update unread notification counters: {e}")
+
+
+def notifications_added(counts: Dict[int, int]) -> None:
+    """Count new unread notifications ({user id: how many}) once the transaction commits."""
+    if counts:
+        transaction.on_commit(lambda: _adjust_notifications(counts))
+
+
+def notifications_read(user_id: int, count: int) -> None:
+    """Uncount ``count`` notifications that a mark-read UPDATE actually flipped."""
+    if count:
+        transaction.on_commit(lambda: _adjust_notifications({user_id: -count}))
+
+
+def mark_room_read(user_id: int, room_id: int, message_id: int, unflushed: int = 0) -> int:
+    """Move the user's read cursor in ``room_id`` up to ``message_id`` (a ``Message.seq``); returns what is left unread.
+
+    ``unflushed`` counts later messages from others that aren't in the database yet.
+    """
+    cursor, created = RoomReadCursor.objects.get_or_create(
+        user_id=user_id, room_id=room_id, defaults={"last_read_id": message_id}
+    )
+    if not created:
+        RoomReadCursor.objects.filter(pk=cursor.pk, last_read_id__lt=message_id).update(last_read_id=message_id)
+    remaining = (
+        Message.objects.filter(room_id=room_id, seq__gt=message_id).exclude(sender_id=user_id).count() + unflushed
+    )
+    try:
+        return _script(CURSOR_LUA)(
+            keys=[ROOM_SEQ_KEY, UNREAD_KEY.format(user_id)],
+            args=[room_id, ROOM_FIELD.format(room_id), remaining, "max"],
+        )
+    except Exception as e:
+        logging.warning(f"Could not move read cursor of user {user_id} in room {room_id}: {e}")
+        return remaining
+
+
+# --- Reads ----------------------------------------------------------------
+
+def _db_badges(user_id: int, room_ids: List[int]) -> Tuple[int, Dict[int, int]]:
+    rooms = db_room_counts([user_id], room_ids)
+    return db_notification_counts([user_id]).get(user_id, 0), {rid: n for (_, rid), n in rooms.items()}
+
+
+def badges(user_id: int) -> Tuple[int, Dict[int, int]]:
+    """(unread notifications, {room id: unread messages}) for every room the user is in."""
+    room_ids = list(
+        ChatRoom.members.through.objects.filter(lmsuser_id=user_id).values_list("chatroom_id", flat=True)
+    )
+    key = UNREAD_KEY.format(user_id)
+    try:
+        redis = get_redis()
+        pipe = redis.pipeline(transaction=False)
+        pipe.hgetall(key)
+        if room_ids:
+            pipe.hmget(ROOM_SEQ_KEY, room_ids)
+        fields, *seqs = pipe.execute()
+    except Exception as e:
+        logging.warning(f"Could not read unread counters for user {user_id}: {e}")
+        return _db_badges(user_id, room_ids)
+
+    fields = {k.decode(): int(v) for k, v in fields.items()}
+    seqs = dict(zip(room_ids, seqs[0] if seqs else []))
+    rooms: Dict[int, int] = {}
+    missing = []
+    for room_id in room_ids:
+        cursor = fields.get(ROOM_FIELD.format(room_id))
+        if cursor is None:
+            missing.append(room_id)
+        else:
+            rooms[room_id] = max(int(seqs[room_id] or 0) - cursor, 0)
+
+    notifications = fields.get(NOTIFICATIONS_FIELD)
+    try:
+        if notifications is None:
+            notifications = db_notification_counts([user_id]).get(user_id, 0)
+            redis.hsetnx(key, NOTIFICATIONS_FIELD, notifications)
+        if missing:
+            script = _script(CURSOR_LUA)
+            for (_, room_id), n in db_room_counts([user_id], missing).items():
+                rooms[room_id] = script(
+                    keys=[ROOM_SEQ_KEY, key], args=[room_id, ROOM_FIELD.format(room_id), n, "max"]
+                )
+    except Exception as e:
+        logging.warning(f"Could not seed unread counters for user {user_id}: {e}")
+        return _db_badges(user_id, room_ids)
+    return notifications, rooms
+
+
+def notification_count(user_id: int) -> int:
+    key = UNREAD_KEY.format(user_id)
+    try:
+        count = get_redis().hget(key, NOTIFICATIONS_FIELD)
+        if count is not None:
+            return int(count)
+        count = db_notification_counts([user_id]).get(user_id, 0)
+        get_redis().hsetnx(key, NOTIFICATIONS_FIELD, count)
+        return count
+    except Exception as e:
+        logging.warning(f"Could not read unread notifications for user {user_id}: {e}")
+        return db_notification_counts([user_id]).get(user_id, 0)
+
+
+# --- Reconciliation -------------------------------------------------------
+
+def reconcile(batch_size: int = 500) -> int:
+    """Recompute every seeded counter from the database; returns how many users were checked."""
+    redis = get_redis()
+    user_ids = sorted({int(k.split(b":", 1)[1]) for k in redis.scan_iter(match=UNREAD_KEY.format("*"), count=1000)})
+    script = _script(CURSOR_LUA)
+    for i in range(0, len(user_ids), batch_size):
+        chunk = user_ids[i:i + batch_size]
+        notifications = db_notification_counts(chunk)
+        rooms = db_room_counts(chunk)
+        pipe = redis.pipeline(transaction=False)
+        for user_id in chunk:
+            pipe.hset(UNREAD_KEY.format(user_id), NOTIFICATIONS_FIELD, notifications.get(user_id, 0))
+        for (user_id, room_id), n in rooms.items():
+            script(
+                keys=[ROOM_SEQ_KEY, UNREAD_KEY.format(user_id)],
+                args=[room_id, ROOM_FIELD.format(room_id), n, "set"],
+                client=pipe,
+            )
+        pipe.execute()
+    return len(user_ids)
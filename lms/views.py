@@ -6,7 +6,9 @@ from django.db.models.functions import TruncDate, TruncMonth
 from django.utils import timezone as djtz
 from datetime import timedelta
 import json
-from .models import Course, Enrollment, Progress, LMSUser, Subscription, Payment, ChatRoom, Message, FileAttachment, UserStatus, Notification, ActivityLog, Assignment, Submission, Attendance
+from .db_router import replica_reads
+from .models import Course, Enrollment, Progress, LMSUser, Subscription, Payment, ChatRoom, Message, FileAttachment, Notification, ActivityLog, Assignment, Submission, Attendance
+from .presence import online_user_count
 
 def staff_member_required(view_func):
     def _wrapped_view(request, *args, **kwargs):
@@ -21,6 +23,7 @@ def staff_member_required(view_func):
     return _wrapped_view
 
 @staff_member_required
+@replica_reads()
 def admin_dashboard(request):
     total_users = LMSUser.objects.count()
     total_courses = Course.objects.count()
@@ -75,15 +78,20 @@ def admin_dashboard(request):
         },
     )
 
+def _days_ago(days: int):
+    """Local midnight ``days`` days ago. Filtering on a timestamp range (rather than
+    ``timestamp__date``) lets the database use the timestamp index."""
+    return djtz.localtime().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+
 @staff_member_required
 def chat_analytics_page(request):
     return redirect("/admin/dashboard/")
 
 @staff_member_required
+@replica_reads()
 def chat_messages_per_day(request):
-    since = djtz.now().date() - timedelta(days=30)
     data = (
-        Message.objects.filter(timestamp__date__gte=since)
+        Message.objects.filter(timestamp__gte=_days_ago(30))
         .annotate(day=TruncDate("timestamp"))
         .values("day")
         .annotate(count=Count("id"))
@@ -92,6 +100,7 @@ def chat_messages_per_day(request):
     return JsonResponse({"series": [{"label": d["day"].strftime("%Y-%m-%d"), "value": d["count"]} for d in data]})
 
 @staff_member_required
+@replica_reads()
 def chat_top_users(request):
     data = (
         Message.objects.values("sender_username")
@@ -101,6 +110,7 @@ def chat_top_users(request):
     return JsonResponse({"series": [{"label": d["sender_username"], "value": d["count"]} for d in data]})
 
 @staff_member_required
+@replica_reads()
 def chat_room_activity(request):
     data = (
         Message.objects.values("room__name")
@@ -110,11 +120,11 @@ def chat_room_activity(request):
     return JsonResponse({"series": [{"label": d["room__name"] or 'Room', "value": d["count"]} for d in data]})
 
 @staff_member_required
+@replica_reads()
 def chat_file_shares_per_day(request):
-    since = djtz.now().date() - timedelta(days=30)
     # Changed to use Message model with message_type='file'
     data = (
-        Message.objects.filter(timestamp__date__gte=since, message_type='file')
+        Message.objects.filter(timestamp__gte=_days_ago(30), message_type='file')
         .annotate(day=TruncDate("timestamp"))
         .values("day")
         .annotate(count=Count("id"))
@@ -123,15 +133,14 @@ def chat_file_shares_per_day(request):
     return JsonResponse({"series": [{"label": d["day"].strftime("%Y-%m-%d"), "value": d["count"]} for d in data]})
 
 @staff_member_required
+@replica_reads()
 def chat_stats_summary(request):
-    today = djtz.now().date()
-    msgs_today = Message.objects.filter(timestamp__date=today).count()
+    today = _days_ago(0)
+    msgs_today = Message.objects.filter(timestamp__gte=today).count()
     # Active rooms: rooms with at least one message
     active_rooms = ChatRoom.objects.filter(messages__isnull=False).distinct().count()
-    # Online users: fallback to UserStatus if updated, or just total users for now if not reliable
-    # Let's check UserStatus
-    online_users = UserStatus.objects.filter(is_online=True).count()
-    files_today = Message.objects.filter(timestamp__date=today, message_type='file').count()
+    online_users = online_user_count()
+    files_today = Message.objects.filter(timestamp__gte=today, message_type='file').count()
     
     return JsonResponse({
         "messages_today": msgs_today,
@@ -159,6 +168,7 @@ def login_page(request):
 
 
 @staff_member_required
+@replica_reads()
 def course_analytics(request):
     course_id = request.GET.get("course_id")
     if not course_id:
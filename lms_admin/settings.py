@@ -82,6 +82,37 @@ else:
         }
     }
 
+# Optional read replica for analytics and list queries (see lms/db_router.py)
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "")
+if DATABASE_REPLICA_URL:
+    import dj_database_url  # type: ignore
+
+    DATABASES["replica"] = dj_database_url.parse(DATABASE_REPLICA_URL, conn_max_age=600)
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+    DATABASE_ROUTERS = ["lms.db_router.ReplicaRouter"]
+
+# Threads the FastAPI app runs sync endpoints and dependencies on (Starlette threadpool)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+
+# DB_POOL=1: borrow Postgres connections from a psycopg 3 pool (one per database)
+# instead of one persistent connection per thread (see user_panel/db_pool.py).
+# Each threadpool thread holds at most one connection at a time, plus
+# sync_to_async's thread and one spare, so a pool never needs more than
+# THREADPOOL_SIZE + 2.
+DB_POOL = os.getenv("DB_POOL", "0") == "1"
+for _alias, _db in DATABASES.items():
+    if DB_POOL and _db["ENGINE"] == "django.db.backends.postgresql":
+        _db["CONN_MAX_AGE"] = 0  # the pool owns connection lifetime
+        _db["CONN_HEALTH_CHECKS"] = True  # checked on every checkout
+        _db.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", str(THREADPOOL_SIZE + 2))),
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+            "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+            "name": _alias,
+        }
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME": "django.contrib.auth.password_validation.MinimumLengthValidator"},
@@ -99,15 +130,25 @@ STATICFILES_DIRS = [BASE_DIR / "lms" / "static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
 MEDIA_URL = "/media/"
-MEDIA_ROOT = BASE_DIR / "media"
+MEDIA_ROOT = Path(os.getenv("MEDIA_ROOT", BASE_DIR / "media"))
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Simple setting to expose a consistent site name
 SITE_NAME = "Learning Management Platform"
 
-# Email backend for notifications (simple SMTP by default; override in .env)
-EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
+# Email: EMAIL_DELIVERY_BACKEND actually sends; outbox mail goes through it
+# directly. OTP codes (high lane, waiting for the result so failures reach the
+# caller) and fire-and-forget notification mail (bulk lane) go through the
+# in-process queue (QUEUED_EMAIL_BACKEND, see lms/mail.py).
+EMAIL_DELIVERY_BACKEND = os.getenv("EMAIL_DELIVERY_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", EMAIL_DELIVERY_BACKEND)
+QUEUED_EMAIL_BACKEND = "lms.mail.QueuedEmailBackend"
+EMAIL_FILE_PATH = os.getenv("EMAIL_FILE_PATH", str(BASE_DIR / "sent_emails"))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+EMAIL_IDLE_TIMEOUT = int(os.getenv("EMAIL_IDLE_TIMEOUT", "30"))
+EMAIL_QUEUE_SIZE = int(os.getenv("EMAIL_QUEUE_SIZE", "10000"))
+EMAIL_SEND_TIMEOUT = float(os.getenv("EMAIL_SEND_TIMEOUT", "30"))
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "no-reply@example.com")
 EMAIL_HOST = os.getenv("EMAIL_HOST", "smtp.gmail.com")
 EMAIL_PORT = int(os.getenv("EMAIL_PORT", "587"))
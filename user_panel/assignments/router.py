@@ -2,22 +2,24 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from typing import List
 from datetime import datetime
 import os
-import uuid
 from django.utils import timezone
 
 from .schemas import AssignmentOut, SubmissionOut, GradeSubmissionRequest
 from lms.models import Assignment, Submission, LMSUser, Course, Enrollment
+from user_panel import storage
 from user_panel.deps import get_current_user, require_role
 from asgiref.sync import sync_to_async
-from user_panel.notifications.utils import create_notification
+from user_panel.notifications.utils import create_notification, notify_many
+
+ASSIGNMENT_MAX_FILE_SIZE_MB = int(os.getenv("ASSIGNMENT_MAX_FILE_SIZE_MB", "50"))
+MAX_FILE_BYTES = ASSIGNMENT_MAX_FILE_SIZE_MB * 1024 * 1024
 
 router = APIRouter(
     prefix="/assignments",
     tags=["assignments"],
+    route_class=storage.limited_body_route(MAX_FILE_BYTES),
 )
 
-MEDIA_ROOT = "media/assignments"
-
 @router.post("/create", response_model=AssignmentOut)
 async def create_assignment(
     course_id: int = Form(...),
@@ -38,14 +40,8 @@ async def create_assignment(
 
     file_url = None
     if file:
-        @sync_to_async
-        def save_file():
-            os.makedirs(MEDIA_ROOT, exist_ok=True)
-            file_path = os.path.join(MEDIA_ROOT, f"{uuid.uuid4()}_{file.filename}")
-            with open(file_path, "wb") as buffer:
-                buffer.write(file.file.read())
-            return f"/{file_path}"
-        file_url = await save_file()
+        attachment = await storage.save(file, MAX_FILE_BYTES, user_id=user.id)
+        file_url = storage.blob_url(attachment.blob_id)
 
     @sync_to_async
     def create_assignment_in_db():
@@ -61,12 +57,10 @@ async def create_assignment(
     assignment = await create_assignment_in_db()
 
     @sync_to_async
-    def get_enrollments():
-        return list(Enrollment.objects.filter(course=course).select_related('user'))
+    def get_student_ids():
+        return list(Enrollment.objects.filter(course=course).values_list("user_id", flat=True))
 
-    enrollments = await get_enrollments()
-    for enrollment in enrollments:
-        await create_notification(enrollment.user, f"New assignment '{title}' in {course.title}.", link=f"/assignments/{assignment.id}/")
+    await notify_many(await get_student_ids(), f"New assignment '{title}' in {course.title}.", link=f"/assignments/{assignment.id}/")
 
     return assignment
 
@@ -95,17 +89,14 @@ async def submit_assignment(
     if timezone.now() > assignment.deadline:
         raise HTTPException(status_code=400, detail="The deadline for this assignment has passed.")
 
+    attachment = await storage.save(file, MAX_FILE_BYTES, user_id=user.id)
+
     @sync_to_async
     def save_submission():
-        os.makedirs(MEDIA_ROOT, exist_ok=True)
-        file_path = os.path.join(MEDIA_ROOT, f"{uuid.uuid4()}_{file.filename}")
-        with open(file_path, "wb") as buffer:
-            buffer.write(file.file.read())
-        file_url = f"/{file_path}"
         return Submission.objects.create(
             assignment=assignment,
             student=user,
-            file_url=file_url,
+            file_url=storage.blob_url(attachment.blob_id),
         )
 
     return await save_submission()
@@ -121,7 +112,7 @@ async def grade_submission(request: GradeSubmissionRequest, user: LMSUser = Depe
 
     submission = await get_submission()
 
-    if submission.assignment.course.instructor != user:
+    if submission.assignment.course.instructor_id != user.id:
         raise HTTPException(status_code=403, detail="You are not the instructor for this course.")
 
     @sync_to_async
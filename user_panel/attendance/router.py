@@ -6,7 +6,8 @@ from .schemas import MarkAttendanceRequest, StudentAttendanceResponse, CourseAtt
 from lms.models import Attendance, LMSUser, Course, Enrollment
 from user_panel.deps import get_current_user, require_role
 from asgiref.sync import sync_to_async
-from user_panel.notifications.utils import create_notification
+from django.db import transaction
+from user_panel.notifications.utils import notify_many
 
 router = APIRouter(
     prefix="/attendance",
@@ -23,31 +24,30 @@ async def mark_attendance(request: MarkAttendanceRequest, user: LMSUser = Depend
             raise HTTPException(status_code=404, detail="Course not found or you are not the instructor.")
 
     course = await get_course()
+    student_ids = [record.student_id for record in request.records]
 
-    for record in request.records:
-        @sync_to_async
-        def get_student():
-            try:
-                return LMSUser.objects.get(pk=record.student_id, role="student")
-            except LMSUser.DoesNotExist:
-                raise HTTPException(status_code=404, detail=f"Student with id {record.student_id} not found.")
-
-        student = await get_student()
-
-        @sync_to_async
-        def update_attendance():
-            if not Enrollment.objects.filter(user=student, course=course).exists():
-                raise HTTPException(status_code=400, detail=f"Student {student.id} is not enrolled in this course.")
+    @sync_to_async
+    def update_attendance():
+        # Validate every record up front with two queries instead of two per student
+        students = set(LMSUser.objects.filter(pk__in=student_ids, role="student").values_list("id", flat=True))
+        enrolled = set(Enrollment.objects.filter(course=course, user_id__in=students).values_list("user_id", flat=True))
+        for sid in student_ids:
+            if sid not in students:
+                raise HTTPException(status_code=404, detail=f"Student with id {sid} not found.")
+            if sid not in enrolled:
+                raise HTTPException(status_code=400, detail=f"Student {sid} is not enrolled in this course.")
 
-            Attendance.objects.update_or_create(
-                student=student,
-                course=course,
-                date=request.date,
-                defaults={"status": record.status}
-            )
+        with transaction.atomic():
+            for record in request.records:
+                Attendance.objects.update_or_create(
+                    student_id=record.student_id,
+                    course=course,
+                    date=request.date,
+                    defaults={"status": record.status}
+                )
 
-        await update_attendance()
-        await create_notification(student, f"Attendance marked for {course.title} on {request.date}.", link=f"/courses/{course.id}/attendance/")
+    await update_attendance()
+    await notify_many(student_ids, f"Attendance marked for {course.title} on {request.date}.", link=f"/courses/{course.id}/attendance/")
 
     return {"message": "Attendance marked successfully."}
 
@@ -5,8 +5,10 @@ Endpoints:
   POST /auth/otp/send/    - Generate and send a 6-digit OTP via email
   POST /auth/otp/verify/  - Verify OTP and issue JWT (creates account if new user)
 
-OTP codes expire after 10 minutes and are single-use.
-Delivery uses Django's configured SMTP email backend.
+OTP codes expire after 10 minutes and are single-use. Both endpoints are
+rate limited per client IP and per email (see user_panel/ratelimit.py).
+Delivery uses the high-priority lane of the queued email backend (lms/mail.py)
+and waits for the result, so a failed send is reported to the client.
 """
 
 import random
@@ -14,21 +16,33 @@ import string
 import os
 from datetime import timedelta
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, EmailStr, Field
 
 from .django_setup import setup as django_setup
 django_setup()
 
+from django.conf import settings  # noqa: E402
 from django.utils import timezone  # noqa: E402
-from django.core.mail import send_mail  # noqa: E402
+from django.core.mail import get_connection, send_mail  # noqa: E402
 from lms.models import LMSUser, OTPLog  # noqa: E402
 from .auth import create_access_token  # noqa: E402
+from .ratelimit import RateLimit  # noqa: E402
 
 router = APIRouter(prefix="/auth/otp", tags=["Auth - OTP"])
 
 OTP_EXPIRE_MINUTES = int(os.getenv("OTP_EXPIRE_MINUTES", "10"))
 
+# Each send costs a DB write and an SMTP round-trip; each verify is a guess at a 6-digit code
+send_limits = [
+    Depends(RateLimit("otp_send", capacity=10, period=3600, scope="ip")),
+    Depends(RateLimit("otp_send", capacity=3, period=OTP_EXPIRE_MINUTES * 60, scope="email")),
+]
+verify_limits = [
+    Depends(RateLimit("otp_verify", capacity=30, period=600, scope="ip")),
+    Depends(RateLimit("otp_verify", capacity=5, period=OTP_EXPIRE_MINUTES * 60, scope="email")),
+]
+
 
 class OTPSendRequest(BaseModel):
     email: EmailStr
@@ -51,11 +65,12 @@ def _generate_otp() -> str:
     return "".join(random.choices(string.digits, k=6))
 
 
-@router.post("/send/", response_model=OTPSendResponse, summary="Send OTP to user's email")
+@router.post("/send/", response_model=OTPSendResponse, summary="Send OTP to user's email", dependencies=send_limits)
 def send_otp(payload: OTPSendRequest):
     """
     Generate a 6-digit OTP and send it to the provided email address.
-    Rate limit: Only one active OTP per email is allowed — previous unused OTPs
+    Rate limit: 10 sends per hour per IP and 3 per expiry window per email.
+    Only one active OTP per email is allowed — previous unused OTPs
     are invalidated before generating a new one.
     """
     # Invalidate any existing unused OTPs for this email
@@ -84,6 +99,9 @@ def send_otp(payload: OTPSendRequest):
             from_email=None,  # Uses DEFAULT_FROM_EMAIL from settings
             recipient_list=[payload.email],
             fail_silently=False,
+            # Ahead of queued bulk mail; waits for delivery, so an SMTP failure
+            # reaches the except below
+            connection=get_connection(settings.QUEUED_EMAIL_BACKEND, lane="high", fail_silently=False),
         )
     except Exception as exc:
         # Clean up the OTP log entry if sending fails
@@ -96,7 +114,7 @@ def send_otp(payload: OTPSendRequest):
     return OTPSendResponse(message=f"OTP sent to {payload.email}", expires_in_minutes=OTP_EXPIRE_MINUTES)
 
 
-@router.post("/verify/", summary="Verify OTP and issue JWT token")
+@router.post("/verify/", summary="Verify OTP and issue JWT token", dependencies=verify_limits)
 def verify_otp(payload: OTPVerifyRequest):
     """
     Validate the OTP code for the given email.
@@ -0,0 +1,136 @@
+"""
+Published course catalog cache
+==============================
+Keeps the published catalog in memory as pre-serialized JSON, newest first:
+
+  premium  - every published course (subscribers)
+  free     - published courses with is_premium=False
+  courses  - per-course (is_premium, title, CourseOut bytes) for /courses/{id}
+
+Pages of either view are sliced from the snapshot (see pagination.paginate_sorted).
+
+The snapshot is dropped when Course/instructor rows change (lms.signals sends
+``cache_invalidated`` locally and over Redis) and, as a safety net for missed
+broadcasts, whenever the shared ``catalog:version`` key moves.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.dispatch import receiver
+
+from lms.models import Course
+from lms.signals import CATALOG_VERSION_KEY, cache_invalidated
+from user_panel.pagination import Page, paginate_sorted
+from user_panel.redis_client import get_redis
+from user_panel.schemas import CourseOut
+
+# How often a worker re-reads the shared version key
+CATALOG_VERSION_CHECK = float(os.getenv("CATALOG_VERSION_CHECK", "5"))
+
+
+@dataclass
+class _View:
+    keys: List[Tuple[float, int]] = field(default_factory=list)
+    items: List[dict] = field(default_factory=list)
+    raw: List[bytes] = field(default_factory=list)
+    cursors: List[Tuple[datetime, int]] = field(default_factory=list)
+    body: bytes = b"[]"
+
+    def add(self, created_at: datetime, pk: int, item: dict, raw: bytes) -> None:
+        self.keys.append((-created_at.timestamp(), -pk))
+        self.items.append(item)
+        self.raw.append(raw)
+        self.cursors.append((created_at, pk))
+
+    def seal(self) -> "_View":
+        self.body = b"[" + b",".join(self.raw) + b"]"
+        return self
+
+
+@dataclass
+class _Snapshot:
+    generation: int
+    version: Optional[str]
+    premium: _View
+    free: _View
+    courses: Dict[int, Tuple[bool, str, bytes]]
+
+
+class CatalogCache:
+    def __init__(self) -> None:
+        self._snapshot: Optional[_Snapshot] = None
+        self._generation = 0
+        self._next_check = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._generation += 1
+
+    def _build(self, generation: int, version: Optional[str]) -> _Snapshot:
+        premium, free, courses = _View(), _View(), {}
+        qs = Course.objects.select_related("instructor").filter(status="published").order_by("-created_at", "-id")
+        for c in qs:
+            out = CourseOut(
+                id=c.id,
+                title=c.title,
+                description=c.description,
+                instructor_name=c.instructor.name or "",
+                status=c.status,
+            )
+            item, data = out.model_dump(), out.model_dump_json().encode()
+            premium.add(c.created_at, c.id, item, data)
+            if not c.is_premium:
+                free.add(c.created_at, c.id, item, data)
+            courses[c.id] = (c.is_premium, c.title, data)
+        return _Snapshot(generation, version, premium.seal(), free.seal(), courses)
+
+    async def _shared_version(self) -> Optional[str]:
+        redis = await get_redis()
+        if redis is None:
+            return None
+        try:
+            return await redis.get(CATALOG_VERSION_KEY)
+        except Exception as e:
+            logging.warning(f"Could not read {CATALOG_VERSION_KEY}: {e}")
+            return None
+
+    async def snapshot(self) -> _Snapshot:
+        snap = self._snapshot
+        now = time.monotonic()
+        if snap is not None and snap.generation == self._generation and now < self._next_check:
+            return snap
+        async with self._lock:
+            version = await self._shared_version()
+            self._next_check = time.monotonic() + CATALOG_VERSION_CHECK
+            snap = self._snapshot
+            if snap is None or snap.generation != self._generation or snap.version != version:
+                snap = await sync_to_async(self._build)(self._generation, version)
+                self._snapshot = snap
+            return snap
+
+    async def page(self, premium: bool, page: Page):
+        snap = await self.snapshot()
+        view = snap.premium if premium else snap.free
+        if page.after is None and not page.fields and (page.limit is None or len(view.raw) <= page.limit):
+            return page.respond(view.body, None)
+        return paginate_sorted(view.keys, view.items, view.raw, view.cursors, page)
+
+    async def course(self, course_id: int) -> Optional[Tuple[bool, str, bytes]]:
+        snap = await self.snapshot()
+        return snap.courses.get(course_id)
+
+
+catalog = CatalogCache()
+
+
+@receiver(cache_invalidated)
+def _drop_catalog(sender, kind, key, **kwargs):
+    if kind == "catalog":
+        catalog.invalidate()
@@ -0,0 +1,77 @@
+"""
+Chat history reads
+==================
+Messages are ordered by ``(timestamp, seq)`` (backed by the
+``message_room_ts_idx`` index) and paged relative to a message id (the
+``seq`` clients see, see lms/ids.py):
+
+  before_id  - the ``limit`` messages right before it (scrolling back)
+  after_id   - the ``limit`` messages right after it (catching up)
+
+Results are always oldest first. Messages the chat writer has accepted but
+not yet committed are merged in, so a sender sees their own message even
+inside a group-commit window.
+"""
+
+from typing import List, Optional, Tuple
+
+from django.db.models import Q
+
+from lms.models import Message
+from .writer import writer
+
+
+def message_event(m: Message) -> dict:
+    """WebSocket frame for a chat message (live broadcast and reconnect replay)."""
+    event = {
+        "event": "message",
+        "id": m.seq,
+        "room_id": m.room_id,
+        "sender_id": m.sender_id,
+        "sender_username": m.sender_username,
+        "content": m.content,
+        "message_type": m.message_type,
+    }
+    if m.message_type == Message.MessageType.FILE:
+        event.update(
+            file_url=m.file_url, file_name=m.file_name, file_type=m.file_type,
+            thumbnail_url=m.thumbnail_url or None,
+        )
+    event["timestamp"] = m.timestamp.isoformat()
+    return event
+
+
+def fetch(
+    room_id: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = 50,
+) -> Optional[List[Message]]:
+    """Return up to ``limit`` messages, oldest first; None if the anchor id isn't in the room."""
+    pending = writer.pending(room_id)
+    anchor_id = after_id if after_id is not None else before_id
+    anchor: Optional[Tuple] = None
+    if anchor_id is not None:
+        anchor = next(((m.timestamp, m.seq) for m in pending if m.seq == anchor_id), None)
+        if anchor is None:
+            anchor = Message.objects.filter(room_id=room_id, seq=anchor_id).values_list("timestamp", "seq").first()
+        if anchor is None:
+            return None
+
+    qs = Message.objects.filter(room_id=room_id)
+    if after_id is not None:
+        ts, seq = anchor
+        qs = qs.filter(Q(timestamp__gt=ts) | Q(timestamp=ts, seq__gt=seq)).order_by("timestamp", "seq")
+        pending = [m for m in pending if (m.timestamp, m.seq) > anchor]
+    else:
+        if anchor is not None:
+            ts, seq = anchor
+            qs = qs.filter(Q(timestamp__lt=ts) | Q(timestamp=ts, seq__lt=seq))
+            pending = [m for m in pending if (m.timestamp, m.seq) < anchor]
+        qs = qs.order_by("-timestamp", "-seq")
+
+    merged = {m.seq: m for m in qs[:limit]}
+    for m in pending:
+        merged.setdefault(m.seq, m)
+    rows = sorted(merged.values(), key=lambda m: (m.timestamp, m.seq))
+    return rows[:limit] if after_id is not None else rows[-limit:]
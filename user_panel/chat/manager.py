@@ -1,92 +1,295 @@
-from typing import Dict, Set, Tuple, Any
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import AbstractSet, Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple, Union
 from fastapi import WebSocket
 import json
-from asgiref.sync import sync_to_async
-from django.utils import timezone
-from lms.models import UserStatus, LMSUser
-from user_panel.redis_client import get_redis
+from user_panel import metrics, pubsub, wire
+from user_panel.presence import presence
 
+# What to do when a client's outbound queue is full:
+#   drop_oldest  - discard the oldest queued frame
+#   drop_typing  - discard queued typing frames first, then disconnect
+#   disconnect   - close the socket (1013 "try again later")
+CHAT_SLOW_CONSUMER_POLICY = os.getenv("CHAT_SLOW_CONSUMER_POLICY", "drop_typing")
+CHAT_SEND_QUEUE_SIZE = int(os.getenv("CHAT_SEND_QUEUE_SIZE", "256"))
+CHAT_SEND_TIMEOUT = float(os.getenv("CHAT_SEND_TIMEOUT", "10"))
 
-class ConnectionManager:
-    def __init__(self) -> None:
-        self.active: Dict[int, Set[WebSocket]] = {}
-        # Track which users are in which room (locally)
-        self.room_users: Dict[int, Set[int]] = {}
+Frame = Union[str, bytes]
+
+
+def tag(channel: str, data: str) -> str:
+    """Wrap a pre-serialized frame for the multiplexed socket (see user_panel/realtime.py)."""
+    return f'{{"channel": "{channel}", "data": {data}}}'
+
+
+def encode_frame(binary: bool, channel: Optional[str], data: str, message: Optional[dict] = None) -> Frame:
+    """Frame for a JSON payload in a socket's wire format; ``channel`` is set for multiplexed sockets."""
+    if not binary:
+        return tag(channel, data) if channel else data
+    if message is None:
+        message = json.loads(data)
+    return wire.encode({"channel": channel, "data": message} if channel else message)
+
+
+class Connection:
+    """One client socket with a bounded outbound queue drained by its own writer task.
+
+    ``send`` never awaits, so a room broadcast costs one append per socket no
+    matter how slow any single client is. A per-room socket is subscribed to
+    a single room; a multiplexed one (``mux``) to any number, and receives
+    channel-tagged frames.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: int, on_close: Callable[["Connection"], None],
+                 paused: bool = False, mux: bool = False, binary: bool = False) -> None:
+        self.websocket = websocket
+        self.user_id = user_id
+        self.mux = mux
+        self.binary = binary  # negotiated wire.SUBPROTOCOL
+        self.rooms: Set[int] = set()
+        self.queue: Deque[Tuple[Frame, bool]] = deque()  # (frame, droppable typing frame)
+        self.closed = False
+        self.presence_id: Optional[str] = None
+        # Rooms whose live frames are held back until their replay is sent (mux subscribe with since)
+        self.held: Dict[int, List[Tuple[Frame, bool]]] = {}
+        self._on_close = on_close
+        self._close_task: Optional[asyncio.Task] = None  # slow-consumer disconnect
+        self._ready = asyncio.Event()
+        self._resumed = asyncio.Event()
+        if not paused:
+            self._resumed.set()
+        self._task = asyncio.create_task(self._writer())
 
-    async def _update_status(self, user_id: int, is_online: bool):
+    def frame(self, channel: Optional[str], data: str, message: Optional[dict] = None) -> Frame:
+        return encode_frame(self.binary, channel if self.mux else None, data, message)
+
+    def send(self, data: Frame, droppable: bool = False) -> bool:
+        if self.closed:
+            return False
+        if len(self.queue) >= CHAT_SEND_QUEUE_SIZE and not self._make_room(droppable):
+            return False
+        self.queue.append((data, droppable))
+        self._ready.set()
+        return True
+
+    def send_room(self, room_id: int, data: Frame, droppable: bool = False) -> bool:
+        held = self.held.get(room_id)
+        if held is not None:
+            held.append((data, droppable))
+            return True
+        return self.send(data, droppable)
+
+    def _make_room(self, droppable: bool) -> bool:
+        policy = CHAT_SLOW_CONSUMER_POLICY
+        if policy == "drop_oldest":
+            self.queue.popleft()
+            metrics.incr("chat_frames_dropped_total", policy=policy)
+            return True
+        if policy == "drop_typing":
+            if droppable:
+                metrics.incr("chat_frames_dropped_total", policy=policy)
+                return False
+            for i, (_, queued_droppable) in enumerate(self.queue):
+                if queued_droppable:
+                    del self.queue[i]
+                    metrics.incr("chat_frames_dropped_total", policy=policy)
+                    return True
+        if self._close_task is None:
+            metrics.incr("chat_slow_consumer_disconnects_total", policy=policy)
+            self._close_task = asyncio.create_task(self.close(code=1013))
+            self._close_task.add_done_callback(self._log_close_error)
+        return False
+
+    def _log_close_error(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning(f"Could not close slow chat socket of user {self.user_id}: {task.exception()!r}")
+
+    @staticmethod
+    def _frame_id(data: Frame) -> Optional[int]:
+        frame = wire.decode(data, max_bytes=0) if isinstance(data, bytes) else json.loads(data)
+        if "channel" in frame:
+            frame = frame["data"]
+        return frame.get("id")
+
+    def resume(self, replay: Sequence[Frame] = (), replayed_ids: AbstractSet[int] = frozenset()) -> None:
+        """Start sending on a connection registered with ``paused=True``.
+
+        ``replay`` frames go out first; live frames queued meanwhile follow,
+        minus any message already covered by the replay.
+        """
+        live = [f for f in self.queue if not replayed_ids or self._frame_id(f[0]) not in replayed_ids]
+        self.queue = deque([*((d, False) for d in replay), *live])
+        self._resumed.set()
+        self._ready.set()
+
+    def release(self, room_id: int, replay: Sequence[Frame] = (), replayed_ids: AbstractSet[int] = frozenset()) -> None:
+        """Like ``resume`` for one held room of a multiplexed socket."""
+        held = self.held.pop(room_id, [])
+        for data in replay:
+            self.send(data)
+        for data, droppable in held:
+            if not replayed_ids or self._frame_id(data) not in replayed_ids:
+                self.send(data, droppable)
+
+    async def _writer(self) -> None:
         try:
-            def update():
-                user = LMSUser.objects.get(pk=user_id)
-                status, _ = UserStatus.objects.get_or_create(user=user)
-                status.is_online = is_online
-                status.last_seen = timezone.now()
-                status.save()
-            await sync_to_async(update)()
+            await self._resumed.wait()
+            while True:
+                if not self.queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                data, _ = self.queue.popleft()
+                if isinstance(data, bytes):
+                    await asyncio.wait_for(self.websocket.send_bytes(data), CHAT_SEND_TIMEOUT)
+                else:
+                    await asyncio.wait_for(self.websocket.send_text(data), CHAT_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logging.info(f"Dropping chat socket of user {self.user_id}: {e}")
+        finally:
+            self._finish()
+
+    def _finish(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.queue.clear()
+            self._on_close(self)
+
+    async def close(self, code: int = 1000) -> None:
+        self._finish()
+        self._task.cancel()
+        try:
+            await self.websocket.close(code=code)
         except Exception:
             pass
 
-    async def connect(self, websocket: WebSocket, room_id: int, user_id: int) -> None:
-        await websocket.accept()
-        self.active.setdefault(room_id, set()).add(websocket)
-        self.room_users.setdefault(room_id, set()).add(user_id)
-        
-        await self._update_status(user_id, True)
-        
-        redis = await get_redis()
-        if redis:
-            await redis.sadd("online_users", str(user_id))
 
-    async def disconnect(self, websocket: WebSocket, room_id: int, user_id: int) -> None:
-        conns = self.active.get(room_id, set())
-        if websocket in conns:
-            conns.remove(websocket)
-        
+class ConnectionManager:
+    def __init__(self) -> None:
+        self.active: Dict[int, Dict[WebSocket, Connection]] = {}
+        # Local indexes: room -> {user: open sockets}, user -> rooms
+        self.room_users: Dict[int, Dict[int, int]] = {}
+        self.user_rooms: Dict[int, Set[int]] = {}
+
+    def open(self, websocket: WebSocket, user_id: int, paused: bool = False, mux: bool = False,
+             binary: bool = False) -> Connection:
+        return Connection(websocket, user_id, on_close=self._evict, paused=paused, mux=mux, binary=binary)
+
+    def subscribe(self, conn: Connection, room_id: int) -> None:
+        if room_id in conn.rooms:
+            return
+        conn.rooms.add(room_id)
+        self.active.setdefault(room_id, {})[conn.websocket] = conn
+        users = self.room_users.setdefault(room_id, {})
+        users[conn.user_id] = users.get(conn.user_id, 0) + 1
+        self.user_rooms.setdefault(conn.user_id, set()).add(room_id)
+
+    def unsubscribe(self, conn: Connection, room_id: int) -> None:
+        if room_id not in conn.rooms:
+            return
+        conn.rooms.discard(room_id)
+        conn.held.pop(room_id, None)
+        conns = self.active.get(room_id, {})
+        conns.pop(conn.websocket, None)
         if not conns:
-            if room_id in self.room_users:
-                del self.room_users[room_id]
-            if room_id in self.active:
-                del self.active[room_id]
-
-        # Check if user is active in any other room? 
-        # This is a local check. Ideally we should check globally or use Redis refcount.
-        # But for now, we assume if they disconnect from a room, they might still be online elsewhere?
-        # Simpler: just mark offline. If they are in another tab, that tab might send a heartbeat or reconnect?
-        # Actually, if we mark offline here, and they have another tab open, they will show offline until next action.
-        # Let's check if they are in `room_users` for ANY room.
-        
-        still_connected = False
-        for r_users in self.room_users.values():
-            if user_id in r_users:
-                still_connected = True
-                break
-        
-        if not still_connected:
-            await self._update_status(user_id, False)
-
-        redis = await get_redis()
-        if redis:
-            # Only remove if no connections? Redis doesn't track refcount on sadd.
-            # We'll just remove.
-            await redis.srem("online_users", str(user_id))
+            self.active.pop(room_id, None)
+        users = self.room_users.get(room_id, {})
+        remaining = users.get(conn.user_id, 1) - 1
+        if remaining:
+            users[conn.user_id] = remaining
+        else:
+            users.pop(conn.user_id, None)
+            if not users:
+                self.room_users.pop(room_id, None)
+            rooms = self.user_rooms.get(conn.user_id, set())
+            rooms.discard(room_id)
+            if not rooms:
+                self.user_rooms.pop(conn.user_id, None)
+
+    def register(self, websocket: WebSocket, room_id: int, user_id: int, paused: bool = False,
+                 binary: bool = False) -> Connection:
+        conn = self.open(websocket, user_id, paused=paused, binary=binary)
+        self.subscribe(conn, room_id)
+        return conn
+
+    def _evict(self, conn: Connection) -> None:
+        """Forget a closed connection: on disconnect, writer failure or slow-consumer close."""
+        for room_id in list(conn.rooms):
+            self.unsubscribe(conn, room_id)
+        if conn.presence_id is not None:
+            asyncio.create_task(presence.disconnect(conn.presence_id))
+
+    async def _track_presence(self, conn: Connection) -> None:
+        presence_id = await presence.connect(conn.user_id)
+        if conn.closed:
+            await presence.disconnect(presence_id)
+        else:
+            conn.presence_id = presence_id
+
+    async def connect(self, websocket: WebSocket, room_id: int, user_id: int, paused: bool = False) -> Connection:
+        subprotocol = wire.negotiate(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        conn = self.register(websocket, room_id, user_id, paused=paused, binary=subprotocol is not None)
+        await self._track_presence(conn)
+        return conn
+
+    async def connect_mux(self, websocket: WebSocket, user_id: int) -> Connection:
+        subprotocol = wire.negotiate(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        conn = self.open(websocket, user_id, mux=True, binary=subprotocol is not None)
+        await self._track_presence(conn)
+        return conn
+
+    async def disconnect(self, websocket: WebSocket, room_id: int, user_id: int) -> None:
+        conn = self.active.get(room_id, {}).get(websocket)
+        if conn is not None:
+            await conn.close()
+
+    async def deliver_local(self, room_id: int, data: str, message: Optional[dict] = None,
+                            droppable: bool = False) -> None:
+        # Only enqueues; each connection's writer task does the actual send. Each
+        # wire format (plain/tagged, JSON/binary) is encoded once per broadcast.
+        # ``droppable`` frames (typing indicators) are the first to go when a
+        # client's queue is full.
+        frames: Dict[Tuple[bool, bool], Frame] = {}
+        for conn in list(self.active.get(room_id, {}).values()):
+            key = (conn.mux, conn.binary)
+            frame = frames.get(key)
+            if frame is None:
+                frame = frames[key] = conn.frame(f"room:{room_id}", data, message)
+            if conn.mux:
+                conn.send_room(room_id, frame, droppable)
+            else:
+                conn.send(frame, droppable)
 
     async def broadcast(self, room_id: int, message: dict) -> None:
         data = json.dumps(message)
-        # local broadcast
-        conns = self.active.get(room_id, set())
-        for ws in list(conns):
-            try:
-                await ws.send_text(data)
-            except:
-                pass # Handle stale sockets
-        # redis pub
-        redis = await get_redis()
-        if redis:
-            await redis.publish(f"chat:room:{room_id}", data)
+        await self.deliver_local(room_id, data, message)
+        # redis pub (other instances deliver to their own sockets)
+        await pubsub.publish(f"chat:room:{room_id}", data)
+
+    async def _on_remote(self, channel: str, data: str) -> None:
+        room_id = int(channel.rsplit(":", 1)[1])
+        if room_id in self.active:
+            await self.deliver_local(room_id, data)
 
     async def send_personal(self, websocket: WebSocket, message: dict) -> None:
+        for conns in self.active.values():
+            conn = conns.get(websocket)
+            if conn is not None:
+                conn.send(conn.frame("system", json.dumps(message), message))
+                return
         await websocket.send_json(message)
 
     def is_user_connected(self, room_id: int, user_id: int) -> bool:
-        return user_id in self.room_users.get(room_id, set())
+        return user_id in self.room_users.get(room_id, {})
+
+    def rooms_of(self, user_id: int) -> Set[int]:
+        return self.user_rooms.get(user_id, set())
 
 manager = ConnectionManager()
+pubsub.on_pattern("chat:room:*", manager._on_remote)
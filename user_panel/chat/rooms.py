@@ -0,0 +1,85 @@
+"""
+Room state cache
+================
+Member ids, display names and the room name for chat rooms with sockets on
+this process, loaded once when the first socket joins and reused for every
+message, so the chat hot path does no DB reads.
+
+Entries are dropped on "room" invalidations (membership m2m_changed and
+ChatRoom saves/deletes, see lms.signals) and on "user" invalidations for
+rooms the user belongs to (renames, deactivation). Invalidations from other
+processes arrive through Redis like every other cache_invalidated kind.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Set
+
+from asgiref.sync import sync_to_async
+from django.dispatch import receiver
+
+from lms.models import ChatRoom
+from lms.signals import cache_invalidated
+from user_panel.cache import TTLCache
+
+
+@dataclass(frozen=True)
+class RoomState:
+    id: int
+    name: str
+    members: Dict[int, str]  # active member id -> display name
+
+
+def _load(room_id: int) -> Optional[RoomState]:
+    room = ChatRoom.objects.filter(pk=room_id).values("name").first()
+    if room is None:
+        return None
+    members = ChatRoom.members.through.objects.filter(chatroom_id=room_id, lmsuser__is_active=True)
+    return RoomState(
+        id=room_id,
+        name=room["name"] or "Unknown",
+        members={uid: name or "" for uid, name in members.values_list("lmsuser_id", "lmsuser__name")},
+    )
+
+
+class RoomCache:
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._user_rooms: Dict[int, Set[int]] = {}
+        self._generation = 0
+
+    async def get(self, room_id: int) -> Optional[RoomState]:
+        state = self._cache.get(room_id)
+        if state is not None:
+            return state
+        generation = self._generation
+        state = await sync_to_async(_load)(room_id)
+        # Don't cache a load that raced with an invalidation
+        if state is not None and generation == self._generation:
+            self._cache.set(room_id, state)
+            for uid in state.members:
+                self._user_rooms.setdefault(uid, set()).add(room_id)
+        return state
+
+    def invalidate_room(self, room_id: int) -> None:
+        self._generation += 1
+        self._cache.invalidate(room_id)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self._generation += 1
+        for room_id in self._user_rooms.pop(user_id, ()):
+            self._cache.invalidate(room_id)
+
+
+rooms = RoomCache(
+    maxsize=int(os.getenv("ROOM_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("ROOM_CACHE_TTL", "600")),
+)
+
+
+@receiver(cache_invalidated)
+def _drop_room_state(sender, kind, key, **kwargs):
+    if kind == "room":
+        rooms.invalidate_room(int(key))
+    elif kind == "user":
+        rooms.invalidate_user(int(key))
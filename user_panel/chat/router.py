@@ -1,34 +1,50 @@
-from typing import List, Optional
+from typing import List, Optional, Set, Tuple
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, WebSocket, WebSocketDisconnect, status, Query
-from django.utils import timezone as djtz
-from django.conf import settings
-from pathlib import Path
-import uuid
+from django.db.models import Count
+import json
+import logging
 import os
 from asgiref.sync import sync_to_async
 
-from lms.models import ChatRoom, Message, FileAttachment, LMSUser, Notification
+from lms import db_router
+from lms.db_router import replica_reads
+from lms.models import ChatRoom, Message, FileAttachment, LMSUser
 from .schemas import ChatRoomOut, CreateRoomRequest, MessageOut, UploadResponse
 from user_panel.deps import get_current_user
+from user_panel.pagination import Page, paginate
+from lms import unread as unread_counters
+from user_panel import media, previews, storage, unread, wire
 from user_panel.auth import decode_token
 from .manager import manager
-from user_panel.notifications.manager import manager as notif_manager
+from . import history
+from .rooms import rooms
+from .typing_indicators import typing_indicators
+from .writer import writer
+from user_panel.notifications.utils import notify_many
 
-router = APIRouter(prefix="/chat", tags=["chat"])
-
-MEDIA_ROOT = Path(os.getenv("MEDIA_ROOT", settings.BASE_DIR / "media"))
 MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "10"))
+CHAT_REPLAY_LIMIT = int(os.getenv("CHAT_REPLAY_LIMIT", "200"))
 ALLOWED_MIME = {
     "image/jpeg", "image/png", "image/gif", "image/webp",
     "application/pdf", "application/msword",
     "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
 }
 
+# Oversized uploads are rejected while the body is still arriving
+router = APIRouter(prefix="/chat", tags=["chat"], route_class=storage.limited_body_route(MAX_FILE_SIZE_MB * 1024 * 1024))
+
 
 @router.get("/rooms/", response_model=List[ChatRoomOut])
-def list_rooms(user: LMSUser = Depends(get_current_user)):
-    rooms = ChatRoom.objects.filter(members=user).distinct()
-    return [ChatRoomOut(id=r.id, name=r.name, room_type=r.room_type, member_count=r.members.count()) for r in rooms]
+@replica_reads()
+def list_rooms(page: Page = Depends(), user: LMSUser = Depends(get_current_user)):
+    # Filter through the membership table so the member count covers all members
+    my_rooms = ChatRoom.members.through.objects.filter(lmsuser_id=user.id).values("chatroom_id")
+    return paginate(
+        ChatRoom.objects.filter(id__in=my_rooms).annotate(member_count=Count("members")),
+        page,
+        order=("created_at", "id"),
+        fields={f: f for f in ChatRoomOut.model_fields},
+    )
 
 
 @router.post("/rooms/", response_model=ChatRoomOut)
@@ -37,27 +53,34 @@ def create_room(payload: CreateRoomRequest, user: LMSUser = Depends(get_current_
     # Actually, for private rooms, maybe we should check if one exists with same members?
     # For now, let's just create.
     room = ChatRoom.objects.create(name=payload.name, room_type=payload.room_type, created_by=user)
-    room.members.add(user)
-    if payload.member_ids:
-        for mid in payload.member_ids:
-            try:
-                room.members.add(LMSUser.objects.get(pk=mid))
-            except LMSUser.DoesNotExist:
-                continue
+    # One m2m_changed (and one room-cache invalidation) for the whole member list
+    others = LMSUser.objects.filter(pk__in=payload.member_ids or []).values_list("id", flat=True)
+    room.members.add(user.id, *others)
     # Refetch to ensure count is correct?
     return ChatRoomOut(id=room.id, name=room.name, room_type=room.room_type, member_count=room.members.count())
 
 
 @router.get("/rooms/{room_id}/messages/", response_model=List[MessageOut])
-def room_messages(room_id: int, limit: int = Query(50, le=200), user: LMSUser = Depends(get_current_user)):
-    if not ChatRoom.objects.filter(pk=room_id, members=user).exists():
+def room_messages(
+    room_id: int,
+    limit: int = Query(50, le=200),
+    before_id: Optional[int] = Query(None, description="Return messages older than this message"),
+    after_id: Optional[int] = Query(None, description="Return messages newer than this message"),
+    user: LMSUser = Depends(get_current_user),
+):
+    if not ChatRoom.objects.filter(pk=room_id, members=user.id).exists():
         raise HTTPException(status_code=403, detail="Not a room member")
-    msgs = Message.objects.filter(room_id=room_id).order_by("-timestamp")[:limit][::-1]
+    if before_id is not None and after_id is not None:
+        raise HTTPException(status_code=400, detail="Use either before_id or after_id")
+    msgs = history.fetch(room_id, before_id=before_id, after_id=after_id, limit=limit)
+    if msgs is None:
+        raise HTTPException(status_code=400, detail="Unknown message id")
     return [
         MessageOut(
-            id=m.id, room_id=room_id, sender_id=m.sender_id, sender_username=m.sender_username,
+            id=m.seq, room_id=room_id, sender_id=m.sender_id, sender_username=m.sender_username,
             content=m.content, message_type=m.message_type, file_url=m.file_url or None,
-            file_name=m.file_name or None, file_type=m.file_type or None, timestamp=m.timestamp.isoformat()
+            file_name=m.file_name or None, file_type=m.file_type or None,
+            thumbnail_url=m.thumbnail_url or None, timestamp=m.timestamp.isoformat()
         ) for m in msgs
     ]
 
@@ -72,24 +95,39 @@ def join_room(room_id: int, user: LMSUser = Depends(get_current_user)):
     return {"status": "ok"}
 
 
+@router.post("/rooms/{room_id}/read/")
+async def mark_room_read(
+    room_id: int,
+    message_id: Optional[int] = Query(None, description="Last message read; defaults to the newest"),
+    user: LMSUser = Depends(get_current_user),
+):
+    room = await rooms.get(room_id)
+    if room is None or user.id not in room.members:
+        raise HTTPException(status_code=403, detail="Not a room member")
+    # Messages still queued in the writer aren't in the database yet
+    pending = writer.pending(room_id)
+    if message_id is None:
+        latest = await sync_to_async(
+            Message.objects.filter(room_id=room_id).order_by("-seq").values_list("seq", flat=True).first
+        )()
+        message_id = max([latest or 0] + [m.seq for m in pending])
+    unflushed = sum(1 for m in pending if m.seq > message_id and m.sender_id != user.id)
+    left = await sync_to_async(unread_counters.mark_room_read)(user.id, room_id, message_id, unflushed)
+    return {"status": "ok", "last_read_id": message_id, "unread": left}
+
+
 @router.post("/upload/", response_model=UploadResponse)
-def upload_file(file: UploadFile = File(...), user: LMSUser = Depends(get_current_user)):
+async def upload_file(file: UploadFile = File(...), user: LMSUser = Depends(get_current_user)):
     if file.content_type not in ALLOWED_MIME:
         raise HTTPException(status_code=400, detail="Unsupported file type")
-    data = file.file.read()
-    size = len(data)
-    if size > MAX_FILE_SIZE_MB * 1024 * 1024:
-        raise HTTPException(status_code=413, detail="File too large")
-    date_folder = djtz.now().date().isoformat()
-    folder = MEDIA_ROOT / "chat_files" / date_folder
-    folder.mkdir(parents=True, exist_ok=True)
-    name = f"{uuid.uuid4().hex}_{file.filename}"
-    path = folder / name
-    with open(path, "wb") as f:
-        f.write(data)
-    rel = str(path.relative_to(MEDIA_ROOT)).replace("\\", "/")
-    url = f"/media/{rel}"
-    return UploadResponse(file_url=url, file_name=file.filename, file_type=file.content_type, file_size=size)
+    attachment = await storage.save(file, MAX_FILE_SIZE_MB * 1024 * 1024, user_id=user.id)
+    # Send thumbnail_url back in the "file" frame so room members get it too
+    thumbnail_url = await previews.derive(attachment)
+    return UploadResponse(
+        file_url=storage.blob_url(attachment.blob_id), file_name=attachment.file_name,
+        file_type=attachment.file_type, file_size=attachment.file_size, attachment_id=attachment.id,
+        thumbnail_url=thumbnail_url,
+    )
 
 
 @router.get("/rooms/{room_id}/")
@@ -101,8 +139,103 @@ def room_detail(room_id: int, user: LMSUser = Depends(get_current_user)):
     return {"id": r.id, "name": r.name, "room_type": r.room_type, "member_count": r.members.count()}
 
 
+async def replay_frames(room_id: int, since: int) -> Tuple[List[str], Set[int]]:
+    """Frames for the messages after ``since`` and their ids, for a reconnecting client."""
+    try:
+        missed = await sync_to_async(history.fetch)(room_id, after_id=since, limit=CHAT_REPLAY_LIMIT + 1)
+    except Exception as e:
+        logging.warning(f"Chat replay for room {room_id} failed: {e}")
+        missed = None
+    if missed is None:
+        # Unknown anchor: the client should reload history over HTTP
+        return [json.dumps({"event": "resync", "room_id": room_id})], set()
+    frames = [json.dumps(history.message_event(m)) for m in missed[:CHAT_REPLAY_LIMIT]]
+    if len(missed) > CHAT_REPLAY_LIMIT:
+        frames.append(json.dumps({"event": "resync", "room_id": room_id, "after_id": missed[CHAT_REPLAY_LIMIT - 1].seq}))
+    return frames, {m.seq for m in missed[:CHAT_REPLAY_LIMIT]}
+
+
+async def _pin_sender(user_id: int) -> None:
+    # Not an HTTP request, so the router can't see this write; keep the
+    # sender's /chat/rooms/ reads on the primary as after any other write
+    if db_router.replica_enabled():
+        await sync_to_async(db_router.pin)(user_id)
+
+
+def _shared_attachment(user_id: int, attachment_id: object) -> Optional[FileAttachment]:
+    """The upload a file message points at: the sender's own, or one they can already read."""
+    if not isinstance(attachment_id, int):
+        return None
+    attachment = FileAttachment.objects.filter(pk=attachment_id, blob__isnull=False).first()
+    if attachment is None:
+        return None
+    if attachment.uploaded_by_id != user_id and not media.can_read(user_id, attachment.blob_id):
+        return None
+    return attachment
+
+
+async def handle_chat_frame(room_id: int, user_id: int, data: dict) -> bool:
+    """Handle one client frame for ``room_id``; False once the user is no longer a member."""
+    # Cached; reloaded only after a membership/profile change
+    room = await rooms.get(room_id)
+    if room is None or user_id not in room.members:
+        return False
+    sender_name = room.members[user_id]
+    msg_type = data.get("type")
+
+    if msg_type == "typing":
+        # Coalesced into one frame per room per TYPING_INTERVAL
+        typing_indicators.typing(room_id, user_id)
+
+    elif msg_type == "stop_typing":
+        typing_indicators.stop_typing(room_id, user_id)
+
+    elif msg_type == "text":
+        content = data.get("content", "")
+        m = await writer.write(
+            room_id=room_id, sender_id=user_id, sender_username=sender_name,
+            content=content, message_type="text"
+        )
+        await _pin_sender(user_id)
+        await unread.message_posted(room_id, user_id)
+        
+        await manager.broadcast(room_id, history.message_event(m))
+        
+        # Notifications
+        msg_preview = content[:30] + "..." if len(content) > 30 else content
+        notif_msg = f"New message from {sender_name} in {room.name}: {msg_preview}"
+        offline = [mid for mid in room.members if mid != user_id and not manager.is_user_connected(room_id, mid)]
+        await notify_many(offline, notif_msg, email=False)
+
+    elif msg_type == "file":
+        # The message grants every room member read access to the blob, so it
+        # must name an upload (attachment_id from /chat/upload) the sender can
+        # read, never a free-form URL
+        attachment = await sync_to_async(_shared_attachment)(user_id, data.get("attachment_id"))
+        if attachment is None:
+            return True
+        file_url = storage.blob_url(attachment.blob_id)
+        m = await writer.write(
+            room_id=room_id, sender_id=user_id, sender_username=sender_name,
+            content="", message_type="file",
+            file_url=file_url, file_name=attachment.file_name, file_type=attachment.file_type,
+            thumbnail_url=previews.thumbnail_url(file_url) if attachment.thumbnail_path else "",
+        )
+        await _pin_sender(user_id)
+        await unread.message_posted(room_id, user_id)
+        
+        await manager.broadcast(room_id, history.message_event(m))
+        
+        # Notifications for file
+        notif_msg = f"New file from {sender_name} in {room.name}"
+        offline = [mid for mid in room.members if mid != user_id and not manager.is_user_connected(room_id, mid)]
+        await notify_many(offline, notif_msg, email=False)
+
+    return True
+
+
 @router.websocket("/ws/chat/{room_id}")
-async def chat_ws(websocket: WebSocket, room_id: int, token: str):
+async def chat_ws(websocket: WebSocket, room_id: int, token: str, since: Optional[int] = None):
     # Support "Bearer <token>" format in query param if sent that way, though usually just token
     if token.startswith("Bearer "):
         token = token.split(" ")[1]
@@ -113,105 +246,25 @@ async def chat_ws(websocket: WebSocket, room_id: int, token: str):
         return
     user_id = int(payload["sub"])
     
-    # Helper for async DB calls
-    def get_sender():
-        return LMSUser.objects.get(pk=user_id)
-    
-    def create_message(**kwargs):
-        return Message.objects.create(**kwargs)
-        
-    def get_room_members_ids(rid):
-        try:
-            r = ChatRoom.objects.get(pk=rid)
-            return list(r.members.values_list('id', flat=True)), r.name
-        except ChatRoom.DoesNotExist:
-            return [], "Unknown"
-
-    def create_notification(**kwargs):
-        return Notification.objects.create(**kwargs)
+    room = await rooms.get(room_id)
+    if room is None or user_id not in room.members:
+        await websocket.close(code=4003)
+        return
 
     try:
-        await manager.connect(websocket, room_id, user_id)
+        # With ?since=<message id>, missed messages are replayed before live traffic
+        conn = await manager.connect(websocket, room_id, user_id, paused=since is not None)
+        if since is not None:
+            frames, ids = await replay_frames(room_id, since)
+            conn.resume([conn.frame(None, f) for f in frames], ids)
         
         while True:
-            data = await websocket.receive_json()
-            msg_type = data.get("type")
-            
-            if msg_type in ("typing", "stop_typing"):
-                await manager.broadcast(room_id, {"event": msg_type, "user_id": user_id})
-                continue
-            
-            if msg_type == "text":
-                content = data.get("content", "")
-                sender = await sync_to_async(get_sender)()
-                
-                m = await sync_to_async(create_message)(
-                    room_id=room_id, sender=sender, sender_username=sender.name,
-                    content=content, message_type="text"
-                )
-                
-                await manager.broadcast(room_id, {
-                    "event": "message",
-                    "id": m.id,
-                    "room_id": room_id,
-                    "sender_id": user_id,
-                    "sender_username": sender.name,
-                    "content": content,
-                    "message_type": "text",
-                    "timestamp": m.timestamp.isoformat(),
-                })
-                
-                # Notifications
-                member_ids, room_name = await sync_to_async(get_room_members_ids)(room_id)
-                msg_preview = content[:30] + "..." if len(content) > 30 else content
-                notif_msg = f"New message from {sender.name} in {room_name}: {msg_preview}"
-                
-                for mid in member_ids:
-                    if mid != user_id and not manager.is_user_connected(room_id, mid):
-                        n = await sync_to_async(create_notification)(user_id=mid, message=notif_msg)
-                        await notif_manager.send_notification(mid, {
-                            "id": n.id,
-                            "message": n.message,
-                            "is_read": n.is_read,
-                            "created_at": n.created_at.isoformat()
-                        })
-
-            elif msg_type == "file":
-                sender = await sync_to_async(get_sender)()
-                m = await sync_to_async(create_message)(
-                    room_id=room_id, sender=sender, sender_username=sender.name,
-                    content="", message_type="file",
-                    file_url=data.get("file_url",""), file_name=data.get("file_name",""),
-                    file_type=data.get("file_type","")
-                )
-                
-                await manager.broadcast(room_id, {
-                    "event": "message",
-                    "id": m.id,
-                    "room_id": room_id,
-                    "sender_id": user_id,
-                    "sender_username": sender.name,
-                    "content": "",
-                    "message_type": "file",
-                    "file_url": m.file_url,
-                    "file_name": m.file_name,
-                    "file_type": m.file_type,
-                    "timestamp": m.timestamp.isoformat(),
-                })
-                
-                # Notifications for file
-                member_ids, room_name = await sync_to_async(get_room_members_ids)(room_id)
-                notif_msg = f"New file from {sender.name} in {room_name}"
-                
-                for mid in member_ids:
-                    if mid != user_id and not manager.is_user_connected(room_id, mid):
-                        n = await sync_to_async(create_notification)(user_id=mid, message=notif_msg)
-                        await notif_manager.send_notification(mid, {
-                            "id": n.id,
-                            "message": n.message,
-                            "is_read": n.is_read,
-                            "created_at": n.created_at.isoformat()
-                        })
+            data = await wire.receive(websocket)
+            if not await handle_chat_frame(room_id, user_id, data):
+                await websocket.close(code=4003)
+                break
 
     except WebSocketDisconnect:
+        pass
+    finally:
         await manager.disconnect(websocket, room_id, user_id)
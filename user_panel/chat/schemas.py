@@ -22,6 +22,7 @@ class MessageOut(BaseModel):
     file_url: str | None = None
     file_name: str | None = None
     file_type: str | None = None
+    thumbnail_url: str | None = None
     timestamp: str
 
 class UploadResponse(BaseModel):
@@ -29,4 +30,6 @@ class UploadResponse(BaseModel):
     file_name: str
     file_type: str
     file_size: int
+    attachment_id: int | None = None
+    thumbnail_url: str | None = None
 
@@ -0,0 +1,124 @@
+import asyncio
+from unittest import mock
+
+from django.test import TestCase
+
+from lms import ids
+from lms.models import ChatRoom, LMSUser, Message
+from user_panel.chat import writer as writer_module
+from user_panel.chat.writer import MessageWriter
+
+
+class WriterTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = LMSUser.objects.create(email="writer@example.com", name="Writer", password_hash="!")
+        cls.room = ChatRoom.objects.create(name="writer", created_by=cls.user)
+        cls.room.members.add(cls.user)
+
+    def setUp(self):
+        # No Redis for the id lease or broadcasts
+        for target, attribute, value in (
+            (ids, "get_redis", mock.Mock(side_effect=ConnectionError("no redis"))),
+            (writer_module.manager, "broadcast", mock.AsyncMock()),
+        ):
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.broadcast = writer_module.manager.broadcast
+
+    async def write(self, writer: MessageWriter, content: str) -> Message:
+        return await writer.write(
+            room_id=self.room.id, sender_id=self.user.id, sender_username="Writer", content=content, message_type="text"
+        )
+
+    async def stored(self):
+        return [(m.seq, m.content) async for m in Message.objects.filter(room=self.room).order_by("seq")]
+
+    async def started(self, **settings) -> MessageWriter:
+        # A long flush interval keeps the background task out of the way unless a test wants it
+        settings.setdefault("CHAT_WRITE_FLUSH_MS", 60_000)
+        for name, value in settings.items():
+            patcher = mock.patch.object(writer_module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        writer = MessageWriter("group")
+        with self.assertLogs(level="WARNING"):
+            await writer.start()
+        return writer
+
+    async def stop(self, writer: MessageWriter) -> None:
+        with self.assertLogs(level="WARNING"):
+            await writer.stop()
+
+
+class SeqOrderingTests(WriterTestCase):
+    async def test_seq_follows_write_order(self):
+        writer = await self.started()
+        written = [await self.write(writer, f"m{i}") for i in range(20)]
+        await writer.flush()
+        seqs = [m.seq for m in written]
+        self.assertEqual(seqs, sorted(set(seqs)))
+        self.assertEqual(await self.stored(), [(m.seq, m.content) for m in written])
+        await self.stop(writer)
+
+    async def test_sync_mode_saves_before_returning(self):
+        writer = MessageWriter("sync")
+        m = await self.write(writer, "now")
+        self.assertEqual(await self.stored(), [(m.seq, "now")])
+        self.assertIsNotNone(m.pk)
+
+
+class GroupCommitTests(WriterTestCase):
+    async def test_writes_are_queued_until_flushed(self):
+        writer = await self.started()
+        written = [await self.write(writer, f"m{i}") for i in range(3)]
+        self.assertEqual(await self.stored(), [])
+        self.assertEqual(writer.pending(self.room.id), written)
+        self.assertEqual(await writer.flush(), 0)
+        self.assertEqual(len(await self.stored()), 3)
+        self.assertEqual(writer.pending(self.room.id), [])
+        await self.stop(writer)
+
+    async def test_background_task_flushes_after_the_interval(self):
+        writer = await self.started(CHAT_WRITE_FLUSH_MS=10)
+        await self.write(writer, "soon")
+        await asyncio.sleep(0.3)
+        self.assertEqual([content for _, content in await self.stored()], ["soon"])
+        await self.stop(writer)
+
+    async def test_full_batch_is_flushed_without_waiting(self):
+        writer = await self.started(CHAT_WRITE_BATCH_SIZE=3)
+        for i in range(3):
+            await self.write(writer, f"m{i}")
+        await asyncio.sleep(0.3)
+        self.assertEqual(len(await self.stored()), 3)
+        await self.stop(writer)
+
+    async def test_stop_flushes_what_is_queued(self):
+        writer = await self.started()
+        await self.write(writer, "last")
+        await self.stop(writer)
+        self.assertEqual([content for _, content in await self.stored()], ["last"])
+
+    async def test_failed_insert_is_retried_then_reported(self):
+        writer = await self.started(CHAT_WRITE_MAX_ATTEMPTS=2)
+        existing = await self.write(MessageWriter("sync"), "existing")
+        first, bad, last = [await self.write(writer, f"m{i}") for i in range(3)]
+        bad.seq = existing.seq  # violates the unique constraint
+
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(await writer.flush(), 1)
+        # The rest of the batch is saved; the failed message waits for the next flush
+        self.assertEqual([seq for seq, _ in await self.stored()], sorted([existing.seq, first.seq, last.seq]))
+        self.assertEqual(writer.pending(self.room.id), [bad])
+        self.broadcast.assert_not_called()
+
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(await writer.flush(), 1)
+        self.assertEqual(writer.pending(self.room.id), [])
+        self.broadcast.assert_awaited_once_with(
+            self.room.id,
+            {"event": "message_failed", "id": existing.seq, "room_id": self.room.id, "sender_id": self.user.id},
+        )
+        await self.stop(writer)
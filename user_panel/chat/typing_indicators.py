@@ -0,0 +1,228 @@
+"""
+Typing indicators
+=================
+Clients send ``typing`` on keystrokes and ``stop_typing`` when they stop;
+neither is rebroadcast as is. Each process keeps who is typing per room,
+with every ``typing`` frame pushing the user's expiry ``TYPING_TTL``
+seconds out, and every ``TYPING_INTERVAL`` seconds sends rooms whose set
+changed a single aggregated frame:
+
+    {"event": "typing", "room_id": 5, "user_ids": [3, 8]}
+
+An empty ``user_ids`` means nobody is typing any more. Users stop typing
+when they send ``stop_typing``, their expiry passes or their last socket in
+the room closes.
+
+Across nodes, each process publishes its own typers for a room on
+``chat:typing:<room_id>`` only when that set changes (plus a refresh before
+it would expire remotely), and only if another node has sockets in the room.
+Nodes register the rooms they serve in ``chat:typing:nodes:<room_id>`` (a
+ZSET of node ids scored by expiry, refreshed every ``TYPING_NODE_TTL / 3``).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from user_panel import metrics, pubsub
+from user_panel.redis_client import get_redis
+from .manager import manager
+
+TYPING_INTERVAL = float(os.getenv("TYPING_INTERVAL", "1"))
+TYPING_TTL = float(os.getenv("TYPING_TTL", "6"))
+TYPING_NODE_TTL = int(os.getenv("TYPING_NODE_TTL", "30"))
+
+TYPING_CHANNEL = "chat:typing:{}"
+TYPING_NODES_KEY = "chat:typing:nodes:{}"
+
+# How long a "does any other node serve this room" answer is reused
+_NODE_CHECK_INTERVAL = 5.0
+
+
+class TypingAggregator:
+    def __init__(self) -> None:
+        self.local: Dict[int, Dict[int, float]] = {}  # room -> {user: expiry} for this process's sockets
+        self.remote: Dict[int, Dict[str, Tuple[FrozenSet[int], float]]] = {}  # room -> {node: (users, expiry)}
+        self._dirty: Set[int] = set()  # rooms whose aggregated set may have changed
+        self._changed: Set[int] = set()  # rooms whose local set changed and should be published
+        self._sent: Dict[int, List[int]] = {}  # last non-empty user_ids sent per room
+        self._published: Dict[int, float] = {}
+        self._has_remote: Dict[int, Tuple[bool, float]] = {}
+        self._registered: Set[int] = set()
+        self._registered_at = float("-inf")
+        self._task: Optional[asyncio.Task] = None
+
+    def _mark(self, room_id: int) -> None:
+        self._dirty.add(room_id)
+        self._changed.add(room_id)
+
+    def typing(self, room_id: int, user_id: int) -> None:
+        users = self.local.setdefault(room_id, {})
+        if user_id not in users:
+            self._mark(room_id)
+        else:
+            metrics.incr("chat_typing_frames_coalesced_total")
+        users[user_id] = time.monotonic() + TYPING_TTL
+
+    def stop_typing(self, room_id: int, user_id: int) -> None:
+        users = self.local.get(room_id)
+        if users and users.pop(user_id, None) is not None:
+            if not users:
+                del self.local[room_id]
+            self._mark(room_id)
+
+    def users(self, room_id: int) -> List[int]:
+        ids = set(self.local.get(room_id, ()))
+        for users, _ in self.remote.get(room_id, {}).values():
+            ids |= users
+        return sorted(ids)
+
+    async def _on_remote(self, channel: str, data: str) -> None:
+        room_id = int(channel.rsplit(":", 1)[1])
+        if room_id not in manager.active:
+            return
+        update = json.loads(data)
+        nodes = self.remote.setdefault(room_id, {})
+        if update["user_ids"]:
+            nodes[update["node"]] = (frozenset(update["user_ids"]), time.monotonic() + TYPING_TTL)
+        else:
+            nodes.pop(update["node"], None)
+            if not nodes:
+                del self.remote[room_id]
+        self._dirty.add(room_id)
+
+    def _expire(self, now: float) -> None:
+        for room_id, users in list(self.local.items()):
+            for user_id, expires in list(users.items()):
+                if expires <= now or not manager.is_user_connected(room_id, user_id):
+                    del users[user_id]
+                    self._mark(room_id)
+            if not users:
+                del self.local[room_id]
+        for room_id, nodes in list(self.remote.items()):
+            for node, (_, expires) in list(nodes.items()):
+                if expires <= now or room_id not in manager.active:
+                    del nodes[node]
+                    self._dirty.add(room_id)
+            if not nodes:
+                del self.remote[room_id]
+
+    async def _deliver(self, rooms: Iterable[int]) -> None:
+        for room_id in rooms:
+            user_ids = self.users(room_id)
+            if self._sent.get(room_id, []) == user_ids:
+                continue
+            if user_ids:
+                self._sent[room_id] = user_ids
+            else:
+                self._sent.pop(room_id, None)
+            await manager.deliver_local(
+                room_id, json.dumps({"event": "typing", "room_id": room_id, "user_ids": user_ids}), droppable=True
+            )
+
+    async def _remote_rooms(self, redis, rooms: List[int], now: float) -> List[int]:
+        """The subset of ``rooms`` that another node has sockets in."""
+        stale = [r for r in rooms if now - self._has_remote.get(r, (False, float("-inf")))[1] >= _NODE_CHECK_INTERVAL]
+        if stale:
+            pipe = redis.pipeline(transaction=False)
+            for room_id in stale:
+                pipe.zrangebyscore(TYPING_NODES_KEY.format(room_id), time.time(), "+inf")
+            for room_id, nodes in zip(stale, await pipe.execute()):
+                self._has_remote[room_id] = (any(n != pubsub.ORIGIN_ID for n in nodes), now)
+        return [r for r in rooms if self._has_remote[r][0]]
+
+    async def _publish(self, rooms: Set[int], now: float) -> None:
+        # Keep remote copies of our typers alive while they keep typing
+        for room_id in self.local:
+            if now - self._published.get(room_id, float("-inf")) >= TYPING_TTL / 2:
+                rooms.add(room_id)
+        for room_id in rooms:
+            if room_id in self.local:
+                self._published[room_id] = now
+            else:
+                self._published.pop(room_id, None)
+        if not rooms:
+            return
+        redis = await get_redis()
+        if redis is None:
+            return
+        try:
+            targets = await self._remote_rooms(redis, sorted(rooms), now)
+            if not targets:
+                return
+            pipe = redis.pipeline(transaction=False)
+            for room_id in targets:
+                update = {"node": pubsub.ORIGIN_ID, "user_ids": sorted(self.local.get(room_id, ()))}
+                pipe.publish(TYPING_CHANNEL.format(room_id), pubsub.envelope(json.dumps(update)))
+            await pipe.execute()
+        except Exception as e:
+            logging.warning(f"Could not publish typing state: {e}")
+
+    async def _register(self, local_rooms: Set[int], now: float) -> None:
+        refresh = now - self._registered_at >= TYPING_NODE_TTL / 3
+        add = local_rooms if refresh else local_rooms - self._registered
+        gone = self._registered - local_rooms
+        if not add and not gone:
+            return
+        redis = await get_redis()
+        if redis is None:
+            return
+        try:
+            expires = time.time() + TYPING_NODE_TTL
+            pipe = redis.pipeline(transaction=False)
+            for room_id in add:
+                key = TYPING_NODES_KEY.format(room_id)
+                pipe.zadd(key, {pubsub.ORIGIN_ID: expires})
+                pipe.zremrangebyscore(key, "-inf", time.time())
+                pipe.expire(key, TYPING_NODE_TTL)
+            for room_id in gone:
+                pipe.zrem(TYPING_NODES_KEY.format(room_id), pubsub.ORIGIN_ID)
+            await pipe.execute()
+        except Exception as e:
+            logging.warning(f"Could not register typing rooms: {e}")
+            return
+        for room_id in gone:
+            self._has_remote.pop(room_id, None)
+        self._registered = local_rooms
+        if refresh:
+            self._registered_at = now
+
+    async def tick(self) -> None:
+        now = time.monotonic()
+        self._expire(now)
+        dirty, self._dirty = self._dirty, set()
+        changed, self._changed = self._changed, set()
+        await self._deliver(dirty)
+        await self._publish(changed, now)
+        await self._register(set(manager.active), now)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(TYPING_INTERVAL)
+            try:
+                await self.tick()
+            except Exception as e:
+                logging.warning(f"Typing indicator tick failed: {e}")
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.local.clear()
+        # Leave every room so other nodes stop publishing to this one
+        await self._register(set(), time.monotonic())
+
+
+typing_indicators = TypingAggregator()
+pubsub.on_pattern("chat:typing:*", typing_indicators._on_remote)
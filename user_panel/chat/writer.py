@@ -0,0 +1,183 @@
+"""
+Chat message writer
+===================
+Assigns each chat message its id (``seq``, see lms/ids.py) and timestamp in
+process so it can be broadcast right away, then persists it according to
+``CHAT_WRITE_MODE``:
+
+  sync   - ``write`` inserts the row before returning (one INSERT per message)
+           and raises if it fails
+  group  - ``write`` only queues the row; a background task inserts queued
+           rows with ``bulk_create`` every ``CHAT_WRITE_FLUSH_MS`` ms or once
+           ``CHAT_WRITE_BATCH_SIZE`` rows are waiting (group commit). A crash
+           loses at most the last unflushed batch. Until ``start`` has run
+           (e.g. outside the app lifespan) writes behave as in sync mode.
+
+In group mode a message whose insert fails stays queued and is retried with
+the next flushes. After ``CHAT_WRITE_MAX_ATTEMPTS`` failures it is dropped
+and the room (sender included) gets a ``message_failed`` frame with its id,
+so clients can take back what they already showed.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+
+from lms import ids
+from lms.models import Message
+from user_panel import metrics
+from .manager import manager
+
+CHAT_WRITE_MODE = os.getenv("CHAT_WRITE_MODE", "group")
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "200"))
+CHAT_WRITE_FLUSH_MS = float(os.getenv("CHAT_WRITE_FLUSH_MS", "20"))
+CHAT_WRITE_MAX_ATTEMPTS = int(os.getenv("CHAT_WRITE_MAX_ATTEMPTS", "5"))
+CHAT_WRITE_RETRY_SECONDS = 1.0
+
+
+def _persist(batch: List[Message]) -> List[Message]:
+    """Insert ``batch``; returns the messages that could not be inserted."""
+    try:
+        with transaction.atomic():
+            Message.objects.bulk_create(batch)
+        return []
+    except Exception as e:
+        if len(batch) == 1:
+            logging.warning(f"Chat message {batch[0].seq} in room {batch[0].room_id} failed: {e}")
+            return batch
+        logging.warning(f"Chat batch of {len(batch)} failed, retrying one by one: {e}")
+    failed = []
+    for m in batch:
+        try:
+            with transaction.atomic():
+                Message.objects.bulk_create([m])
+        except Exception as e:
+            logging.warning(f"Chat message {m.seq} in room {m.room_id} failed: {e}")
+            failed.append(m)
+    return failed
+
+
+class MessageWriter:
+    def __init__(self, mode: str = CHAT_WRITE_MODE) -> None:
+        if mode not in ("sync", "group"):
+            raise ValueError(f"Unknown CHAT_WRITE_MODE: {mode}")
+        self.mode = mode
+        self._pending: List[Message] = []
+        self._inflight: List[Message] = []
+        self._attempts: Dict[int, int] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lease_task: Optional[asyncio.Task] = None
+
+    async def write(self, **fields) -> Message:
+        """Build a message with its final id/timestamp and persist or queue it."""
+        m = Message(seq=ids.generator.next_id(), timestamp=timezone.now(), **fields)
+        if self.mode == "sync" or self._task is None:
+            if await sync_to_async(_persist)([m]):
+                metrics.incr("chat_messages_dropped_total")
+                raise RuntimeError(f"Could not save chat message in room {m.room_id}")
+            metrics.incr("chat_messages_persisted_total")
+            return m
+        self._pending.append(m)
+        if len(self._pending) == 1 or len(self._pending) >= CHAT_WRITE_BATCH_SIZE:
+            self._wakeup.set()
+        return m
+
+    def pending(self, room_id: int) -> List[Message]:
+        """Messages of ``room_id`` accepted but not yet committed (history reads merge these in)."""
+        return [m for m in self._inflight + self._pending if m.room_id == room_id]
+
+    async def _drop(self, m: Message) -> None:
+        logging.error(f"Dropped chat message {m.seq} in room {m.room_id} from user {m.sender_id}")
+        metrics.incr("chat_messages_dropped_total")
+        try:
+            await manager.broadcast(
+                m.room_id, {"event": "message_failed", "id": m.seq, "room_id": m.room_id, "sender_id": m.sender_id}
+            )
+        except Exception as e:
+            logging.warning(f"Could not report dropped chat message {m.seq}: {e}")
+
+    async def flush(self, retry: bool = True) -> int:
+        """Insert everything queued so far; returns how many messages failed.
+
+        Failed messages go back to the front of the queue for the next flush,
+        or are dropped (and reported) once out of attempts or ``retry`` is off.
+        """
+        queued, self._pending = self._pending, []
+        failed: List[Message] = []
+        for i in range(0, len(queued), CHAT_WRITE_BATCH_SIZE):
+            batch = queued[i:i + CHAT_WRITE_BATCH_SIZE]
+            self._inflight = batch
+            try:
+                batch_failed = await sync_to_async(_persist)(batch)
+            finally:
+                self._inflight = []
+            metrics.incr("chat_messages_persisted_total", len(batch) - len(batch_failed))
+            failed += batch_failed
+        retried, failed_seqs = [], {m.seq for m in failed}
+        for m in failed:
+            attempts = self._attempts.pop(m.seq, 0) + 1
+            if retry and attempts < CHAT_WRITE_MAX_ATTEMPTS:
+                self._attempts[m.seq] = attempts
+                retried.append(m)
+            else:
+                await self._drop(m)
+        for m in queued:
+            if m.seq not in failed_seqs:
+                self._attempts.pop(m.seq, None)
+        self._pending[:0] = retried
+        return len(failed)
+
+    async def _run(self) -> None:
+        while True:
+            # Woken by the first queued message, then by a full batch or the timeout
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if len(self._pending) < CHAT_WRITE_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), CHAT_WRITE_FLUSH_MS / 1000)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            try:
+                if await self.flush():
+                    # Give the database a moment before retrying what failed
+                    await asyncio.sleep(CHAT_WRITE_RETRY_SECONDS)
+            except Exception as e:
+                logging.warning(f"Chat message flush failed: {e}")
+            if self._pending:
+                self._wakeup.set()
+            metrics.set_gauge("chat_write_queue_depth", len(self._pending))
+
+    async def _renew_lease(self) -> None:
+        while True:
+            await asyncio.sleep(ids.LEASE_SECONDS / 3)
+            await sync_to_async(ids.generator.lease)()
+
+    async def start(self) -> None:
+        # Lease the id worker off the event loop; renewed well before next_id would
+        await sync_to_async(ids.generator.lease)()
+        self._lease_task = asyncio.create_task(self._renew_lease())
+        if self.mode == "group" and self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        for task in (self._task, self._lease_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._lease_task = None
+        await self.flush(retry=False)
+        await sync_to_async(ids.generator.release)()
+
+
+writer = MessageWriter()
@@ -0,0 +1,85 @@
+"""
+Database connection pool
+========================
+Sync endpoints and dependencies run on the Starlette threadpool, capped at
+``THREADPOOL_SIZE`` threads. Without pooling, each thread keeps its own
+persistent connection (CONN_MAX_AGE).
+
+With ``DB_POOL=1`` (Postgres only, see lms_admin/settings.py), Django
+borrows connections from a psycopg 3 pool of at most ``THREADPOOL_SIZE + 2``
+connections, health-checked on checkout. Threadpool workers exit after a few
+idle seconds, and a connection left in a dead thread's storage never goes
+back to the pool. So in pool mode every threadpool call returns its
+connections when it finishes; the next call takes one from the pool.
+
+``report`` turns the pool's statistics into metrics (wait time, timeouts,
+size and utilisation); GET /metrics calls it on every scrape.
+"""
+
+import functools
+
+import anyio.to_thread
+from django.conf import settings
+from django.db import connections
+
+from user_panel import metrics
+
+THREADPOOL_SIZE = settings.THREADPOOL_SIZE
+
+_run_sync = anyio.to_thread.run_sync
+
+
+def _pools():
+    for alias in connections:
+        pool = getattr(connections[alias], "pool", None)
+        if pool is not None:
+            yield alias, pool
+
+
+def _release_connections() -> None:
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close()  # back to the pool
+
+
+async def _run_sync_pooled(func, *args, **kwargs):
+    @functools.wraps(func)
+    def call(*call_args):
+        try:
+            return func(*call_args)
+        finally:
+            _release_connections()
+
+    return await _run_sync(call, *args, **kwargs)
+
+
+def start() -> None:
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    if any(_pools()):
+        # Starlette's run_in_threadpool looks this up on every call
+        anyio.to_thread.run_sync = _run_sync_pooled
+
+
+def stop() -> None:
+    anyio.to_thread.run_sync = _run_sync
+    for alias, _ in list(_pools()):
+        connections[alias].close_pool()
+
+
+def report() -> None:
+    for alias, pool in _pools():
+        if pool.closed:
+            continue  # opened by the first query
+        # Counters accumulate since the previous call; sizes are current
+        stats = pool.pop_stats()
+        metrics.incr("db_pool_requests_total", stats.get("requests_num", 0), alias=alias)
+        metrics.incr("db_pool_requests_queued_total", stats.get("requests_queued", 0), alias=alias)
+        metrics.incr("db_pool_wait_seconds_total", stats.get("requests_wait_ms", 0) / 1000, alias=alias)
+        metrics.incr("db_pool_timeouts_total", stats.get("requests_errors", 0), alias=alias)
+        metrics.incr("db_pool_connections_opened_total", stats.get("connections_num", 0), alias=alias)
+        metrics.incr("db_pool_connections_lost_total", stats.get("connections_lost", 0), alias=alias)
+        size, available = stats.get("pool_size", 0), stats.get("pool_available", 0)
+        metrics.set_gauge("db_pool_size", size, alias=alias)
+        metrics.set_gauge("db_pool_max_size", pool.max_size, alias=alias)
+        metrics.set_gauge("db_pool_waiting", stats.get("requests_waiting", 0), alias=alias)
+        metrics.set_gauge("db_pool_utilisation", (size - available) / pool.max_size, alias=alias)
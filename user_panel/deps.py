@@ -1,30 +1,62 @@
+import os
+from django.dispatch import receiver
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from .auth import decode_token
+from .cache import TTLCache
+from lms import db_router
 from lms.models import LMSUser
+from lms.signals import cache_invalidated
 
 # Expose a standards-compliant OAuth2 Password flow token endpoint at /token/
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token/")
 
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+@receiver(cache_invalidated)
+def _drop_cached_user(sender, kind, key, **kwargs):
+    if kind == "user":
+        user_cache.invalidate(int(key))
+
+
+def load_user(user_id: int) -> LMSUser:
+    user = user_cache.get(user_id)
+    if user is None:
+        try:
+            user = LMSUser.objects.get(pk=user_id)
+        except LMSUser.DoesNotExist:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        user_cache.set(user_id, user)
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is deactivated")
+    return user
+
 
 def get_current_user(token: str = Depends(oauth2_scheme)) -> LMSUser:
     # Support "Bearer <token>" format
     if token.startswith("Bearer "):
         token = token.split(" ")[1]
-    
+
     payload = decode_token(token)
     if not payload:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    
-    try:
-        user = LMSUser.objects.get(pk=int(payload["sub"]))
-        return user
-    except LMSUser.DoesNotExist:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+
+    user_id = int(payload["sub"])
+    # Cached row (dropped on every save/delete), so deleted or deactivated
+    # users are rejected without a query per request
+    user = load_user(user_id)
+    # Lets the replica router pin this user to the primary after their writes
+    db_router.set_user(user_id)
+    return user
 
 
 def require_role(required: str):
     def _dep(user: LMSUser = Depends(get_current_user)):
+        # From the row, not the token: a role change takes effect at once
         if user.role != required:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
         return user
@@ -0,0 +1,89 @@
+"""
+Subscription entitlements
+=========================
+A user's entitlement is a single "premium until" epoch timestamp (0 when they
+have no active subscription). It is computed from the DB once and then cached
+in process and in Redis (``entitlement:{user_id}``) with a TTL equal to the
+remaining subscription time, so premium checks are a comparison.
+
+Subscription saves/deletes bump the user's ``entitlement:version:{user_id}``
+key and drop the in-process copy (see lms.signals). The Redis copy is stored
+as ``"{version}:{until}"`` with the version read before the DB load, so a
+value loaded before an invalidation never counts once the version has moved,
+even if it is written back after it. In process, a result is only kept if
+no invalidation arrived while it was being loaded.
+"""
+
+import logging
+import os
+import time
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.db.models import Max
+from django.dispatch import receiver
+from django.utils import timezone
+
+from lms.models import Subscription
+from lms.signals import ENTITLEMENT_KEY, ENTITLEMENT_VERSION_KEY, cache_invalidated
+from user_panel.cache import TTLCache
+from user_panel.redis_client import get_redis
+
+# How long "no subscription" is remembered; subscribing invalidates it anyway
+ENTITLEMENT_NONE_TTL = int(os.getenv("ENTITLEMENT_NONE_TTL", "300"))
+
+_local = TTLCache(maxsize=int(os.getenv("ENTITLEMENT_CACHE_SIZE", "10000")), ttl=ENTITLEMENT_NONE_TTL)
+_generation = 0
+
+
+@receiver(cache_invalidated)
+def _drop_entitlement(sender, kind, key, **kwargs):
+    global _generation
+    if kind == "entitlement":
+        _generation += 1
+        _local.invalidate(int(key))
+
+
+def _load(user_id: int) -> float:
+    end = Subscription.objects.filter(
+        user_id=user_id, status="active", end_date__gte=timezone.now()
+    ).aggregate(m=Max("end_date"))["m"]
+    return end.timestamp() if end else 0.0
+
+
+def _ttl(until: float) -> int:
+    remaining = int(until - time.time())
+    return remaining if remaining > 0 else ENTITLEMENT_NONE_TTL
+
+
+async def premium_until(user_id: int) -> float:
+    until: Optional[float] = _local.get(user_id)
+    if until is not None:
+        return until
+    generation = _generation
+    redis = await get_redis()
+    if redis is not None:
+        try:
+            cached, version = await redis.mget(ENTITLEMENT_KEY.format(user_id), ENTITLEMENT_VERSION_KEY.format(user_id))
+            version = version or "0"
+            if cached is not None:
+                cached_version, _, value = cached.partition(":")
+                if cached_version == version:
+                    until = float(value)
+        except Exception as e:
+            logging.warning(f"Could not read entitlement for user {user_id}: {e}")
+            redis = None
+    if until is None:
+        until = await sync_to_async(_load)(user_id)
+        if redis is not None:
+            try:
+                await redis.set(ENTITLEMENT_KEY.format(user_id), f"{version}:{until}", ex=_ttl(until))
+            except Exception as e:
+                logging.warning(f"Could not store entitlement for user {user_id}: {e}")
+    if generation == _generation:
+        _local.set(user_id, until, ttl=_ttl(until))
+    return until
+
+
+async def has_premium(user_id: int) -> bool:
+    return await premium_until(user_id) > time.time()
@@ -0,0 +1,63 @@
+"""
+Thumbnail rendering
+===================
+Runs inside the preview worker processes (see user_panel.previews), so this
+module must not import Django or anything that needs app setup.
+
+Images are rendered with Pillow and PDFs with poppler's ``pdftoppm`` (first
+page). Both are optional; ``can_render`` tells the caller what is available.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+PDFTOPPM = shutil.which("pdftoppm")
+
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+PDF_TYPES = {"application/pdf"}
+
+
+def can_render(content_type: str) -> bool:
+    if Image is None:
+        return False
+    if content_type in IMAGE_TYPES:
+        return True
+    return content_type in PDF_TYPES and PDFTOPPM is not None
+
+
+def _save_thumbnail(src: str, dst: str, size: int) -> None:
+    with Image.open(src) as img:
+        # JPEG decoders can downscale while decoding, far cheaper than a full decode
+        img.draft("RGB", (size, size))
+        img.thumbnail((size, size))
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        img.save(tmp, "JPEG", quality=80, optimize=True, progressive=True)
+    os.replace(tmp, dst)
+
+
+def render(src: str, dst: str, content_type: str, size: int) -> None:
+    """Write a JPEG of at most ``size`` px per side for ``src`` (first page for PDFs) to ``dst``."""
+    if content_type in PDF_TYPES:
+        with tempfile.TemporaryDirectory() as tmp:
+            prefix = os.path.join(tmp, "page")
+            subprocess.run(
+                [PDFTOPPM, "-f", "1", "-l", "1", "-singlefile", "-scale-to", str(size * 2), "-jpeg", src, prefix],
+                check=True, capture_output=True, timeout=30,
+            )
+            _save_thumbnail(prefix + ".jpg", dst, size)
+    else:
+        _save_thumbnail(src, dst, size)
@@ -0,0 +1,17 @@
+import json
+import logging
+
+from lms.signals import INVALIDATION_CHANNEL, cache_invalidated
+from user_panel import pubsub
+
+
+async def _on_invalidation(channel: str, data: str) -> None:
+    """Re-send invalidations published by other processes (e.g. Django admin) locally."""
+    try:
+        message = json.loads(data)
+        cache_invalidated.send(sender="redis", kind=message["kind"], key=message["key"])
+    except Exception as e:
+        logging.warning(f"Bad invalidation message: {e}")
+
+
+pubsub.on_channel(INVALIDATION_CHANNEL, _on_invalidation)
@@ -1,8 +1,11 @@
+from contextlib import AsyncExitStack, asynccontextmanager
 from typing import List
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
+from asgiref.sync import sync_to_async
 
 from .django_setup import setup as django_setup
 
@@ -14,7 +17,8 @@ from django.db import transaction  # noqa: E402
 from django.db.models import Prefetch  # noqa: E402
 from django.db.models.functions import TruncMonth  # noqa: E402
 from django.db.models import Sum, Count  # noqa: E402
-from django.core.mail import send_mail  # noqa: E402
+from lms import outbox, unread  # noqa: E402
+from lms.db_router import RequestScopeMiddleware, replica_reads  # noqa: E402
 
 from .schemas import (
     RegisterRequest,
@@ -34,9 +38,23 @@ from .schemas import (
     AnalyticsOverviewOut,
     MonthlyRevenueOut,
 )
-from .auth import create_access_token, hash_password, verify_password
+from .auth import create_access_token, hash_password_async, verify_and_update_async
 from .deps import get_current_user, require_role
+from .ratelimit import RateLimit
+from .catalog import catalog
+from .entitlements import has_premium
+from .pagination import Page, paginate
+from user_panel.notifications.router import paginate_notifications
+from . import metrics
+from . import db_pool, invalidation, previews, pubsub  # noqa: F401 (invalidation registers its channel)
+from .presence import presence
+from .redis_client import close_redis
 from user_panel.chat.router import router as chat_router
+from user_panel.chat.typing_indicators import typing_indicators
+from user_panel.chat.writer import writer as chat_writer
+from user_panel.media import router as media_router
+from user_panel.realtime import router as realtime_router
+from user_panel.unread import router as badges_router
 from user_panel.notifications.router import router as notifications_ext_router
 from user_panel.attendance.router import router as attendance_router
 from user_panel.assignments.router import router as assignments_router
@@ -46,18 +64,55 @@ from user_panel.auth_github import router as github_router
 from user_panel.auth_otp import router as otp_router
 from user_panel.payment import router as payment_router
 
-app = FastAPI(title="LMS User Panel API", version="1.0.0")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Each service is stopped (in reverse order) once it has started, even if a
+    # later startup step or another service's shutdown raises
+    async with AsyncExitStack() as stack:
+        db_pool.start()
+        stack.callback(db_pool.stop)
+        stack.push_async_callback(close_redis)
+        previews.start()
+        stack.callback(previews.stop)
+        await pubsub.start()
+        stack.push_async_callback(pubsub.stop)
+        await presence.start()
+        stack.push_async_callback(presence.stop)
+        await chat_writer.start()
+        stack.push_async_callback(chat_writer.stop)
+        await typing_indicators.start()
+        stack.push_async_callback(typing_indicators.stop)
+        yield
+
+
+app = FastAPI(title="LMS User Panel API", version="1.0.0", lifespan=lifespan)
+
+app.add_middleware(RequestScopeMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:8000", "http://127.0.0.1:8000", "*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Link"],
 )
 
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics_endpoint(authorization: str = Header("")):
+    if not metrics.authorized(authorization):
+        # Not advertised to the public
+        raise HTTPException(status_code=404, detail="Not Found")
+    db_pool.report()
+    return metrics.render()
+
+
 app.include_router(chat_router)
+app.include_router(realtime_router)
+app.include_router(media_router)
 app.include_router(notifications_ext_router)
+app.include_router(badges_router)
 app.include_router(attendance_router)
 app.include_router(assignments_router)
 app.include_router(google_router)
@@ -66,140 +121,124 @@ app.include_router(github_router)
 app.include_router(otp_router)
 app.include_router(payment_router)
 
-@app.post("/token/", response_model=TokenResponse, summary="OAuth2 Password flow token endpoint")
-def token(form_data: OAuth2PasswordRequestForm = Depends()):
+login_limits = [
+    Depends(RateLimit("login", capacity=20, period=60, scope="ip")),
+    Depends(RateLimit("login", capacity=10, period=300, scope="email")),
+]
+register_limits = [Depends(RateLimit("register", capacity=10, period=3600, scope="ip"))]
+
+
+async def _authenticate(email: str, password: str) -> LMSUser:
     try:
-        # Treat OAuth2 'username' as email
-        user = LMSUser.objects.get(email=form_data.username)
+        user = await sync_to_async(LMSUser.objects.get)(email=email)
     except LMSUser.DoesNotExist:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     if not user.is_active:
         raise HTTPException(status_code=403, detail="User is deactivated")
-    if not verify_password(form_data.password, user.password_hash):
+    ok, new_hash = await verify_and_update_async(password, user.password_hash)
+    if not ok:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Transparently move the stored hash to the current cost parameters
+        user.password_hash = new_hash
+        await sync_to_async(user.save)(update_fields=["password_hash"])
+    return user
+
+
+@app.post("/token/", response_model=TokenResponse, summary="OAuth2 Password flow token endpoint", dependencies=login_limits)
+async def token(form_data: OAuth2PasswordRequestForm = Depends()):
+    # Treat OAuth2 'username' as email
+    user = await _authenticate(form_data.username, form_data.password)
     token = create_access_token(str(user.id), user.role)
     return TokenResponse(access_token=token, user_id=user.id, username=user.name)
 
 
-@app.post("/register/", response_model=TokenResponse)
-def register(payload: RegisterRequest):
-    if LMSUser.objects.filter(email=payload.email).exists():
+@app.post("/register/", response_model=TokenResponse, dependencies=register_limits)
+async def register(payload: RegisterRequest):
+    if await sync_to_async(LMSUser.objects.filter(email=payload.email).exists)():
         raise HTTPException(status_code=400, detail="Email already registered")
-    user = LMSUser.objects.create(
+    password_hash = await hash_password_async(payload.password)
+    user = await sync_to_async(LMSUser.objects.create)(
         name=payload.name,
         email=payload.email,
         role=payload.role,
-        password_hash=hash_password(payload.password),
+        password_hash=password_hash,
     )
     token = create_access_token(str(user.id), user.role)
     return TokenResponse(access_token=token, user_id=user.id, username=user.name)
 
 
-@app.post("/login/", response_model=TokenResponse)
-def login(payload: LoginRequest):
-    try:
-        user = LMSUser.objects.get(email=payload.email)
-    except LMSUser.DoesNotExist:
-        raise HTTPException(status_code=401, detail="Invalid credentials")
-    if not user.is_active:
-        raise HTTPException(status_code=403, detail="User is deactivated")
-    if not verify_password(payload.password, user.password_hash):
-        raise HTTPException(status_code=401, detail="Invalid credentials")
+@app.post("/login/", response_model=TokenResponse, dependencies=login_limits)
+async def login(payload: LoginRequest):
+    user = await _authenticate(payload.email, payload.password)
     token = create_access_token(str(user.id), user.role)
     return TokenResponse(access_token=token, user_id=user.id, username=user.name)
 
 
 @app.get("/courses/", response_model=List[CourseOut])
-def list_courses(user: LMSUser = Depends(get_current_user)):
-    from django.utils import timezone as djtz
-    valid_sub = Subscription.objects.filter(user=user, status="active", end_date__gte=djtz.now()).exists()
-    base = Course.objects.select_related("instructor").filter(status="published")
-    qs = base if valid_sub else base.filter(is_premium=False)
-    return [
-        CourseOut(
-            id=c.id,
-            title=c.title,
-            description=c.description,
-            instructor_name=c.instructor.name,
-            status=c.status,
-        )
-        for c in qs
-    ]
+async def list_courses(page: Page = Depends(), user: LMSUser = Depends(get_current_user)):
+    valid_sub = await has_premium(user.id)
+    return await catalog.page(valid_sub, page)
 
 
 @app.get("/courses/{course_id}", response_model=CourseOut)
-def course_detail(course_id: int, user: LMSUser = Depends(get_current_user)):
-    from django.utils import timezone as djtz
-    try:
-        c = Course.objects.select_related("instructor").get(pk=course_id, status="published")
-    except Course.DoesNotExist:
+async def course_detail(course_id: int, user: LMSUser = Depends(get_current_user)):
+    entry = await catalog.course(course_id)
+    if entry is None:
         raise HTTPException(status_code=404, detail="Course not found")
-    if c.is_premium:
-        has_access = Subscription.objects.filter(user=user, status="active", end_date__gte=djtz.now()).exists()
-        if not has_access:
+    is_premium, title, body = entry
+    if is_premium:
+        if not await has_premium(user.id):
             raise HTTPException(status_code=403, detail="Upgrade plan to access this course")
     # Log view activity
     try:
-        ActivityLog.objects.create(user=user, action_type="view_course", action_detail=f"Viewed {c.title}")
+        await sync_to_async(ActivityLog.objects.create)(
+            user_id=user.id, action_type="view_course", action_detail=f"Viewed {title}"
+        )
     except Exception:
         pass
-    return CourseOut(
-        id=c.id,
-        title=c.title,
-        description=c.description,
-        instructor_name=c.instructor.name,
-        status=c.status,
-    )
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/enroll/")
 def enroll(req: EnrollRequest, user: LMSUser = Depends(require_role("student"))):
     try:
-        course = Course.objects.get(pk=req.course_id, status="published")
+        course = Course.objects.select_related("instructor").get(pk=req.course_id, status="published")
     except Course.DoesNotExist:
         raise HTTPException(status_code=404, detail="Course not found")
-    obj, created = Enrollment.objects.get_or_create(user=user, course=course)
-    if created:
-        Progress.objects.create(enrollment=obj, completed_lessons=0, progress_percent=0.0)
-        ActivityLog.objects.create(user=user, action_type="enroll", action_detail=f"Enrolled in {course.title}")
-        try:
-            Notification.objects.create(user=user, message=f"You enrolled in {course.title}")
-            Notification.objects.create(user=course.instructor, message=f"{user.name} enrolled in your course {course.title}")
-            send_mail(
-                subject="Enrollment confirmed",
-                message=f"You enrolled in {course.title}.",
-                from_email=None,
-                recipient_list=[user.email],
-                fail_silently=True,
+    with transaction.atomic():
+        obj, created = Enrollment.objects.get_or_create(user_id=user.id, course=course)
+        if created:
+            Progress.objects.create(enrollment=obj, completed_lessons=0, progress_percent=0.0)
+            outbox.add(
+                outbox.activity(user.id, "enroll", f"Enrolled in {course.title}"),
+                outbox.notification(user.id, f"You enrolled in {course.title}"),
+                outbox.notification(course.instructor_id, f"{user.name} enrolled in your course {course.title}"),
+                outbox.email(user.email, "Enrollment confirmed", f"You enrolled in {course.title}."),
+                outbox.email(
+                    course.instructor.email,
+                    "New enrollment",
+                    f"{user.name} enrolled in your course {course.title}.",
+                ),
             )
-            send_mail(
-                subject="New enrollment",
-                message=f"{user.name} enrolled in your course {course.title}.",
-                from_email=None,
-                recipient_list=[course.instructor.email],
-                fail_silently=True,
-            )
-        except Exception:
-            pass
     return {"status": "ok", "enrolled": True}
 
 
 @app.get("/my-courses/", response_model=List[CourseOut])
-def my_courses(user: LMSUser = Depends(require_role("student"))):
-    enrollments = Enrollment.objects.select_related("course__instructor").filter(user=user)
-    result = []
-    for e in enrollments:
-        c = e.course
-        result.append(
-            CourseOut(
-                id=c.id,
-                title=c.title,
-                description=c.description,
-                instructor_name=c.instructor.name,
-                status=c.status,
-            )
-        )
-    return result
+@replica_reads()
+def my_courses(page: Page = Depends(), user: LMSUser = Depends(require_role("student"))):
+    return paginate(
+        Enrollment.objects.filter(user_id=user.id),
+        page,
+        order=("enrolled_on", "id"),
+        fields={
+            "id": "course_id",
+            "title": "course__title",
+            "description": "course__description",
+            "instructor_name": "course__instructor__name",
+            "status": "course__status",
+        },
+    )
 
 
 @app.post("/progress/update/")
@@ -222,20 +261,23 @@ def progress_update(req: ProgressUpdateRequest, user: LMSUser = Depends(get_curr
 
 
 @app.get("/progress/view/", response_model=List[ProgressOut])
-def progress_view(user: LMSUser = Depends(get_current_user)):
+@replica_reads()
+def progress_view(page: Page = Depends(), user: LMSUser = Depends(get_current_user)):
     if user.role == "student":
-        qs = Progress.objects.select_related("enrollment__course").filter(enrollment__user=user)
+        qs = Progress.objects.filter(enrollment__user_id=user.id)
     else:
         # instructors see progress for their courses
-        qs = Progress.objects.select_related("enrollment__course").filter(enrollment__course__instructor=user)
-    return [
-        ProgressOut(
-            course_id=p.enrollment.course_id,
-            completed_lessons=p.completed_lessons,
-            progress_percent=p.progress_percent,
-        )
-        for p in qs
-    ]
+        qs = Progress.objects.filter(enrollment__course__instructor_id=user.id)
+    return paginate(
+        qs,
+        page,
+        order=("enrollment__enrolled_on", "id"),
+        fields={
+            "course_id": "enrollment__course_id",
+            "completed_lessons": "completed_lessons",
+            "progress_percent": "progress_percent",
+        },
+    )
 
 
 # Instructor-only: create and manage courses
@@ -267,30 +309,32 @@ def subscribe(req: SubscribeRequest, user: LMSUser = Depends(get_current_user)):
         raise HTTPException(status_code=404, detail="Plan not found")
     start = djtz.now()
     end = start + timedelta(days=plan.duration_days)
-    Subscription.objects.create(user=user, plan=plan, start_date=start, end_date=end, status="active")
-    Payment.objects.create(user=user, plan=plan, amount=plan.price)
-    try:
-        Notification.objects.create(user=user, message=f"Subscribed to {plan.name} (₹{plan.price})")
-        ActivityLog.objects.create(user=user, action_type="subscribe", action_detail=f"Bought {plan.name}")
-        send_mail(
-            subject="Subscription confirmed",
-            message=f"Your subscription to {plan.name} is active until {end.date() if hasattr(end,'date') else end}.",
-            from_email=None,
-            recipient_list=[user.email],
-            fail_silently=True,
+    with transaction.atomic():
+        Subscription.objects.create(user_id=user.id, plan=plan, start_date=start, end_date=end, status="active")
+        Payment.objects.create(user_id=user.id, plan=plan, amount=plan.price)
+        outbox.add(
+            outbox.notification(user.id, f"Subscribed to {plan.name} (₹{plan.price})"),
+            outbox.activity(user.id, "subscribe", f"Bought {plan.name}"),
+            outbox.email(
+                user.email,
+                "Subscription confirmed",
+                f"Your subscription to {plan.name} is active until {end.date()}.",
+            ),
         )
-    except Exception:
-        pass
     return {"status": "ok", "plan": plan.name}
 
 
 @app.get("/subscriptions/me/", response_model=SubscriptionOut | dict)
-def my_subscription(user: LMSUser = Depends(get_current_user)):
+async def my_subscription(user: LMSUser = Depends(get_current_user)):
     from django.utils import timezone as djtz
-    sub = Subscription.objects.select_related("plan").filter(
-        user=user, status="active", end_date__gte=djtz.now()
-    ).order_by("-end_date").first()
-    
+    if not await has_premium(user.id):
+        return {}
+    sub = await sync_to_async(
+        Subscription.objects.select_related("plan").filter(
+            user_id=user.id, status="active", end_date__gte=djtz.now()
+        ).order_by("-end_date").first
+    )()
+
     if sub:
         return SubscriptionOut(
             plan_id=sub.plan.id,
@@ -303,43 +347,45 @@ def my_subscription(user: LMSUser = Depends(get_current_user)):
 
 
 @app.get("/payments/", response_model=List[PaymentOut])
-def list_payments(user: LMSUser = Depends(get_current_user)):
-    return [
-        PaymentOut(plan_name=p.plan.name, amount=float(p.amount), payment_date=p.payment_date.isoformat())
-        for p in Payment.objects.select_related("plan").filter(user=user).order_by("-payment_date")
-    ]
+@replica_reads()
+def list_payments(page: Page = Depends(), user: LMSUser = Depends(get_current_user)):
+    return paginate(
+        Payment.objects.filter(user_id=user.id),
+        page,
+        order=("payment_date", "id"),
+        fields={"plan_name": "plan__name", "amount": "amount", "payment_date": "payment_date"},
+    )
 
 
 # Aliases to satisfy Task 2 required paths
-@app.post("/auth/register/", response_model=TokenResponse)
-def auth_register(payload: RegisterRequest):
-    return register(payload)
+@app.post("/auth/register/", response_model=TokenResponse, dependencies=register_limits)
+async def auth_register(payload: RegisterRequest):
+    return await register(payload)
 
 
-@app.post("/auth/login/", response_model=TokenResponse)
-def auth_login(payload: LoginRequest):
-    return login(payload)
+@app.post("/auth/login/", response_model=TokenResponse, dependencies=login_limits)
+async def auth_login(payload: LoginRequest):
+    return await login(payload)
 
 
 @app.get("/notifications/", response_model=List[NotificationOut])
 @app.get("/notifications/{user_id}/", response_model=List[NotificationOut])
-def notifications(user_id: int | None = None, user: LMSUser = Depends(get_current_user)):
+@replica_reads()
+def notifications(user_id: int | None = None, page: Page = Depends(), user: LMSUser = Depends(get_current_user)):
     # If user_id is provided, ensure it matches the authenticated user
     if user_id is not None and user.id != user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
-    
-    qs = Notification.objects.filter(user=user).order_by("-created_at")
-    return [NotificationOut(id=n.id, message=n.message, link=n.link, is_read=n.is_read, created_at=n.created_at.isoformat()) for n in qs]
+    return paginate_notifications(user.id, page)
 
 
 @app.post("/notifications/mark-read/")
 @app.post("/notifications/mark-read")
 def notifications_mark_read(payload: MarkReadRequest, user: LMSUser = Depends(get_current_user)):
-    qs = Notification.objects.filter(user=user)
+    qs = Notification.objects.filter(user=user, is_read=False)
     if payload.mark_all:
-        qs.update(is_read=True)
+        unread.notifications_read(user.id, qs.update(is_read=True))
     elif payload.ids:
-        qs.filter(id__in=payload.ids).update(is_read=True)
+        unread.notifications_read(user.id, qs.filter(id__in=payload.ids).update(is_read=True))
     return {"status": "ok"}
 
 
@@ -350,6 +396,7 @@ def activity(payload: ActivityLogRequest, user: LMSUser = Depends(get_current_us
 
 
 @app.get("/analytics/overview/", response_model=AnalyticsOverviewOut)
+@replica_reads()
 def analytics_overview(user=Depends(require_role("instructor"))):
     total_users = LMSUser.objects.count()
     from django.utils import timezone as djtz
@@ -367,6 +414,7 @@ def analytics_overview(user=Depends(require_role("instructor"))):
 
 
 @app.get("/analytics/monthly/", response_model=List[MonthlyRevenueOut])
+@replica_reads()
 def analytics_monthly(user=Depends(require_role("instructor"))):
     data = (
         Payment.objects.annotate(m=TruncMonth("payment_date")).values("m").annotate(s=Sum("amount")).order_by("m")
@@ -0,0 +1,242 @@
+"""
+Media serving
+=============
+Serves uploaded blobs (see user_panel.storage) at the URLs uploads return:
+
+    GET|HEAD /media/blobs/ab/cd/<sha256>              Authorization header or ?token=
+    GET|HEAD /media/blobs/ab/cd/<sha256>.thumb.jpg    its thumbnail (user_panel.previews)
+
+Only types a browser can't run script from (see ``INLINE_TYPES``) are served
+inline with their declared type; everything else, e.g. an uploaded
+text/html or SVG, is an ``application/octet-stream`` attachment, so it can't
+execute on the API origin.
+
+The content hash is the ETag, so a cached copy never goes stale.
+``If-None-Match`` gets a 304. Responses are marked cacheable for a year,
+privately because access is per user. Single ``Range`` requests (with
+``If-Range``) get 206/416, so PDF viewers and video players can seek.
+
+A user may read a blob they uploaded, one sent in a chat room they belong
+to, or an assignment file or submission of a course they are enrolled in or
+teach. Positive checks are cached for ``MEDIA_AUTH_CACHE_TTL`` seconds, as
+players issue many range requests per file.
+
+The bytes never pass through Python buffers when the deployment allows it:
+
+  - with ``MEDIA_ACCEL_REDIRECT`` set (e.g. ``/protected-media/``), the
+    response is an ``X-Accel-Redirect`` to that internal nginx location,
+    which serves the file from MEDIA_ROOT with sendfile and handles ranges;
+  - under an ASGI server offering the ``http.response.zerocopysend``
+    extension, the file is handed to the server for os.sendfile;
+  - otherwise it is streamed with os.pread in the threadpool, one chunk at a
+    time.
+"""
+
+import os
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import Response
+from fastapi.security import OAuth2PasswordBearer
+from starlette.concurrency import run_in_threadpool
+from starlette.types import Receive, Scope, Send
+
+from lms.models import Assignment, ChatRoom, FileAttachment, LMSUser, Message, Submission
+from user_panel.cache import TTLCache
+from user_panel.deps import get_current_user
+from user_panel.previews import thumbnail_path
+from user_panel.storage import MEDIA_ROOT, blob_path, blob_url
+
+MEDIA_ACCEL_REDIRECT = os.getenv("MEDIA_ACCEL_REDIRECT", "")
+MEDIA_AUTH_CACHE_TTL = float(os.getenv("MEDIA_AUTH_CACHE_TTL", "60"))
+
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+# Rendered in the browser as is; any other type is downloaded
+INLINE_TYPES = {
+    "image/jpeg", "image/png", "image/gif", "image/webp",
+    "application/pdf",
+    "video/mp4", "video/webm", "audio/mpeg", "audio/ogg", "audio/webm",
+}
+_READ_CHUNK = 256 * 1024
+_BLOB_NAME = re.compile(r"^([0-9a-f]{64})(\.thumb\.jpg)?$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+router = APIRouter(prefix="/media", tags=["media"])
+
+_optional_token = OAuth2PasswordBearer(tokenUrl="/token/", auto_error=False)
+_allowed = TTLCache(maxsize=100_000, ttl=MEDIA_AUTH_CACHE_TTL)  # (user id, sha256) -> (name, type)
+
+
+def _media_user(header_token: Optional[str] = Depends(_optional_token), token: Optional[str] = None) -> LMSUser:
+    # <img>/<video> tags can't send headers, so ?token= works too
+    token = header_token or token
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    return get_current_user(token)
+
+
+def _authorize(user_id: int, sha256: str) -> Optional[Tuple[str, str]]:
+    """(file name, content type) if the user may read the blob, else None.
+
+    The same bytes may have been uploaded several times under different names
+    and types, so the metadata comes from the upload the user was given: their
+    own, or the one by whoever shared it (message sender, assignment author,
+    submitting student).
+    """
+    attachments = FileAttachment.objects.filter(blob_id=sha256)
+    url = blob_url(sha256)
+    my_rooms = ChatRoom.members.through.objects.filter(lmsuser_id=user_id).values("chatroom_id")
+    course_access = Q(course__enrollments__user_id=user_id) | Q(course__instructor_id=user_id)
+    grants = (
+        lambda: attachments.filter(uploaded_by_id=user_id).values("uploaded_by_id"),
+        lambda: Message.objects.filter(room_id__in=my_rooms, file_url=url).values("sender_id"),
+        lambda: Assignment.objects.filter(course_access, file_url=url).values("created_by_id"),
+        lambda: Submission.objects.filter(
+            Q(student_id=user_id) | Q(assignment__course__instructor_id=user_id), file_url=url
+        ).values("student_id"),
+    )
+    for sharers in grants:
+        if sharers().exists():
+            meta = attachments.filter(uploaded_by_id__in=sharers()).values_list("file_name", "file_type").first()
+            # e.g. a chat message forwarding someone else's file_url
+            return meta or attachments.values_list("file_name", "file_type").first()
+    return None
+
+
+def can_read(user_id: int, sha256: str) -> bool:
+    """Whether the user may read the blob, e.g. before they share it in a chat message."""
+    return _authorize(user_id, sha256) is not None
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) for a single byte range; None to serve the whole file.
+
+    Invalid ranges (e.g. ``bytes=5-3``) are ignored, as RFC 9110 requires.
+    Raises 416 for a valid range that starts past the end of the file.
+    """
+    match = _RANGE.match(header.strip())
+    if match is None:
+        return None  # multiple or malformed ranges: send everything
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        suffix = int(last)
+        if suffix == 0:
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+class FileRangeResponse(Response):
+    """Sends ``length`` bytes of ``path`` from ``offset``, zero-copy when the server supports it."""
+
+    def __init__(self, path: str, offset: int, length: int, status_code: int, headers: dict) -> None:
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.status_code = status_code
+        self.background = None
+        self.init_headers({**headers, "content-length": str(length)})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or not self.length:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        f = await run_in_threadpool(open, self.path, "rb")
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend", "file": f,
+                    "offset": self.offset, "count": self.length,
+                })
+                return
+            fd, offset, remaining = f.fileno(), self.offset, self.length
+            while remaining:
+                chunk = await run_in_threadpool(os.pread, fd, min(_READ_CHUNK, remaining), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        finally:
+            f.close()
+
+
+def _content_headers(file_name: str, declared_type: str) -> dict:
+    """Content type and disposition for an upload; its type is whatever the uploader claimed."""
+    content_type = (declared_type or "").split(";")[0].strip().lower()
+    if content_type in INLINE_TYPES:
+        return {"content-type": content_type, "content-disposition": f"inline; filename*=UTF-8''{quote(file_name)}"}
+    return {
+        "content-type": "application/octet-stream",
+        "content-disposition": f"attachment; filename*=UTF-8''{quote(file_name)}",
+    }
+
+
+@router.api_route("/blobs/{a}/{b}/{name}", methods=["GET", "HEAD"])
+async def serve_blob(request: Request, a: str, b: str, name: str, user: LMSUser = Depends(_media_user)):
+    match = _BLOB_NAME.match(name)
+    if match is None or (a, b) != (name[:2], name[2:4]):
+        raise HTTPException(status_code=404, detail="Not found")
+    sha256, thumbnail = match.group(1), bool(match.group(2))
+
+    key = (user.id, sha256)
+    meta = _allowed.get(key)
+    if meta is None:
+        meta = await sync_to_async(_authorize)(user.id, sha256)
+        if meta is None:
+            # Same answer for missing and forbidden files, so hashes can't be probed
+            raise HTTPException(status_code=404, detail="Not found")
+        _allowed.set(key, meta)
+    file_name, content_type = meta
+
+    etag = f'"{sha256}.thumb"' if thumbnail else f'"{sha256}"'
+    headers = {
+        "etag": etag,
+        "cache-control": CACHE_CONTROL,
+        "accept-ranges": "bytes",
+        "x-content-type-options": "nosniff",
+        # Thumbnails are JPEGs we rendered ourselves
+        **({"content-type": "image/jpeg"} if thumbnail else _content_headers(file_name, content_type)),
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"etag": etag, "cache-control": CACHE_CONTROL})
+
+    path = thumbnail_path(sha256) if thumbnail else blob_path(sha256)
+    if MEDIA_ACCEL_REDIRECT:
+        # nginx serves the file (sendfile, ranges) from an internal location over MEDIA_ROOT
+        rel = str(path.relative_to(MEDIA_ROOT)).replace("\\", "/")
+        return Response(headers={**headers, "x-accel-redirect": MEDIA_ACCEL_REDIRECT.rstrip("/") + "/" + rel})
+
+    try:
+        size = (await run_in_threadpool(os.stat, path)).st_size
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        byte_range = _parse_range(range_header, size)
+    if byte_range is None:
+        return FileRangeResponse(str(path), 0, size, 200, headers)
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return FileRangeResponse(str(path), start, end - start + 1, 206, headers)
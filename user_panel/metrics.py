@@ -0,0 +1,60 @@
+"""
+In-process metrics
+==================
+Counters and gauges kept per worker process and exposed in Prometheus text
+format at GET /metrics. Scrapers authenticate with ``Authorization: Bearer
+<METRICS_TOKEN>``; without a token configured the endpoint answers 404.
+"""
+
+import hmac
+import os
+import threading
+from typing import Dict, Tuple
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_counters: Dict[_Key, float] = {}
+_gauges: Dict[_Key, float] = {}
+_lock = threading.Lock()
+
+
+def _key(name: str, labels: dict) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def incr(name: str, value: float = 1, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def authorized(authorization: str) -> bool:
+    scheme, _, token = authorization.partition(" ")
+    return bool(METRICS_TOKEN) and scheme.lower() == "bearer" and hmac.compare_digest(token, METRICS_TOKEN)
+
+
+def _format(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f'{k}="{v}"' for k, v in labels)
+    return f"{name}{{{inner}}}"
+
+
+def render() -> str:
+    lines = []
+    with _lock:
+        for kind, store in (("counter", _counters), ("gauge", _gauges)):
+            seen = set()
+            for (name, labels), value in sorted(store.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} {kind}")
+                    seen.add(name)
+                lines.append(f"{_format(name, labels)} {value}")
+    return "\n".join(lines) + "\n"
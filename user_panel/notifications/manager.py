@@ -1,6 +1,8 @@
 from typing import Dict, Set
 from fastapi import WebSocket
+import asyncio
 import json
+from user_panel import pubsub
 from user_panel.redis_client import get_redis
 
 
@@ -17,6 +19,10 @@ class NotificationManager:
             # We might want to track online users for notifications too, but chat manager does that.
             pass
 
+    def register(self, sink, user_id: int) -> None:
+        """Add an already-accepted receiver (anything with ``send_text``), e.g. a multiplexed socket."""
+        self.active.setdefault(user_id, set()).add(sink)
+
     async def disconnect(self, websocket: WebSocket, user_id: int) -> None:
         conns = self.active.get(user_id, set())
         if websocket in conns:
@@ -24,16 +30,31 @@ class NotificationManager:
             if not conns:
                 del self.active[user_id]
 
+    async def _send_local(self, user_id: int, data: str) -> None:
+        for ws in list(self.active.get(user_id, ())):
+            try:
+                await ws.send_text(data)
+            except Exception:
+                await self.disconnect(ws, user_id)
+
+    async def deliver_local(self, payloads: Dict[int, str]) -> None:
+        """Send pre-serialized payloads to this process's sockets, all users concurrently."""
+        targets = [uid for uid in payloads if uid in self.active]
+        if targets:
+            await asyncio.gather(*(self._send_local(uid, payloads[uid]) for uid in targets))
+
     async def send_notification(self, user_id: int, message: dict) -> None:
         data = json.dumps(message)
         # local send
-        conns = self.active.get(user_id, set())
-        for ws in list(conns):
-            await ws.send_text(data)
+        await self._send_local(user_id, data)
         
         # redis pub (for other instances)
-        redis = await get_redis()
-        if redis:
-            await redis.publish(f"notifications:user:{user_id}", data)
+        await pubsub.publish(f"notifications:user:{user_id}", data)
+
+    async def _on_remote(self, channel: str, data: str) -> None:
+        user_id = int(channel.rsplit(":", 1)[1])
+        if user_id in self.active:
+            await self._send_local(user_id, data)
 
 manager = NotificationManager()
+pubsub.on_pattern("notifications:user:*", manager._on_remote)
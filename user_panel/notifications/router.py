@@ -1,42 +1,52 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from asgiref.sync import sync_to_async
+from lms import unread
+from lms.db_router import replica_reads
 from lms.models import Notification, LMSUser
 from user_panel.deps import get_current_user
 from user_panel.auth import decode_token
 from user_panel.schemas import NotificationOut
+from user_panel.pagination import Page, paginate
 from .manager import manager
 
 router = APIRouter(prefix="/notifications", tags=["notifications-extended"])
 
 
+def paginate_notifications(user_id: int, page: Page):
+    return paginate(
+        Notification.objects.filter(user_id=user_id),
+        page,
+        order=("created_at", "id"),
+        fields={f: f for f in NotificationOut.model_fields},
+    )
+
+
 @router.get("/", response_model=List[NotificationOut])
-def list_notifications(user: LMSUser = Depends(get_current_user)):
-    qs = Notification.objects.filter(user=user).order_by("-created_at")
-    return [NotificationOut(id=n.id, message=n.message, is_read=n.is_read, created_at=n.created_at.isoformat()) for n in qs]
+@replica_reads()
+def list_notifications(page: Page = Depends(), user: LMSUser = Depends(get_current_user)):
+    return paginate_notifications(user.id, page)
 
 
 @router.patch("/{notif_id}/read/")
 def mark_read(notif_id: int, user: LMSUser = Depends(get_current_user)):
-    try:
-        n = Notification.objects.get(pk=notif_id, user=user)
-    except Notification.DoesNotExist:
+    qs = Notification.objects.filter(pk=notif_id, user=user)
+    if not qs.exists():
         raise HTTPException(status_code=404, detail="Notification not found")
-    n.is_read = True
-    n.save()
+    # Only an UPDATE that actually flips the row may uncount it
+    unread.notifications_read(user.id, qs.filter(is_read=False).update(is_read=True))
     return {"status": "ok"}
 
 
 @router.patch("/read-all/")
 def read_all(user: LMSUser = Depends(get_current_user)):
-    Notification.objects.filter(user=user, is_read=False).update(is_read=True)
+    unread.notifications_read(user.id, Notification.objects.filter(user=user, is_read=False).update(is_read=True))
     return {"status": "ok"}
 
 
 @router.get("/unread-count/")
 def unread_count(user: LMSUser = Depends(get_current_user)):
-    c = Notification.objects.filter(user=user, is_read=False).count()
-    return {"count": c}
+    return {"count": unread.notification_count(user.id)}
 
 
 @router.websocket("/ws/notifications/{user_id}")
@@ -1,14 +1,79 @@
+import json
+import logging
+import os
+from typing import Iterable, List, Optional
+
+from lms import unread
 from lms.models import Notification, LMSUser
 from asgiref.sync import sync_to_async
-from django.core.mail import send_mail
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db import transaction
+from user_panel import pubsub
+from user_panel.redis_client import get_redis
+from .manager import manager
+
+NOTIFY_CHUNK_SIZE = int(os.getenv("NOTIFY_CHUNK_SIZE", "500"))
+
 
 @sync_to_async
 def create_notification(user: LMSUser, message: str, link: str = None):
     Notification.objects.create(user=user, message=message, link=link)
+    unread.notifications_added({user.id: 1})
     send_mail(
         subject="LMS Notification",
         message=f"{message}\n\nView details: {link}",
         from_email=None,
         recipient_list=[user.email],
         fail_silently=True,
+        connection=get_connection(settings.QUEUED_EMAIL_BACKEND, lane="bulk", fail_silently=True),
     )
+
+
+def _create_many(user_ids: List[int], message: str, link: Optional[str], email: bool) -> List[Notification]:
+    created: List[Notification] = []
+    with transaction.atomic():
+        for i in range(0, len(user_ids), NOTIFY_CHUNK_SIZE):
+            chunk = [Notification(user_id=uid, message=message, link=link) for uid in user_ids[i:i + NOTIFY_CHUNK_SIZE]]
+            created.extend(Notification.objects.bulk_create(chunk))
+        unread.notifications_added({uid: 1 for uid in user_ids})
+    if email:
+        body = f"{message}\n\nView details: {link}"
+        recipients = LMSUser.objects.filter(id__in=user_ids, is_active=True).values_list("email", flat=True)
+        get_connection(settings.QUEUED_EMAIL_BACKEND, lane="bulk", fail_silently=True).send_messages(
+            [EmailMessage(subject="LMS Notification", body=body, to=[addr]) for addr in recipients]
+        )
+    return created
+
+
+async def notify_many(user_ids: Iterable[int], message: str, link: Optional[str] = None, email: bool = True) -> int:
+    """Create the same notification for many users and push it to them in one pass.
+
+    Rows are bulk-inserted in chunks, the Redis publishes go out in one
+    pipeline and local sockets are written concurrently.
+    """
+    ids = list(dict.fromkeys(user_ids))
+    if not ids:
+        return 0
+    created = await sync_to_async(_create_many)(ids, message, link, email)
+    payloads = {
+        n.user_id: json.dumps({
+            "id": n.id,
+            "message": n.message,
+            "link": n.link,
+            "is_read": n.is_read,
+            "created_at": n.created_at.isoformat(),
+        })
+        for n in created
+    }
+    await manager.deliver_local(payloads)
+    redis = await get_redis()
+    if redis:
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for uid, data in payloads.items():
+                pipe.publish(f"notifications:user:{uid}", pubsub.envelope(data))
+            await pipe.execute()
+        except Exception as e:
+            logging.warning(f"Could not publish notifications: {e}")
+    return len(created)
@@ -0,0 +1,147 @@
+"""
+Keyset pagination and sparse fieldsets
+======================================
+List endpoints take ``?limit=``, ``?cursor=`` and ``?fields=a,b``.
+
+Pages are ordered newest first by a (timestamp, id) pair and continue strictly
+after the opaque cursor, so deep pages cost the same as the first one. The
+response body stays a plain JSON array; when more rows exist the next cursor
+is returned in the ``X-Next-Cursor`` header (and as a ``Link: rel="next"``).
+A request with neither ``limit`` nor ``cursor`` gets every row, as before
+pagination existed; a cursor without a limit pages by ``DEFAULT_PAGE_SIZE``.
+
+``paginate`` returns the items, so the route's ``response_model`` still
+validates them; the headers go on the injected ``Response``. ``fields``
+limits both the returned keys and the columns selected, since rows are read
+with ``.values()`` on just the requested paths; such a projection can't
+satisfy the full model and is returned as a ``JSONResponse`` of its own.
+"""
+
+import base64
+import bisect
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from django.db.models import Q
+from fastapi import HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+Cursor = Tuple[datetime, int]
+
+
+def encode_cursor(ts: datetime, pk: int) -> str:
+    raw = json.dumps([ts.isoformat(), pk], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Cursor:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        ts, pk = json.loads(raw)
+        return datetime.fromisoformat(ts), int(pk)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+class Page:
+    """FastAPI dependency carrying the pagination/projection query params."""
+
+    def __init__(
+        self,
+        request: Request,
+        response: Response,
+        cursor: Optional[str] = Query(None, description="Opaque cursor from X-Next-Cursor"),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    ) -> None:
+        self.request = request
+        self.response = response
+        self.after: Optional[Cursor] = decode_cursor(cursor) if cursor else None
+        # None: every row
+        self.limit: Optional[int] = limit if limit is not None or self.after is None else DEFAULT_PAGE_SIZE
+        self.fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+    def select(self, available: Sequence[str]) -> List[str]:
+        if not self.fields:
+            return list(available)
+        unknown = [f for f in self.fields if f not in available]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        return self.fields
+
+    def headers(self, next_cursor: Optional[Cursor]) -> Dict[str, str]:
+        if next_cursor is None:
+            return {}
+        token = encode_cursor(*next_cursor)
+        next_url = self.request.url.include_query_params(cursor=token)
+        return {"X-Next-Cursor": token, "Link": f'<{next_url}>; rel="next"'}
+
+    def respond(self, body: bytes, next_cursor: Optional[Cursor]) -> Response:
+        """Response for a body that is already serialized (and validated)."""
+        return Response(content=body, media_type="application/json", headers=self.headers(next_cursor))
+
+
+def paginate(qs, page: Page, order: Tuple[str, str], fields: Dict[str, str]):
+    """Return one keyset page of ``qs``.
+
+    ``order`` names the (timestamp, id) lookups to page by and ``fields`` maps
+    output keys to ORM lookups passed to ``.values()``.
+    """
+    ts_field, id_field = order
+    selected = page.select(list(fields))
+    qs = qs.order_by(f"-{ts_field}", f"-{id_field}")
+    if page.after is not None:
+        ts, pk = page.after
+        qs = qs.filter(Q(**{f"{ts_field}__lt": ts}) | Q(**{ts_field: ts, f"{id_field}__lt": pk}))
+    paths = {fields[f] for f in selected} | {ts_field, id_field}
+    rows = qs.values(*paths)
+    rows = list(rows if page.limit is None else rows[: page.limit + 1])
+    more = page.limit is not None and len(rows) > page.limit
+    rows = rows[: page.limit]
+    items = [{f: _jsonable(row[fields[f]]) for f in selected} for row in rows]
+    headers = page.headers((rows[-1][ts_field], rows[-1][id_field]) if more else None)
+    if page.fields:
+        return JSONResponse(items, headers=headers)
+    page.response.headers.update(headers)
+    return items
+
+
+def paginate_sorted(
+    keys: Sequence[Tuple[float, int]],
+    items: Sequence[dict],
+    raw: Sequence[bytes],
+    cursors: Sequence[Cursor],
+    page: Page,
+) -> Response:
+    """Page through an in-memory list already sorted newest first.
+
+    ``keys`` are ascending ``(-timestamp, -id)`` sort keys aligned with
+    ``items`` (dicts), ``raw`` (their pre-serialized JSON, already dumped
+    through the response model) and ``cursors``.
+    """
+    start = 0
+    if page.after is not None:
+        ts, pk = page.after
+        start = bisect.bisect_right(keys, (-ts.timestamp(), -pk))
+    end = len(items) if page.limit is None else start + page.limit
+    if page.fields:
+        selected = page.select(list(items[0]) if items else page.fields)
+        body = json.dumps([{f: item[f] for f in selected} for item in items[start:end]]).encode()
+    else:
+        body = b"[" + b",".join(raw[start:end]) + b"]"
+    next_cursor = cursors[end - 1] if end < len(items) else None
+    return page.respond(body, next_cursor)
@@ -8,7 +8,9 @@ from datetime import timedelta
 from .django_setup import setup as django_setup
 django_setup()
 
-from lms.models import LMSUser, Course, Plan, Subscription, Payment, Enrollment, Progress, ActivityLog, Notification  # noqa: E402
+from django.db import transaction  # noqa: E402
+from lms import outbox  # noqa: E402
+from lms.models import LMSUser, Course, Plan, Subscription, Payment, Enrollment, Progress  # noqa: E402
 from .deps import get_current_user  # noqa: E402
 from asgiref.sync import sync_to_async  # noqa: E402
 
@@ -71,30 +73,36 @@ def fulfill_order(item_type: str, item_id: int, user_id: int, transaction_id: st
         plan = Plan.objects.get(pk=item_id)
         start = djtz.now()
         end = start + timedelta(days=plan.duration_days)
-        # Create Subscription
-        Subscription.objects.create(user=user, plan=plan, start_date=start, end_date=end, status="active")
-        # Create Payment record
-        Payment.objects.create(
-            user=user, plan=plan, amount=plan.price, 
-            stripe_transaction_id=transaction_id, status="completed"
-        )
-        # Notify
-        Notification.objects.create(user=user, message=f"Subscribed to {plan.name}")
-        ActivityLog.objects.create(user=user, action_type="subscribe", action_detail=f"Bought {plan.name}")
+        with transaction.atomic():
+            # Create Subscription
+            Subscription.objects.create(user=user, plan=plan, start_date=start, end_date=end, status="active")
+            # Create Payment record
+            Payment.objects.create(
+                user=user, plan=plan, amount=plan.price, 
+                stripe_transaction_id=transaction_id, status="completed"
+            )
+            # Notify
+            outbox.add(
+                outbox.notification(user.id, f"Subscribed to {plan.name}"),
+                outbox.activity(user.id, "subscribe", f"Bought {plan.name}"),
+            )
 
     elif item_type == "course":
         course = Course.objects.get(pk=item_id)
-        # Create Enrollment
-        obj, created = Enrollment.objects.get_or_create(user=user, course=course)
-        if created:
-            Progress.objects.create(enrollment=obj, completed_lessons=0, progress_percent=0.0)
-            ActivityLog.objects.create(user=user, action_type="enroll", action_detail=f"Bought {course.title}")
-            Notification.objects.create(user=user, message=f"You enrolled in {course.title}")
-        # Create Payment record
-        Payment.objects.create(
-            user=user, course=course, amount=course.price, 
-            stripe_transaction_id=transaction_id, status="completed"
-        )
+        with transaction.atomic():
+            # Create Enrollment
+            obj, created = Enrollment.objects.get_or_create(user=user, course=course)
+            if created:
+                Progress.objects.create(enrollment=obj, completed_lessons=0, progress_percent=0.0)
+                outbox.add(
+                    outbox.activity(user.id, "enroll", f"Bought {course.title}"),
+                    outbox.notification(user.id, f"You enrolled in {course.title}"),
+                )
+            # Create Payment record
+            Payment.objects.create(
+                user=user, course=course, amount=course.price, 
+                stripe_transaction_id=transaction_id, status="completed"
+            )
 
 
 @router.post("/webhook")
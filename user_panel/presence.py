@@ -0,0 +1,177 @@
+"""
+Presence
+========
+Tracks which users have at least one live chat connection on any node.
+
+Every connection gets an id registered in Redis (see lms.presence for the key
+layout) with an expiry that this process's heartbeat task pushes forward
+every ``PRESENCE_HEARTBEAT`` seconds, so connections of a crashed node age
+out after ``PRESENCE_TTL``. Connect/disconnect return the user's remaining
+connection count across nodes; only the 0 -> 1 and 1 -> 0 transitions touch
+``UserStatus``, and those writes are coalesced and flushed in bulk every
+``PRESENCE_FLUSH_INTERVAL`` seconds.
+
+While Redis is unavailable, counts fall back to this process's connections.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+
+from lms.models import LMSUser, UserStatus
+from lms.presence import PRESENCE_ONLINE_KEY, PRESENCE_USER_KEY
+from user_panel import pubsub
+from user_panel.redis_client import get_redis
+
+PRESENCE_TTL = int(os.getenv("PRESENCE_TTL", "60"))
+PRESENCE_HEARTBEAT = int(os.getenv("PRESENCE_HEARTBEAT", "20"))
+PRESENCE_FLUSH_INTERVAL = float(os.getenv("PRESENCE_FLUSH_INTERVAL", "5"))
+
+# KEYS[1] = user's connection set, KEYS[2] = online set
+# ARGV = connection id, user id, ttl (seconds), mode ("add" | "remove")
+# Returns the user's live connection count after the update
+PRESENCE_LUA = """
+local t = redis.call("TIME")
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local ttl = tonumber(ARGV[3])
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now)
+if ARGV[4] == "add" then
+    redis.call("ZADD", KEYS[1], now + ttl, ARGV[1])
+    redis.call("EXPIRE", KEYS[1], ttl)
+    redis.call("ZADD", KEYS[2], now + ttl, ARGV[2])
+else
+    redis.call("ZREM", KEYS[1], ARGV[1])
+end
+local n = redis.call("ZCARD", KEYS[1])
+if n == 0 then
+    redis.call("ZREM", KEYS[2], ARGV[2])
+end
+return n
+"""
+
+
+def _flush(pending: Dict[int, bool]) -> None:
+    now = timezone.now()
+    with transaction.atomic():
+        existing = set(UserStatus.objects.filter(user_id__in=pending).values_list("user_id", flat=True))
+        for is_online in (True, False):
+            ids = [uid for uid in existing if pending[uid] is is_online]
+            if ids:
+                UserStatus.objects.filter(user_id__in=ids).update(is_online=is_online, last_seen=now)
+        missing = LMSUser.objects.filter(id__in=set(pending) - existing).values_list("id", flat=True)
+        UserStatus.objects.bulk_create(
+            UserStatus(user_id=uid, is_online=pending[uid], last_seen=now) for uid in missing
+        )
+
+
+class Presence:
+    def __init__(self) -> None:
+        self.connections: Dict[str, int] = {}  # connection id -> user id (this process)
+        self._local_counts: Dict[int, int] = {}
+        self._pending: Dict[int, bool] = {}  # user id -> is_online, awaiting flush
+        self._ids = itertools.count(1)
+        self._script = None
+        self._script_client = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _script_for(self, redis):
+        if self._script is None or self._script_client is not redis:
+            self._script = redis.register_script(PRESENCE_LUA)
+            self._script_client = redis
+        return self._script
+
+    async def _update(self, conn_id: str, user_id: int, mode: str) -> int:
+        local = self._local_counts.get(user_id, 0)
+        redis = await get_redis()
+        if redis is not None:
+            try:
+                script = self._script_for(redis)
+                return await script(
+                    keys=[PRESENCE_USER_KEY.format(user_id), PRESENCE_ONLINE_KEY],
+                    args=[conn_id, user_id, PRESENCE_TTL, mode],
+                )
+            except Exception as e:
+                logging.warning(f"Presence update for user {user_id} failed: {e}")
+        return local
+
+    async def connect(self, user_id: int) -> str:
+        conn_id = f"{pubsub.ORIGIN_ID}:{next(self._ids)}"
+        self.connections[conn_id] = user_id
+        self._local_counts[user_id] = self._local_counts.get(user_id, 0) + 1
+        if await self._update(conn_id, user_id, "add") == 1:
+            self._pending[user_id] = True
+        return conn_id
+
+    async def disconnect(self, conn_id: str) -> None:
+        user_id = self.connections.pop(conn_id, None)
+        if user_id is None:
+            return
+        remaining = self._local_counts.get(user_id, 1) - 1
+        if remaining:
+            self._local_counts[user_id] = remaining
+        else:
+            self._local_counts.pop(user_id, None)
+        if await self._update(conn_id, user_id, "remove") == 0:
+            self._pending[user_id] = False
+
+    async def _heartbeat(self) -> None:
+        redis = await get_redis()
+        if redis is None:
+            return
+        try:
+            script = self._script_for(redis)
+            pipe = redis.pipeline(transaction=False)
+            for conn_id, user_id in list(self.connections.items()):
+                await script(
+                    keys=[PRESENCE_USER_KEY.format(user_id), PRESENCE_ONLINE_KEY],
+                    args=[conn_id, user_id, PRESENCE_TTL, "add"],
+                    client=pipe,
+                )
+            pipe.zremrangebyscore(PRESENCE_ONLINE_KEY, "-inf", time.time())
+            await pipe.execute()
+        except Exception as e:
+            logging.warning(f"Presence heartbeat failed: {e}")
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await sync_to_async(_flush)(pending)
+        except Exception as e:
+            logging.warning(f"Could not flush {len(pending)} user statuses: {e}")
+
+    async def _run(self) -> None:
+        last_beat = time.monotonic()
+        while True:
+            await asyncio.sleep(PRESENCE_FLUSH_INTERVAL)
+            if time.monotonic() - last_beat >= PRESENCE_HEARTBEAT:
+                last_beat = time.monotonic()
+                await self._heartbeat()
+            await self.flush()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for conn_id in list(self.connections):
+            await self.disconnect(conn_id)
+        await self.flush()
+
+
+presence = Presence()
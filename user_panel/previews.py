@@ -0,0 +1,128 @@
+"""
+Upload previews
+===============
+After a chat upload is stored, images get a thumbnail and PDFs a first-page
+preview. Both are saved as ``<sha256>.thumb.jpg`` next to the blob and
+recorded on the FileAttachment (``thumbnail_path``). The name follows the
+content, so a re-uploaded file reuses the existing thumbnail without
+rendering again.
+
+Rendering (user_panel.imaging) runs in a ProcessPoolExecutor of
+``PREVIEW_WORKERS`` processes, off the event loop and outside the GIL. At
+most ``PREVIEW_QUEUE_SIZE`` jobs may be queued or running. Beyond that, or
+after ``PREVIEW_TIMEOUT`` seconds, the upload simply has no thumbnail, as it
+does when Pillow (or pdftoppm, for PDFs) isn't installed; ``start`` logs
+which renderers are missing. Dockerfile.fastapi installs poppler-utils for
+pdftoppm.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+
+from lms.models import FileAttachment
+from user_panel import imaging, metrics
+from user_panel.storage import BLOB_URL_PREFIX, MEDIA_ROOT, blob_path, blob_url
+
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "2"))
+PREVIEW_QUEUE_SIZE = int(os.getenv("PREVIEW_QUEUE_SIZE", "32"))
+PREVIEW_TIMEOUT = float(os.getenv("PREVIEW_TIMEOUT", "10"))
+PREVIEW_SIZE = int(os.getenv("PREVIEW_SIZE", "320"))
+
+THUMB_SUFFIX = ".thumb.jpg"
+
+_executor: Optional[ProcessPoolExecutor] = None
+_queued = 0
+
+
+def thumbnail_path(sha256: str) -> Path:
+    return blob_path(sha256).with_name(sha256 + THUMB_SUFFIX)
+
+
+def thumbnail_url(file_url: str) -> Optional[str]:
+    """Where the thumbnail of an uploaded file lives, if the URL is one of ours."""
+    if not file_url.startswith(BLOB_URL_PREFIX) or file_url.endswith(THUMB_SUFFIX):
+        return None
+    return file_url + THUMB_SUFFIX
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: forking a process with running threads (event loop, threadpool) isn't safe
+        _executor = ProcessPoolExecutor(PREVIEW_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _done() -> None:
+    global _queued
+    _queued -= 1
+
+
+async def _render(attachment: FileAttachment, dst: str) -> bool:
+    global _queued
+    if _queued >= PREVIEW_QUEUE_SIZE:
+        metrics.incr("preview_skipped_total", reason="busy")
+        return False
+    try:
+        job = _pool().submit(
+            imaging.render, str(blob_path(attachment.blob_id)), dst, attachment.file_type, PREVIEW_SIZE
+        )
+    except Exception as e:
+        logging.warning(f"Could not queue preview for attachment {attachment.id}: {e}")
+        return False
+    # A job counts against the queue until it finishes, even if nobody waits for it any more
+    _queued += 1
+    loop = asyncio.get_running_loop()
+    job.add_done_callback(lambda _: loop.call_soon_threadsafe(_done))
+    try:
+        await asyncio.wait_for(asyncio.wrap_future(job), PREVIEW_TIMEOUT)
+        metrics.incr("preview_rendered_total")
+        return True
+    except asyncio.TimeoutError:
+        metrics.incr("preview_skipped_total", reason="timeout")
+    except BrokenProcessPool as e:
+        # A worker died (e.g. OOM on a huge image); start a fresh pool next time
+        logging.warning(f"Preview workers crashed: {e}")
+        metrics.incr("preview_skipped_total", reason="crash")
+        stop()
+    except Exception as e:
+        logging.warning(f"Preview for attachment {attachment.id} failed: {e}")
+        metrics.incr("preview_skipped_total", reason="error")
+    return False
+
+
+async def derive(attachment: FileAttachment) -> Optional[str]:
+    """Render (or reuse) the attachment's thumbnail; its URL, or None if there is none."""
+    if attachment.blob_id is None or not imaging.can_render(attachment.file_type):
+        return None
+    dst = thumbnail_path(attachment.blob_id)
+    if not dst.exists() and not await _render(attachment, str(dst)):
+        return None
+    attachment.thumbnail_path = str(dst.relative_to(MEDIA_ROOT)).replace("\\", "/")
+    await sync_to_async(FileAttachment.objects.filter(pk=attachment.pk).update)(
+        thumbnail_path=attachment.thumbnail_path
+    )
+    return thumbnail_url(blob_url(attachment.blob_id))
+
+
+def start() -> None:
+    # Missing renderers only show up as uploads without thumbnails, so say so once
+    if imaging.Image is None:
+        logging.warning("Pillow is not installed: uploads get no thumbnails")
+    if imaging.PDFTOPPM is None:
+        logging.warning("pdftoppm (poppler-utils) is not on PATH: PDF uploads get no preview")
+
+
+def stop() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
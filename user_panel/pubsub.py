@@ -0,0 +1,112 @@
+"""
+Redis pub/sub subscriber
+========================
+One subscriber task per process (started from the app lifespan) listens on
+every channel/pattern registered with ``on_channel``/``on_pattern`` and hands
+messages to the registered coroutine as ``handler(channel, data)``.
+
+Messages published with ``publish``/``pack`` carry this process's ORIGIN_ID
+and are skipped when they come back, because the publisher has already
+delivered them to its own sockets.
+"""
+
+import asyncio
+import logging
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+from lms.redis_client import pack, unpack
+from user_panel.redis_client import get_redis
+
+Handler = Callable[[str, str], Awaitable[None]]
+
+ORIGIN_ID = uuid.uuid4().hex
+
+_channels: Dict[str, Handler] = {}
+_patterns: Dict[str, Handler] = {}
+_task: Optional[asyncio.Task] = None
+
+
+def on_channel(channel: str, handler: Handler) -> None:
+    _channels[channel] = handler
+
+
+def on_pattern(pattern: str, handler: Handler) -> None:
+    _patterns[pattern] = handler
+
+
+def envelope(data: str) -> str:
+    return pack(ORIGIN_ID, data)
+
+
+async def publish(channel: str, data: str) -> None:
+    redis = await get_redis()
+    if redis:
+        try:
+            await redis.publish(channel, envelope(data))
+        except Exception as e:
+            logging.warning(f"Could not publish to {channel}: {e}")
+
+
+async def _dispatch(message: dict) -> None:
+    origin, data = unpack(message["data"])
+    if origin == ORIGIN_ID:
+        return
+    if message["type"] == "pmessage":
+        handler = _patterns.get(message["pattern"])
+    else:
+        handler = _channels.get(message["channel"])
+    if handler is None:
+        return
+    try:
+        await handler(message["channel"], data)
+    except Exception as e:
+        logging.warning(f"Pub/sub handler for {message['channel']} failed: {e}")
+
+
+async def _listen() -> None:
+    backoff = 1
+    while True:
+        redis = await get_redis()
+        if redis is None:
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+            continue
+        pubsub = redis.pubsub()
+        try:
+            if _channels:
+                await pubsub.subscribe(*_channels)
+            if _patterns:
+                await pubsub.psubscribe(*_patterns)
+            backoff = 1
+            async for message in pubsub.listen():
+                if message.get("type") in ("message", "pmessage"):
+                    await _dispatch(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Pub/sub subscriber lost Redis, retrying in {backoff}s: {e}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+        finally:
+            try:
+                await pubsub.close()
+            except Exception:
+                pass
+
+
+async def start() -> None:
+    global _task
+    if _task is None and (_channels or _patterns):
+        _task = asyncio.create_task(_listen())
+
+
+async def stop() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
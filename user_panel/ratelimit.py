@@ -0,0 +1,197 @@
+"""
+Rate limiting
+=============
+``RateLimit`` instances are FastAPI dependencies. Each one limits a single
+scope of the caller:
+
+  ip     - client address. X-Forwarded-For is only believed from a peer in
+           ``TRUSTED_PROXIES`` (comma-separated addresses or CIDRs); the
+           client is then the nearest hop that isn't a trusted proxy.
+           Leave it empty when uvicorn already rewrites the client address
+           (``--proxy-headers --forwarded-allow-ips``).
+  email  - "email" (JSON) or "username" (OAuth2 form) field of the request body
+  user   - ``sub`` claim of the bearer token
+
+Limits are token buckets kept in Redis and updated atomically by a Lua script,
+so every worker and node shares them. While Redis is unavailable each process
+falls back to a local sliding-window limiter with the same capacity/period.
+"""
+
+import ipaddress
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from user_panel import metrics
+from user_panel.auth import decode_token
+from user_panel.redis_client import get_redis
+
+# KEYS[1] = bucket key; ARGV = capacity, refill rate (tokens/ms), cost
+# Returns {allowed, retry_after_ms}
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call("TIME")
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry = math.ceil((cost - tokens) / rate)
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil(capacity / rate))
+return {allowed, retry}
+"""
+
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(p.strip(), strict=False) for p in os.getenv("TRUSTED_PROXIES", "").split(",") if p.strip()
+]
+
+_script = None
+_script_client = None
+
+
+class SlidingWindowLimiter:
+    """Per-process fallback used while Redis is unreachable."""
+
+    def __init__(self) -> None:
+        # key -> (its limiter's period, hit times); limiters with different
+        # periods share the store, so each key is swept by its own period
+        self._hits: Dict[str, Tuple[float, Deque[float]]] = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def hit(self, key: str, capacity: int, period: float) -> float:
+        """Record a hit; return 0 if allowed, else seconds until a slot frees up."""
+        now = time.monotonic()
+        with self._lock:
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                self._sweep(now)
+            _, hits = self._hits.setdefault(key, (period, deque()))
+            while hits and hits[0] <= now - period:
+                hits.popleft()
+            if len(hits) >= capacity:
+                return hits[0] + period - now
+            hits.append(now)
+            return 0
+
+    def _sweep(self, now: float) -> None:
+        for key in [k for k, (period, v) in self._hits.items() if not v or v[-1] <= now - period]:
+            del self._hits[key]
+
+
+_local = SlidingWindowLimiter()
+
+
+def _trusted(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+
+def _client_ip(request: Request) -> Optional[str]:
+    peer = request.client.host if request.client else None
+    if peer is None or not _trusted(peer):
+        # Anyone can send X-Forwarded-For; only our own proxies' is worth reading
+        return peer
+    hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+    # Proxies append, so earlier hops are whatever the client claimed
+    for hop in reversed(hops):
+        if not _trusted(hop):
+            return hop
+    return hops[0] if hops else peer
+
+
+async def _body_email(request: Request) -> Optional[str]:
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            data = await request.json()
+        else:
+            data = await request.form()
+    except Exception:
+        return None
+    if not hasattr(data, "get"):
+        return None
+    value = data.get("email") or data.get("username")
+    return str(value).strip().lower() if value else None
+
+
+def _token_user(request: Request) -> Optional[str]:
+    auth = request.headers.get("authorization", "")
+    token = auth.split(" ", 1)[1] if auth.startswith("Bearer ") else request.query_params.get("token")
+    payload = decode_token(token) if token else None
+    return str(payload["sub"]) if payload else None
+
+
+async def _take_token(key: str, capacity: int, period: float) -> Optional[float]:
+    """Try the shared Redis bucket; None means Redis could not be used."""
+    global _script, _script_client
+    redis = await get_redis()
+    if redis is None:
+        return None
+    try:
+        if _script is None or _script_client is not redis:
+            _script = redis.register_script(TOKEN_BUCKET_LUA)
+            _script_client = redis
+        allowed, retry_ms = await _script(keys=[key], args=[capacity, capacity / (period * 1000), 1])
+    except Exception as e:
+        logging.warning(f"Rate limiter falling back to local window: {e}")
+        return None
+    return 0 if int(allowed) else int(retry_ms) / 1000
+
+
+class RateLimit:
+    def __init__(self, name: str, capacity: int, period: float, scope: str = "ip") -> None:
+        if scope not in ("ip", "email", "user"):
+            raise ValueError(f"Unknown rate limit scope: {scope}")
+        self.name = name
+        self.capacity = capacity
+        self.period = period
+        self.scope = scope
+
+    async def _identity(self, request: Request) -> Optional[str]:
+        if self.scope == "ip":
+            return _client_ip(request)
+        if self.scope == "email":
+            return await _body_email(request)
+        return _token_user(request)
+
+    async def __call__(self, request: Request) -> None:
+        ident = await self._identity(request)
+        if not ident:
+            return
+        key = f"ratelimit:{self.name}:{self.scope}:{ident}"
+        wait = await _take_token(key, self.capacity, self.period)
+        backend = "redis"
+        if wait is None:
+            wait = _local.hit(key, self.capacity, self.period)
+            backend = "local"
+        if wait > 0:
+            metrics.incr("ratelimit_rejected_total", limiter=self.name, scope=self.scope, backend=backend)
+            logging.info(f"Rate limited {self.name}/{self.scope} for {ident}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please slow down",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
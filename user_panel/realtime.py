@@ -0,0 +1,134 @@
+"""
+Multiplexed WebSocket
+=====================
+One authenticated socket per client for every chat room and notifications,
+instead of one socket per room plus one for notifications:
+
+    ws://<host>/ws?token=<jwt>
+
+Client frames (JSON):
+
+    {"op": "subscribe", "room_id": 5, "since": 123}    since is optional
+    {"op": "unsubscribe", "room_id": 5}
+    {"op": "send", "room_id": 5, "type": "text", "content": "hi"}
+    {"op": "ping"}
+
+``send`` takes the same fields as frames on /chat/ws/chat/{room_id}
+(text, file, typing, stop_typing). Offering the ``lms.msgpack.v1``
+subprotocol switches the socket to binary frames (see user_panel/wire.py).
+
+Server frames are tagged with their channel; ``data`` is exactly what the
+per-room and notification sockets send:
+
+    {"channel": "room:5", "data": {"event": "message", ...}}
+    {"channel": "notifications", "data": {"id": 1, "message": "...", ...}}
+    {"channel": "system", "data": {"event": "subscribed", "room_id": 5}}
+"""
+
+import json
+import os
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+
+from user_panel import wire
+from user_panel.auth import decode_token
+from user_panel.chat.manager import Connection, manager
+from user_panel.chat.rooms import rooms
+from user_panel.chat.router import handle_chat_frame, replay_frames
+from user_panel.deps import load_user
+from user_panel.notifications.manager import manager as notif_manager
+
+REALTIME_MAX_ROOMS = int(os.getenv("REALTIME_MAX_ROOMS", "100"))
+
+router = APIRouter(tags=["realtime"])
+
+
+class _NotificationSink:
+    """Lets NotificationManager deliver into a multiplexed connection's queue."""
+
+    def __init__(self, conn: Connection) -> None:
+        self.conn = conn
+
+    async def send_text(self, data: str) -> None:
+        if not self.conn.send(self.conn.frame("notifications", data)):
+            raise ConnectionError("multiplexed socket closed")
+
+
+def _system(conn: Connection, event: str, **fields) -> None:
+    message = {"event": event, **fields}
+    conn.send(conn.frame("system", json.dumps(message), message))
+
+
+async def _subscribe(conn: Connection, room_id: int, since: Optional[int]) -> None:
+    if room_id in conn.rooms:
+        _system(conn, "subscribed", room_id=room_id)
+        return
+    if len(conn.rooms) >= REALTIME_MAX_ROOMS:
+        _system(conn, "error", room_id=room_id, detail="Too many subscriptions")
+        return
+    room = await rooms.get(room_id)
+    if room is None or conn.user_id not in room.members:
+        _system(conn, "error", room_id=room_id, detail="Not a room member")
+        return
+    if since is not None:
+        # Hold live frames for this room until the missed messages are queued
+        conn.held[room_id] = []
+    manager.subscribe(conn, room_id)
+    _system(conn, "subscribed", room_id=room_id)
+    if since is not None:
+        frames, ids = await replay_frames(room_id, since)
+        conn.release(room_id, [conn.frame(f"room:{room_id}", f) for f in frames], ids)
+
+
+@router.websocket("/ws")
+async def realtime_ws(websocket: WebSocket, token: str):
+    if token.startswith("Bearer "):
+        token = token.split(" ")[1]
+
+    payload = decode_token(token)
+    if not payload:
+        await websocket.close(code=4001)
+        return
+    user_id = int(payload["sub"])
+    try:
+        await sync_to_async(load_user)(user_id)
+    except HTTPException:
+        await websocket.close(code=4001)
+        return
+
+    conn = await manager.connect_mux(websocket, user_id)
+    sink = _NotificationSink(conn)
+    notif_manager.register(sink, user_id)
+    try:
+        while True:
+            frame = await wire.receive(websocket)
+            op = frame.get("op")
+            room_id = frame.get("room_id")
+            if op == "ping":
+                _system(conn, "pong")
+                continue
+            if op not in ("subscribe", "unsubscribe", "send"):
+                _system(conn, "error", detail=f"Unknown op: {op}")
+                continue
+            if not isinstance(room_id, int):
+                _system(conn, "error", detail="room_id must be an integer")
+                continue
+
+            if op == "subscribe":
+                since = frame.get("since")
+                await _subscribe(conn, room_id, since if isinstance(since, int) else None)
+            elif op == "unsubscribe":
+                manager.unsubscribe(conn, room_id)
+                _system(conn, "unsubscribed", room_id=room_id)
+            elif room_id not in conn.rooms:
+                _system(conn, "error", room_id=room_id, detail="Not subscribed")
+            elif not await handle_chat_frame(room_id, user_id, frame):
+                manager.unsubscribe(conn, room_id)
+                _system(conn, "unsubscribed", room_id=room_id, detail="Not a room member")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await notif_manager.disconnect(sink, user_id)
+        await conn.close()
@@ -0,0 +1,129 @@
+"""
+Upload storage
+==============
+Uploads are copied to disk ``UPLOAD_CHUNK_SIZE`` bytes at a time, so memory
+per upload stays constant whatever the file size. Disk writes and hashing
+run in the threadpool, and the size limit is checked as the bytes arrive.
+Routers that accept uploads also use ``limited_body_route``. It rejects an
+oversized request body while it is still being received, before multipart
+parsing spools it to a temp file.
+
+Content is stored once per SHA-256 at ``MEDIA_ROOT/blobs/ab/cd/<sha256>``
+(``Blob``). Every upload still gets its own ``FileAttachment`` row (name,
+type, uploader) pointing at the blob. Uploading the same lecture PDF again
+costs one row and no disk.
+"""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional, Type
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+
+from lms.models import Blob, FileAttachment
+from user_panel import metrics
+
+MEDIA_ROOT = Path(settings.MEDIA_ROOT)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+BLOB_DIR = MEDIA_ROOT / "blobs"
+BLOB_URL_PREFIX = "/media/blobs/"
+_TMP_DIR = BLOB_DIR / "tmp"
+# Multipart boundaries, part headers and small form fields on top of the file itself
+_MULTIPART_OVERHEAD = 64 * 1024
+
+
+def blob_path(sha256: str) -> Path:
+    return BLOB_DIR / sha256[:2] / sha256[2:4] / sha256
+
+
+def blob_url(sha256: str) -> str:
+    return f"{BLOB_URL_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail="File too large")
+
+
+def limited_body_route(max_bytes: int) -> Type[APIRoute]:
+    """Route class rejecting request bodies over ``max_bytes`` (plus multipart overhead) with 413."""
+    limit = max_bytes + _MULTIPART_OVERHEAD
+
+    class LimitedBodyRoute(APIRoute):
+        def get_route_handler(self) -> Callable:
+            handler = super().get_route_handler()
+
+            async def limited_handler(request: Request):
+                length = request.headers.get("content-length")
+                if length is not None and length.isdigit() and int(length) > limit:
+                    raise _too_large()
+                received = 0
+                receive = request.receive
+
+                async def counting_receive():
+                    nonlocal received
+                    message = await receive()
+                    if message["type"] == "http.request":
+                        received += len(message.get("body", b""))
+                        if received > limit:
+                            raise _too_large()
+                    return message
+
+                return await handler(Request(request.scope, counting_receive))
+
+            return limited_handler
+
+    return LimitedBodyRoute
+
+
+def _write(out, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    out.write(chunk)
+
+
+def _place(tmp: str, sha256: str, size: int) -> None:
+    path = blob_path(sha256)
+    if path.exists():
+        os.remove(tmp)
+        metrics.incr("storage_dedup_hits_total")
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Atomic: concurrent uploads of the same content just replace identical bytes
+        os.replace(tmp, path)
+        metrics.incr("storage_bytes_written_total", size)
+
+
+async def save(upload: UploadFile, max_bytes: int, user_id: Optional[int] = None) -> FileAttachment:
+    """Stream ``upload`` into blob storage and record it as a FileAttachment; 413 past ``max_bytes``."""
+    await run_in_threadpool(_TMP_DIR.mkdir, parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=_TMP_DIR)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _too_large()
+                await run_in_threadpool(_write, out, digest, chunk)
+        sha256 = digest.hexdigest()
+        await run_in_threadpool(_place, tmp, sha256, size)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    await sync_to_async(Blob.objects.get_or_create)(sha256=sha256, defaults={"size": size})
+    return await sync_to_async(FileAttachment.objects.create)(
+        blob_id=sha256,
+        uploaded_by_id=user_id,
+        file_path=str(blob_path(sha256).relative_to(MEDIA_ROOT)).replace("\\", "/"),
+        file_name=(upload.filename or sha256)[:255],
+        file_type=(upload.content_type or "application/octet-stream")[:120],
+        file_size=size,
+    )
@@ -0,0 +1,123 @@
+import hashlib
+
+from django.test import TransactionTestCase
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from lms.models import Blob, ChatRoom, FileAttachment, LMSUser, Message
+from user_panel import media
+from user_panel.auth import create_access_token
+from user_panel.deps import user_cache
+from user_panel.storage import blob_path, blob_url
+
+app = FastAPI()
+app.include_router(media.router)
+
+CONTENT = b"%PDF-1.4 0123456789"
+
+
+# Serving runs the auth dependency on the threadpool, so rows must be committed
+class MediaTests(TransactionTestCase):
+    def setUp(self):
+        media._allowed.clear()
+        user_cache.clear()
+        self.client = TestClient(app)
+        self.owner = LMSUser.objects.create(email="owner@example.com", name="Owner", password_hash="!")
+        self.member = LMSUser.objects.create(email="member@example.com", name="Member", password_hash="!")
+        self.stranger = LMSUser.objects.create(email="stranger@example.com", name="Stranger", password_hash="!")
+        self.sha256 = self.upload(self.owner, CONTENT, "notes.pdf", "application/pdf")
+        self.url = blob_url(self.sha256)
+
+    def upload(self, user: LMSUser, content: bytes, name: str, content_type: str) -> str:
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = blob_path(sha256)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        blob, _ = Blob.objects.get_or_create(sha256=sha256, defaults={"size": len(content)})
+        FileAttachment.objects.create(
+            blob=blob, uploaded_by=user, file_path=str(path), file_name=name, file_type=content_type,
+            file_size=len(content),
+        )
+        return sha256
+
+    def get(self, user: LMSUser, url: str = None, **headers):
+        headers["Authorization"] = f"Bearer {create_access_token(str(user.id), user.role)}"
+        return self.client.get(url or self.url, headers=headers)
+
+
+class AuthorizationTests(MediaTests):
+    def test_uploader_reads_the_file(self):
+        r = self.get(self.owner)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.content, CONTENT)
+        self.assertEqual(r.headers["content-type"], "application/pdf")
+        self.assertEqual(r.headers["content-disposition"], "inline; filename*=UTF-8''notes.pdf")
+        self.assertEqual(r.headers["etag"], f'"{self.sha256}"')
+        self.assertEqual(r.headers["x-content-type-options"], "nosniff")
+
+    def test_token_query_parameter(self):
+        token = create_access_token(str(self.owner.id), self.owner.role)
+        self.assertEqual(self.client.get(f"{self.url}?token={token}").status_code, 200)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_others_get_the_same_404_as_for_a_missing_blob(self):
+        self.assertEqual(self.get(self.stranger).status_code, 404)
+        self.assertEqual(self.get(self.owner, blob_url("0" * 64)).status_code, 404)
+
+    def test_room_members_read_files_sent_in_the_room(self):
+        room = ChatRoom.objects.create(name="r", created_by=self.owner)
+        room.members.add(self.owner, self.member)
+        Message.objects.create(room=room, sender=self.owner, sender_username="Owner", message_type="file",
+                               file_url=self.url)
+        r = self.get(self.member)
+        self.assertEqual(r.status_code, 200)
+        # Metadata of the sender's upload
+        self.assertEqual(r.headers["content-disposition"], "inline; filename*=UTF-8''notes.pdf")
+        self.assertEqual(self.get(self.stranger).status_code, 404)
+        self.assertTrue(media.can_read(self.member.id, self.sha256))
+        self.assertFalse(media.can_read(self.stranger.id, self.sha256))
+
+    def test_scriptable_types_are_downloads(self):
+        sha256 = self.upload(self.owner, b"<script>alert(1)</script>", "page.html", "text/html; charset=utf-8")
+        r = self.get(self.owner, blob_url(sha256))
+        self.assertEqual(r.headers["content-type"], "application/octet-stream")
+        self.assertEqual(r.headers["content-disposition"], "attachment; filename*=UTF-8''page.html")
+
+
+class RangeTests(MediaTests):
+    def test_single_range(self):
+        r = self.get(self.owner, Range="bytes=2-5")
+        self.assertEqual(r.status_code, 206)
+        self.assertEqual(r.content, CONTENT[2:6])
+        self.assertEqual(r.headers["content-range"], f"bytes 2-5/{len(CONTENT)}")
+
+    def test_suffix_and_open_ended_ranges(self):
+        self.assertEqual(self.get(self.owner, Range="bytes=-3").content, CONTENT[-3:])
+        self.assertEqual(self.get(self.owner, Range="bytes=10-").content, CONTENT[10:])
+        self.assertEqual(self.get(self.owner, Range="bytes=10-9999").content, CONTENT[10:])
+
+    def test_range_past_the_end_is_a_416(self):
+        r = self.get(self.owner, Range=f"bytes={len(CONTENT)}-")
+        self.assertEqual(r.status_code, 416)
+        self.assertEqual(r.headers["content-range"], f"bytes */{len(CONTENT)}")
+
+    def test_invalid_or_stale_ranges_get_the_whole_file(self):
+        for headers in ({"Range": "bytes=5-3"}, {"Range": "bytes=0-1,4-5"}, {"Range": "bytes=0-1", "If-Range": '"other"'}):
+            r = self.get(self.owner, **headers)
+            self.assertEqual((r.status_code, r.content), (200, CONTENT), headers)
+        self.assertEqual(self.get(self.owner, Range="bytes=0-1", **{"If-Range": f'"{self.sha256}"'}).status_code, 206)
+
+
+class ConditionalTests(MediaTests):
+    def test_matching_etag_is_a_304(self):
+        for tag in (f'"{self.sha256}"', f'W/"{self.sha256}"', f'"x", "{self.sha256}"', "*"):
+            r = self.get(self.owner, **{"If-None-Match": tag})
+            self.assertEqual(r.status_code, 304, tag)
+            self.assertEqual(r.content, b"")
+            self.assertEqual(r.headers["etag"], f'"{self.sha256}"')
+
+    def test_other_etag_gets_the_file(self):
+        self.assertEqual(self.get(self.owner, **{"If-None-Match": '"stale"'}).status_code, 200)
+
+    def test_304_still_requires_access(self):
+        self.assertEqual(self.get(self.stranger, **{"If-None-Match": f'"{self.sha256}"'}).status_code, 404)
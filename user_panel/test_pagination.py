@@ -0,0 +1,103 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from django.test import SimpleTestCase, TestCase
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import Request
+
+from lms.models import LMSUser, Notification
+from user_panel.pagination import Page, decode_cursor, encode_cursor, paginate, paginate_sorted
+
+FIELDS = {"id": "id", "message": "message", "created_at": "created_at"}
+
+
+def _page(cursor=None, limit=None, fields=None) -> Page:
+    request = Request({"type": "http", "method": "GET", "path": "/notifications/", "query_string": b"",
+                       "headers": [], "server": ("testserver", 80), "scheme": "http"})
+    return Page(request, Response(), cursor=cursor, limit=limit, fields=fields)
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        ts = datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+        self.assertEqual(decode_cursor(encode_cursor(ts, 42)), (ts, 42))
+
+    def test_garbage_is_a_400(self):
+        for token in ("zzz", encode_cursor(datetime.now(timezone.utc), 1)[:-3]):
+            with self.assertRaises(HTTPException) as caught:
+                decode_cursor(token)
+            self.assertEqual(caught.exception.status_code, 400)
+
+
+class PaginateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = LMSUser.objects.create(email="pages@example.com", name="Pages", password_hash="!")
+        base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        # Pairs sharing a timestamp, so pages have to break ties by id
+        rows = Notification.objects.bulk_create(
+            Notification(user=cls.user, message=f"n{i}", created_at=base + timedelta(minutes=i // 2)) for i in range(7)
+        )
+        cls.newest_first = [n.id for n in sorted(rows, key=lambda n: (n.created_at, n.id), reverse=True)]
+
+    def qs(self):
+        return Notification.objects.filter(user=self.user)
+
+    def test_walking_the_cursor_visits_every_row_once_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            page = _page(cursor=cursor, limit=2)
+            items = paginate(self.qs(), page, ("created_at", "id"), FIELDS)
+            self.assertLessEqual(len(items), 2)
+            seen += [item["id"] for item in items]
+            cursor = page.response.headers.get("x-next-cursor")
+            if cursor is None:
+                break
+            self.assertIn(f"cursor={cursor}", page.response.headers["link"])
+        self.assertEqual(seen, self.newest_first)
+
+    def test_items_are_returned_for_the_response_model(self):
+        items = paginate(self.qs(), _page(limit=1), ("created_at", "id"), FIELDS)
+        self.assertEqual(list(items[0]), ["id", "message", "created_at"])
+        self.assertIsInstance(items[0]["created_at"], str)
+
+    def test_no_limit_and_no_cursor_returns_everything(self):
+        page = _page()
+        items = paginate(self.qs(), page, ("created_at", "id"), FIELDS)
+        self.assertEqual([item["id"] for item in items], self.newest_first)
+        self.assertNotIn("x-next-cursor", page.response.headers)
+
+    def test_cursor_without_limit_uses_the_default_page_size(self):
+        first = _page(limit=1)
+        paginate(self.qs(), first, ("created_at", "id"), FIELDS)
+        page = _page(cursor=first.response.headers["x-next-cursor"])
+        items = paginate(self.qs(), page, ("created_at", "id"), FIELDS)
+        self.assertEqual([item["id"] for item in items], self.newest_first[1:])
+
+    def test_fields_projection(self):
+        response = paginate(self.qs(), _page(limit=3, fields="id"), ("created_at", "id"), FIELDS)
+        self.assertIsInstance(response, JSONResponse)
+        self.assertEqual(json.loads(response.body), [{"id": pk} for pk in self.newest_first[:3]])
+        self.assertIn("x-next-cursor", response.headers)
+        with self.assertRaises(HTTPException):
+            paginate(self.qs(), _page(fields="id,nope"), ("created_at", "id"), FIELDS)
+
+
+class PaginateSortedTests(SimpleTestCase):
+    def test_walk_matches_the_sorted_list(self):
+        base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        cursors = sorted(((base + timedelta(seconds=i // 3), 100 + i) for i in range(8)), reverse=True)
+        keys = [(-ts.timestamp(), -pk) for ts, pk in cursors]
+        items = [{"id": pk} for _, pk in cursors]
+        raw = [f'{{"id":{pk}}}'.encode() for _, pk in cursors]
+
+        seen, cursor = [], None
+        while True:
+            page = _page(cursor=cursor, limit=3)
+            response = paginate_sorted(keys, items, raw, cursors, page)
+            seen += [item["id"] for item in json.loads(response.body)]
+            cursor = response.headers.get("x-next-cursor")
+            if cursor is None:
+                break
+        self.assertEqual(seen, [pk for _, pk in cursors])
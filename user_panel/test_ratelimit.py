@@ -0,0 +1,87 @@
+import asyncio
+import ipaddress
+from unittest import mock
+
+from django.test import SimpleTestCase
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from user_panel import ratelimit
+from user_panel.ratelimit import RateLimit, SlidingWindowLimiter
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _request(peer: str, forwarded: str = "") -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "method": "POST", "path": "/login/", "headers": headers, "client": (peer, 1234)})
+
+
+class SlidingWindowTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(ratelimit.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = SlidingWindowLimiter()
+
+    def test_capacity_then_wait_until_the_oldest_hit_leaves(self):
+        for _ in range(3):
+            self.assertEqual(self.limiter.hit("k", 3, 60), 0)
+            self.clock.now += 10
+        self.assertAlmostEqual(self.limiter.hit("k", 3, 60), 30)
+        self.clock.now += 30
+        self.assertEqual(self.limiter.hit("k", 3, 60), 0)
+
+    def test_keys_are_limited_separately(self):
+        self.assertEqual(self.limiter.hit("a", 1, 60), 0)
+        self.assertGreater(self.limiter.hit("a", 1, 60), 0)
+        self.assertEqual(self.limiter.hit("b", 1, 60), 0)
+
+    def test_sweep_keeps_windows_longer_than_the_sweeping_limiter(self):
+        self.assertEqual(self.limiter.hit("otp", 1, 3600), 0)
+        self.clock.now += 120
+        # Enough short-window hits to trigger a sweep
+        for i in range(1000):
+            self.limiter.hit(f"login:{i % 7}", 10_000, 60)
+        self.assertAlmostEqual(self.limiter.hit("otp", 1, 3600), 3480)
+
+    def test_sweep_drops_expired_windows(self):
+        self.limiter.hit("old", 1, 60)
+        self.clock.now += 61
+        for i in range(1000):
+            self.limiter.hit("busy", 10_000, 3600)
+        self.assertNotIn("old", self.limiter._hits)
+
+
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        # No Redis: the dependency falls back to the local window
+        patcher = mock.patch.object(ratelimit, "_take_token", mock.AsyncMock(return_value=None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        local = mock.patch.object(ratelimit, "_local", SlidingWindowLimiter())
+        local.start()
+        self.addCleanup(local.stop)
+
+    def test_rejects_with_retry_after(self):
+        limit = RateLimit("test", 2, 60)
+        asyncio.run(limit(_request("198.51.100.1")))
+        asyncio.run(limit(_request("198.51.100.1")))
+        with self.assertRaises(HTTPException) as caught:
+            asyncio.run(limit(_request("198.51.100.1")))
+        self.assertEqual(caught.exception.status_code, 429)
+        self.assertGreaterEqual(int(caught.exception.headers["Retry-After"]), 59)
+        asyncio.run(limit(_request("198.51.100.2")))
+
+    def test_forwarded_for_is_only_read_from_trusted_proxies(self):
+        self.assertEqual(ratelimit._client_ip(_request("198.51.100.1", "203.0.113.9")), "198.51.100.1")
+        with mock.patch.object(ratelimit, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")]):
+            request = _request("10.0.0.5", "203.0.113.7, 203.0.113.9, 10.0.0.4")
+            self.assertEqual(ratelimit._client_ip(request), "203.0.113.9")
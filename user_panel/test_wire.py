@@ -0,0 +1,92 @@
+import asyncio
+import json
+import zlib
+
+import msgpack
+from django.test import SimpleTestCase
+from fastapi import WebSocketDisconnect
+
+from user_panel import wire
+
+
+class FakeSocket:
+    def __init__(self, message: dict) -> None:
+        self.message = message
+        self.close_code = None
+
+    async def receive(self) -> dict:
+        return self.message
+
+    async def close(self, code: int = 1000) -> None:
+        self.close_code = code
+
+
+def _deflate(raw: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return b"\x01" + compressor.compress(raw) + compressor.flush()
+
+
+class EncodeDecodeTests(SimpleTestCase):
+    def test_small_frame_round_trips_uncompressed(self):
+        message = {"event": "message", "id": 7, "content": "hi", "custom": [1, {"room_id": 2}]}
+        frame = wire.encode(message)
+        self.assertEqual(frame[:1], b"\x00")
+        self.assertEqual(wire.decode(frame), message)
+
+    def test_known_keys_are_sent_as_field_ids(self):
+        payload = msgpack.unpackb(wire.encode({"event": "typing", "other": 1})[1:], strict_map_key=False)
+        self.assertEqual(payload, {wire.FIELDS.index("event"): "typing", "other": 1})
+
+    def test_large_frame_is_deflated_and_round_trips(self):
+        message = {"event": "message", "content": "x" * (wire.WIRE_COMPRESS_MIN_BYTES * 4)}
+        frame = wire.encode(message)
+        self.assertEqual(frame[:1], b"\x01")
+        self.assertLess(len(frame), wire.WIRE_COMPRESS_MIN_BYTES)
+        self.assertEqual(wire.decode(frame), message)
+
+    def test_frame_inflating_past_the_limit_is_rejected(self):
+        bomb = _deflate(msgpack.packb({"content": "a" * (wire.MAX_FRAME_BYTES * 4)}))
+        self.assertLess(len(bomb), wire.MAX_FRAME_BYTES)
+        with self.assertRaises(wire.FrameTooLarge):
+            wire.decode(bomb)
+
+    def test_frame_at_the_limit_is_accepted(self):
+        raw = msgpack.packb({"content": "a" * (wire.MAX_FRAME_BYTES - 100)})
+        self.assertEqual(wire.decode(_deflate(raw))["content"], "a" * (wire.MAX_FRAME_BYTES - 100))
+
+    def test_own_frames_decode_without_a_limit(self):
+        frame = wire.encode({"content": "a" * (wire.MAX_FRAME_BYTES * 2)})
+        self.assertEqual(len(wire.decode(frame, max_bytes=0)["content"]), wire.MAX_FRAME_BYTES * 2)
+
+    def test_unknown_flag_is_rejected(self):
+        with self.assertRaises(ValueError):
+            wire.decode(b"\x07" + msgpack.packb({}))
+
+
+class ReceiveTests(SimpleTestCase):
+    def receive(self, message: dict):
+        socket = FakeSocket(message)
+        return socket, asyncio.run(wire.receive(socket))
+
+    def test_text_and_binary_frames(self):
+        _, frame = self.receive({"type": "websocket.receive", "text": json.dumps({"type": "typing"})})
+        self.assertEqual(frame, {"type": "typing"})
+        _, frame = self.receive({"type": "websocket.receive", "bytes": wire.encode({"type": "text"})})
+        self.assertEqual(frame, {"type": "text"})
+
+    def test_disconnect_raises(self):
+        with self.assertRaises(WebSocketDisconnect) as caught:
+            self.receive({"type": "websocket.disconnect", "code": 1001})
+        self.assertEqual(caught.exception.code, 1001)
+
+    def test_oversized_frames_close_with_1009(self):
+        bomb = _deflate(msgpack.packb({"content": "a" * (wire.MAX_FRAME_BYTES * 4)}))
+        for message in (
+            {"type": "websocket.receive", "bytes": bomb},
+            {"type": "websocket.receive", "text": json.dumps({"content": "a" * wire.MAX_FRAME_BYTES})},
+        ):
+            socket = FakeSocket(message)
+            with self.assertRaises(WebSocketDisconnect) as caught:
+                asyncio.run(wire.receive(socket))
+            self.assertEqual(caught.exception.code, 1009)
+            self.assertEqual(socket.close_code, 1009)
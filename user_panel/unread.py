@@ -0,0 +1,47 @@
+"""
+Badges
+======
+``GET /badges/`` returns every unread count a client shows in one call, read
+from the Redis counters kept by lms.unread:
+
+    {"notifications": 3, "chat": 5, "rooms": {"12": 4, "31": 1}}
+
+``rooms`` lists only rooms with unread messages; ``chat`` is their total.
+The chat socket calls ``message_posted`` for every message it stores.
+"""
+
+import logging
+
+from fastapi import APIRouter, Depends
+
+from lms.models import LMSUser
+from lms.unread import POST_LUA, ROOM_FIELD, ROOM_SEQ_KEY, UNREAD_KEY, badges
+from user_panel.deps import get_current_user
+from user_panel.redis_client import get_redis
+
+router = APIRouter(tags=["badges"])
+
+_script = None
+_script_client = None
+
+
+async def message_posted(room_id: int, sender_id: int) -> None:
+    """Count a new message in ``room_id`` for everyone but its sender."""
+    global _script, _script_client
+    redis = await get_redis()
+    if not redis:
+        return
+    try:
+        if _script is None or _script_client is not redis:
+            _script = redis.register_script(POST_LUA)
+            _script_client = redis
+        await _script(keys=[ROOM_SEQ_KEY, UNREAD_KEY.format(sender_id)], args=[room_id, ROOM_FIELD.format(room_id)])
+    except Exception as e:
+        logging.warning(f"Could not count message in room {room_id}: {e}")
+
+
+@router.get("/badges/")
+def get_badges(user: LMSUser = Depends(get_current_user)):
+    notifications, rooms = badges(user.id)
+    rooms = {room_id: n for room_id, n in rooms.items() if n > 0}
+    return {"notifications": notifications, "chat": sum(rooms.values()), "rooms": rooms}
@@ -0,0 +1,125 @@
+"""
+Compact WebSocket wire format
+=============================
+Opt-in alternative to JSON text frames for the chat and multiplexed sockets.
+A client that offers the ``lms.msgpack.v1`` subprotocol in its handshake gets
+binary frames:
+
+    1 flag byte (0 = plain, 1 = raw DEFLATE) + MessagePack payload
+
+Known keys are replaced by small integer field ids (``FIELDS`` index), other
+keys and all values are sent unchanged. Clients may send their own frames as
+text JSON or in the same binary format.
+
+Frames are encoded once per broadcast and the same bytes are queued on every
+socket (see ConnectionManager.deliver_local). With ``WIRE_COMPRESSION=deflate``
+payloads of at least ``WIRE_COMPRESS_MIN_BYTES`` are compressed once too,
+rather than per socket as permessage-deflate does; binary clients shouldn't
+also negotiate permessage-deflate.
+
+Client frames, text or binary, are limited to ``WIRE_MAX_FRAME_BYTES`` after
+decompression; a larger one closes the socket with 1009 (message too big).
+
+Without the ``msgpack`` package the subprotocol is simply not offered.
+"""
+
+import json
+import os
+import zlib
+from typing import Any, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+SUBPROTOCOL = "lms.msgpack.v1"
+WIRE_COMPRESSION = os.getenv("WIRE_COMPRESSION", "deflate")  # none | deflate
+WIRE_COMPRESS_MIN_BYTES = int(os.getenv("WIRE_COMPRESS_MIN_BYTES", "512"))
+MAX_FRAME_BYTES = int(os.getenv("WIRE_MAX_FRAME_BYTES", "65536"))
+
+# Field ids are positions in this tuple: only ever append
+FIELDS = (
+    "event", "id", "room_id", "sender_id", "sender_username", "content",
+    "message_type", "file_url", "file_name", "file_type", "timestamp",
+    "user_id", "channel", "data", "message", "link", "is_read", "created_at",
+    "after_id", "detail", "op", "type", "since", "user_ids", "thumbnail_url",
+)
+_IDS = {name: i for i, name in enumerate(FIELDS)}
+
+_PLAIN = b"\x00"
+_DEFLATE = b"\x01"
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+def negotiate(websocket: WebSocket) -> Optional[str]:
+    """Return the subprotocol to accept, or None for plain JSON."""
+    if msgpack is not None and SUBPROTOCOL in websocket.scope.get("subprotocols", ()):
+        return SUBPROTOCOL
+    return None
+
+
+def _compact(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {_IDS.get(k, k): _compact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_compact(v) for v in value]
+    return value
+
+
+def _expand(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {FIELDS[k] if isinstance(k, int) and k < len(FIELDS) else k: _expand(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_expand(v) for v in value]
+    return value
+
+
+def encode(message: dict) -> bytes:
+    raw = msgpack.packb(_compact(message), use_bin_type=True)
+    if WIRE_COMPRESSION == "deflate" and len(raw) >= WIRE_COMPRESS_MIN_BYTES:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        return _DEFLATE + compressor.compress(raw) + compressor.flush()
+    return _PLAIN + raw
+
+
+def decode(frame: bytes, max_bytes: int = MAX_FRAME_BYTES) -> dict:
+    """Decode a binary frame; ``max_bytes=0`` lifts the size limit (for our own frames)."""
+    if msgpack is None:
+        raise ValueError("Binary frames need the msgpack package")
+    flag, payload = frame[:1], frame[1:]
+    if max_bytes and len(payload) > max_bytes:
+        raise FrameTooLarge(len(payload))
+    if flag == _DEFLATE:
+        # Bounded output: a small compressed frame can expand to gigabytes
+        decompressor = zlib.decompressobj(-15)
+        payload = decompressor.decompress(payload, max_bytes)
+        if decompressor.unconsumed_tail:
+            raise FrameTooLarge(len(frame))
+    elif flag != _PLAIN:
+        raise ValueError("Unknown frame flag")
+    return _expand(msgpack.unpackb(payload, raw=False, strict_map_key=False))
+
+
+async def receive(websocket: WebSocket) -> dict:
+    """Next client frame as a dict, whether it was sent as JSON text or binary.
+
+    An oversized frame closes the socket with 1009 and raises WebSocketDisconnect.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    try:
+        if message.get("bytes") is not None:
+            return decode(message["bytes"])
+        if len(message["text"]) > MAX_FRAME_BYTES:
+            raise FrameTooLarge(len(message["text"]))
+        return json.loads(message["text"])
+    except FrameTooLarge:
+        await websocket.close(code=1009)
+        raise WebSocketDisconnect(1009)